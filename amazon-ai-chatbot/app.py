@@ -3,17 +3,40 @@ AI-Powered Amazon Customer Segmentation Assistant
 A fully offline, free-forever chatbot using local LLMs for customer analytics
 """
 
+import time
+import uuid
 import streamlit as st
 import pandas as pd
 import numpy as np
 from datetime import datetime
-import plotly.express as px
-import plotly.graph_objects as go
 from chatbot_controller import ChatbotController
 from business_logic import BusinessLogic
+from conversation_store import CONVERSATION_DB_PATH, is_valid_session_id
+from dashboard_charts import build_dashboard_figures
 import warnings
 warnings.filterwarnings('ignore')
 
+# Chat history is read from the conversation log a page at a time, up to MAX_CHAT_MESSAGES.
+# Only the latest CHAT_WINDOW_SIZE messages are always shown; older ones are loaded and
+# rendered only while the archive is expanded.
+CHAT_WINDOW_SIZE = 10
+CHAT_PAGE_SIZE = 20
+MAX_CHAT_MESSAGES = 200
+
+# The sidebar's model status and telemetry refresh on their own; chat answers only rerun the chat
+STATUS_REFRESH_SECONDS = 5
+
+WELCOME_MESSAGE = """👋 Hello! I'm your AI Customer Segmentation Assistant. 
+
+I can help you with:
+• **Segment Analysis**: "Which segment is most profitable?"
+• **Customer Behavior**: "Why does Segment 2 have low churn risk?"
+• **Marketing Strategy**: "Suggest campaigns for high-value customers"
+• **Comparative Analysis**: "Compare Segment 1 vs Segment 3"
+• **Business Insights**: "How to increase customer lifetime value?"
+
+What would you like to know about your customers?"""
+
 # Page configuration
 st.set_page_config(
     page_title="AI Customer Segmentation Assistant",
@@ -73,10 +96,73 @@ def load_data():
         st.error("❌ customer_segments.csv not found. Please ensure the file exists.")
         return None
 
+@st.cache_resource
+def load_business_logic(df):
+    """Build and cache the business logic for a dataset"""
+    return BusinessLogic(df)
+
+@st.cache_resource(max_entries=4)
+def load_dashboard_figures(data_version, _business_logic):
+    """Build the dashboard charts once per data version"""
+    return build_dashboard_figures(_business_logic)
+
 @st.cache_resource
 def initialize_chatbot():
-    """Initialize and cache the chatbot controller"""
-    return ChatbotController()
+    """Initialize and cache the chatbot controller, loading the model in the background"""
+    chatbot_controller = ChatbotController(conversation_db_path=CONVERSATION_DB_PATH)
+    chatbot_controller.llm_loader.start_background_load()
+    return chatbot_controller
+
+def display_model_status(chatbot_controller):
+    """Display model loading progress in the sidebar"""
+    status = chatbot_controller.llm_loader.get_load_status()
+    
+    if status['state'] == 'loading':
+        st.progress(status['progress'], text=f"🧠 {status['message']}...")
+        st.caption("Answers use built-in analytics templates until the model is ready.")
+    elif status['state'] == 'failed':
+        st.warning(f"⚠️ LLM unavailable: {status['error']}")
+        st.caption("Answers use built-in analytics templates. See README.md for model setup.")
+    
+    metrics = chatbot_controller.get_response_metrics()
+    if metrics['requests']:
+        outcomes = metrics['outcomes']
+        timed_out = outcomes.get('partial', 0) + outcomes.get('deadline_fallback', 0)
+        st.caption(
+            f"⏱️ Response p50 {metrics['p50_seconds']:.1f}s · p95 {metrics['p95_seconds']:.1f}s · "
+            f"{timed_out} timed out · {outcomes.get('cancelled', 0)} cancelled"
+        )
+
+def display_inference_telemetry(chatbot_controller):
+    """Display rolling LLM latency percentiles in the sidebar"""
+    telemetry = chatbot_controller.llm_loader.get_telemetry(recent=0)
+    if not telemetry['requests']:
+        return
+    
+    metrics = telemetry['metrics']
+    rows = [
+        ("Time to first token", 'ttft_seconds', "{:.2f}s"),
+        ("Prompt eval", 'prompt_eval_seconds', "{:.2f}s"),
+        ("Queue wait", 'queue_wait_seconds', "{:.2f}s"),
+        ("Generation", 'generation_tokens_per_sec', "{:.1f} tok/s"),
+        ("Prompt tokens", 'prompt_tokens', "{:.0f}"),
+        ("Generated tokens", 'generated_tokens', "{:.0f}"),
+    ]
+    with st.expander(f"📈 LLM Telemetry ({telemetry['requests']} requests)"):
+        table = pd.DataFrame(
+            [(label, fmt.format(metrics[key]['p50']), fmt.format(metrics[key]['p95']))
+             for label, key, fmt in rows if key in metrics],
+            columns=["Metric", "p50", "p95"]
+        )
+        st.dataframe(table, hide_index=True, use_container_width=True)
+        st.caption(f"KV cache reuse: {telemetry['prompt_cache_hit_rate']:.0%} of prompt tokens "
+                   f"({telemetry['cache_hits']} cache hits)")
+
+@st.fragment(run_every=STATUS_REFRESH_SECONDS)
+def display_live_status(chatbot_controller):
+    """Model status and latency telemetry, refreshed independently of the rest of the page"""
+    display_model_status(chatbot_controller)
+    display_inference_telemetry(chatbot_controller)
 
 def display_header():
     """Display the main application header"""
@@ -88,9 +174,10 @@ def display_header():
     </div>
     """, unsafe_allow_html=True)
 
+@st.fragment
 def display_sidebar_metrics(df, business_logic):
     """Display key metrics in the sidebar"""
-    st.sidebar.markdown("## 📊 Key Metrics")
+    st.markdown("## 📊 Key Metrics")
     
     if df is not None:
         total_customers = len(df)
@@ -98,31 +185,28 @@ def display_sidebar_metrics(df, business_logic):
         avg_frequency = df['Frequency'].mean()
         avg_recency = df['Recency'].mean()
         
-        # Segment distribution
-        segment_counts = df['Cluster'].value_counts().sort_index()
-        
-        st.sidebar.markdown(f"""
+        st.markdown(f"""
         <div class="sidebar-metric">
             <h4>👥 Total Customers</h4>
             <h2>{total_customers:,}</h2>
         </div>
         """, unsafe_allow_html=True)
         
-        st.sidebar.markdown(f"""
+        st.markdown(f"""
         <div class="sidebar-metric">
             <h4>💰 Total Revenue</h4>
             <h2>${total_revenue:,.2f}</h2>
         </div>
         """, unsafe_allow_html=True)
         
-        st.sidebar.markdown(f"""
+        st.markdown(f"""
         <div class="sidebar-metric">
             <h4>🔄 Avg Frequency</h4>
             <h2>{avg_frequency:.1f}</h2>
         </div>
         """, unsafe_allow_html=True)
         
-        st.sidebar.markdown(f"""
+        st.markdown(f"""
         <div class="sidebar-metric">
             <h4>📅 Avg Recency</h4>
             <h2>{avg_recency:.0f} days</h2>
@@ -130,131 +214,125 @@ def display_sidebar_metrics(df, business_logic):
         """, unsafe_allow_html=True)
         
         # Segment distribution chart
-        st.sidebar.markdown("### 🎯 Segment Distribution")
-        fig = px.pie(
-            values=segment_counts.values,
-            names=[f"Segment {i}" for i in segment_counts.index],
-            title="Customer Segments"
-        )
-        fig.update_layout(height=300)
-        st.sidebar.plotly_chart(fig, use_container_width=True)
+        st.markdown("### 🎯 Segment Distribution")
+        figures = load_dashboard_figures(business_logic.data_version, business_logic)
+        st.plotly_chart(figures['segment_pie'], use_container_width=True)
 
+@st.fragment
 def display_analytics_dashboard(df, business_logic):
     """Display analytics dashboard"""
     if df is None:
         return
         
     st.markdown("## 📈 Customer Segmentation Analytics")
+    figures = load_dashboard_figures(business_logic.data_version, business_logic)
     
     col1, col2 = st.columns(2)
     
     with col1:
         # RFM Analysis
         st.markdown("### 🎯 RFM Analysis by Segment")
-        segment_summary = business_logic.get_segment_summary()
-        
-        fig = go.Figure()
-        segments = list(segment_summary.keys())
-        
-        fig.add_trace(go.Scatter(
-            x=[segment_summary[s]['avg_recency'] for s in segments],
-            y=[segment_summary[s]['avg_monetary'] for s in segments],
-            mode='markers+text',
-            marker=dict(
-                size=[segment_summary[s]['avg_frequency']*5 for s in segments],
-                color=segments,
-                colorscale='viridis',
-                showscale=True
-            ),
-            text=[f"Segment {s}" for s in segments],
-            textposition="middle center",
-            name="Segments"
-        ))
-        
-        fig.update_layout(
-            title="RFM Bubble Chart (Size = Frequency)",
-            xaxis_title="Recency (Days)",
-            yaxis_title="Monetary Value ($)",
-            height=400
-        )
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(figures['rfm_bubble'], use_container_width=True)
     
     with col2:
-        # Customer Value Distribution
+        # Customer Value Distribution (quartiles per segment, not every customer)
         st.markdown("### 💎 Customer Value Distribution")
-        
-        fig = px.box(
-            df, 
-            x='Cluster', 
-            y='Monetary',
-            title="Monetary Value by Segment",
-            labels={'Cluster': 'Segment', 'Monetary': 'Monetary Value ($)'}
-        )
-        fig.update_layout(height=400)
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(figures['monetary_box'], use_container_width=True)
 
+def render_chat_message(role, content, timestamp):
+    """Render one chat bubble"""
+    css_class = "user-message" if role == "user" else "assistant-message"
+    role_icon = "👤" if role == "user" else "🤖"
+    
+    st.markdown(f"""
+    <div class="chat-message {css_class}">
+        <strong>{role_icon} {role.title()}</strong>
+        <br>{content}
+        <br><small>🕒 {timestamp.strftime("%H:%M:%S")}</small>
+    </div>
+    """, unsafe_allow_html=True)
+
+def render_logged_message(message):
+    """Render a message from the conversation log"""
+    render_chat_message(message["role"], message["content"], message["timestamp"])
+
+def load_chat_history(chatbot_controller, limit):
+    """Load the latest messages of this session's conversation log into st.session_state.messages"""
+    store = chatbot_controller.conversation_store
+    # One extra row tells whether older messages exist without counting the whole log
+    messages = store.get_messages(st.session_state.session_id, limit=limit + 1)
+    st.session_state.has_older_messages = len(messages) > limit
+    st.session_state.messages = messages[-limit:]
+
+@st.fragment
 def display_chat_interface(chatbot_controller):
     """Display the chat interface"""
     st.markdown("## 💬 AI Assistant Chat")
     st.markdown("Ask me anything about your customer segments! I'll provide data-driven insights and recommendations.")
     
-    # Initialize chat history
-    if "messages" not in st.session_state:
-        st.session_state.messages = []
-        # Add welcome message
-        welcome_msg = """👋 Hello! I'm your AI Customer Segmentation Assistant. 
-
-I can help you with:
-• **Segment Analysis**: "Which segment is most profitable?"
-• **Customer Behavior**: "Why does Segment 2 have low churn risk?"
-• **Marketing Strategy**: "Suggest campaigns for high-value customers"
-• **Comparative Analysis**: "Compare Segment 1 vs Segment 3"
-• **Business Insights**: "How to increase customer lifetime value?"
-
-What would you like to know about your customers?"""
-        
-        st.session_state.messages.append({
-            "role": "assistant", 
-            "content": welcome_msg,
-            "timestamp": datetime.now()
-        })
+    # Identify this conversation; the ID is kept in the URL so a reload or restart resumes it
+    # from the log. Only well-formed IDs (32 hex characters) are accepted, anything else starts
+    # a new conversation.
+    if "session_id" not in st.session_state:
+        requested = st.query_params.get("session")
+        st.session_state.session_id = requested if is_valid_session_id(requested) else uuid.uuid4().hex
+        st.query_params["session"] = st.session_state.session_id
+    if "history_limit" not in st.session_state:
+        st.session_state.history_limit = CHAT_WINDOW_SIZE + CHAT_PAGE_SIZE
     
-    # Display chat history
-    for message in st.session_state.messages:
-        css_class = "user-message" if message["role"] == "user" else "assistant-message"
-        role_icon = "👤" if message["role"] == "user" else "🤖"
-        
-        st.markdown(f"""
-        <div class="chat-message {css_class}">
-            <strong>{role_icon} {message["role"].title()}</strong>
-            <br>{message["content"]}
-            <br><small>🕒 {message["timestamp"].strftime("%H:%M:%S")}</small>
-        </div>
-        """, unsafe_allow_html=True)
+    # Collapsed, only the recent window is read from the log and rendered
+    show_archive = st.session_state.get("show_chat_archive", False)
+    load_chat_history(chatbot_controller, st.session_state.history_limit if show_archive else CHAT_WINDOW_SIZE)
+    messages = st.session_state.messages
+    archived, recent = messages[:-CHAT_WINDOW_SIZE], messages[-CHAT_WINDOW_SIZE:]
+    
+    # Older messages stay in the log until the archive is expanded
+    if archived or st.session_state.has_older_messages:
+        if st.toggle("🗂️ Show earlier messages", key="show_chat_archive"):
+            if st.session_state.has_older_messages:
+                if st.session_state.history_limit < MAX_CHAT_MESSAGES:
+                    if st.button("⬆️ Load older messages", key="load_older_messages"):
+                        st.session_state.history_limit = min(st.session_state.history_limit + CHAT_PAGE_SIZE,
+                                                             MAX_CHAT_MESSAGES)
+                        st.rerun(scope="fragment")
+                else:
+                    st.caption(f"Showing the latest {MAX_CHAT_MESSAGES} messages")
+            for message in archived:
+                render_logged_message(message)
+            st.divider()
     
-    # Chat input
-    if prompt := st.chat_input("Ask me about your customer segments..."):
-        # Add user message
-        st.session_state.messages.append({
-            "role": "user", 
-            "content": prompt,
-            "timestamp": datetime.now()
-        })
+    # Display the recent messages
+    if not messages:
+        render_chat_message("assistant", WELCOME_MESSAGE, datetime.now())
+    for message in recent:
+        render_logged_message(message)
+    
+    # Chat input (or an example question picked in the other tab)
+    prompt = st.chat_input("Ask me about your customer segments...") or st.session_state.pop("pending_prompt", None)
+    if prompt:
+        render_chat_message("user", prompt, datetime.now())
         
         # Get AI response
         with st.spinner("🧠 AI is analyzing your data..."):
             try:
-                response = chatbot_controller.get_response(prompt, st.session_state.messages)
+                # Stream the answer; a rerun (new message) or closed tab stops generation here
+                placeholder = st.empty()
+                last_update = [0.0]
                 
-                # Add assistant response
-                st.session_state.messages.append({
-                    "role": "assistant", 
-                    "content": response,
-                    "timestamp": datetime.now()
-                })
+                def show_partial(text):
+                    if time.monotonic() - last_update[0] >= 0.25:
+                        last_update[0] = time.monotonic()
+                        placeholder.markdown(f"🤖 {text}▌")
                 
-                # Rerun to display new messages
-                st.rerun()
+                # The exchange is logged by the controller; history comes from the session's log
+                chatbot_controller.get_response(
+                    prompt,
+                    session_id=st.session_state.session_id,
+                    on_text=show_partial
+                )
+                
+                # Rerun only the chat to display new messages
+                st.rerun(scope="fragment")
                 
             except Exception as e:
                 st.error(f"❌ Error generating response: {str(e)}")
@@ -279,12 +357,8 @@ def display_example_questions():
     for i, example in enumerate(examples):
         with cols[i % 2]:
             if st.button(f"💬 {example}", key=f"example_{i}"):
-                # Add to chat
-                st.session_state.messages.append({
-                    "role": "user", 
-                    "content": example,
-                    "timestamp": datetime.now()
-                })
+                # Ask it in the chat (a full rerun, since the chat is another fragment)
+                st.session_state.pending_prompt = example
                 st.rerun()
 
 def main():
@@ -297,13 +371,16 @@ def main():
     if df is None:
         st.stop()
     
-    # Initialize business logic and chatbot
-    business_logic = BusinessLogic(df)
+    # Initialize business logic and chatbot (cached; reconnected only when the data changes)
+    business_logic = load_business_logic(df)
     chatbot_controller = initialize_chatbot()
-    chatbot_controller.set_business_logic(business_logic)
+    if chatbot_controller.business_logic is not business_logic:
+        chatbot_controller.set_business_logic(business_logic)
     
-    # Display sidebar metrics
-    display_sidebar_metrics(df, business_logic)
+    # Sidebar: live model status and telemetry, then the key metrics
+    with st.sidebar:
+        display_live_status(chatbot_controller)
+        display_sidebar_metrics(df, business_logic)
     
     # Main content tabs
     tab1, tab2, tab3 = st.tabs(["💬 AI Chat", "📊 Analytics Dashboard", "💡 Example Questions"])
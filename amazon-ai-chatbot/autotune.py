@@ -0,0 +1,344 @@
+"""
+CPU Auto-Tuning for the Local LLM
+Detects CPU topology, benchmarks thread/batch settings and persists the best config per host and model
+"""
+
+import os
+import sys
+import json
+import glob
+import time
+import socket
+import logging
+import platform
+import subprocess
+from typing import Callable, Dict, List, Any, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TUNING_CACHE_PATH = os.path.expanduser("~/.cache/amazon-ai-chatbot/autotune.json")
+
+# Fixed calibration workload so results are comparable across runs. The prompt
+# is padded with segment rows to a typical chat prompt, which is longer than the
+# largest n_batch candidate, so prompt evaluation runs in several batches.
+CALIBRATION_INSTRUCTION = "[INST] You are a business analyst. Customer segments:\n"
+CALIBRATION_QUESTION = "Which segment is most profitable and why? [/INST]"
+CALIBRATION_MAX_TOKENS = 32
+
+# Typical chat request used to rank configurations by end-to-end latency
+TYPICAL_PROMPT_TOKENS = 1200
+TYPICAL_GENERATED_TOKENS = 300
+
+
+def calibration_prompt(count_tokens: Callable[[str], int], min_tokens: int = TYPICAL_PROMPT_TOKENS) -> str:
+    """
+    Build the calibration prompt, adding segment rows until it reaches min_tokens
+
+    Args:
+        count_tokens: Token counter of the model being calibrated
+        min_tokens: Minimum prompt length in tokens
+
+    Returns:
+        Deterministic prompt of at least min_tokens tokens
+    """
+    rows = []
+    while True:
+        prompt = CALIBRATION_INSTRUCTION + ''.join(rows) + CALIBRATION_QUESTION
+        if count_tokens(prompt) >= min_tokens:
+            return prompt
+        segment = len(rows)
+        rows.append(f"Segment {segment}: {20 + segment * 7 % 31} customers, "
+                    f"${(segment * 7919 % 50000) + 1000:,}.{segment * 37 % 100:02d} revenue, "
+                    f"{1 + segment * 3 % 9} purchases on average, last purchase {segment * 13 % 120} days ago.\n")
+
+
+def _parse_cache_size(value: str) -> int:
+    """Parse a cache size such as '32K' or '8192 KB' into bytes"""
+    value = value.strip().upper().replace('B', '').replace(' ', '')
+    multipliers = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    if value and value[-1] in multipliers:
+        return int(float(value[:-1]) * multipliers[value[-1]])
+    return int(value) if value.isdigit() else 0
+
+
+def detect_cpu_topology() -> Dict[str, Any]:
+    """
+    Detect physical/logical core counts and cache sizes
+
+    Returns:
+        Dictionary with logical_cores, physical_cores and cache sizes in bytes
+    """
+    logical_cores = os.cpu_count() or 1
+    topology = {
+        'logical_cores': logical_cores,
+        'physical_cores': logical_cores,
+        'l1d_cache': 0,
+        'l2_cache': 0,
+        'l3_cache': 0,
+    }
+
+    system = platform.system().lower()
+
+    if system == 'linux':
+        # Unique (physical id, core id) pairs are physical cores
+        try:
+            cores = set()
+            physical_id = core_id = None
+            with open('/proc/cpuinfo') as f:
+                for line in f:
+                    if line.startswith('physical id'):
+                        physical_id = line.split(':')[1].strip()
+                    elif line.startswith('core id'):
+                        core_id = line.split(':')[1].strip()
+                    elif not line.strip():
+                        if core_id is not None:
+                            cores.add((physical_id, core_id))
+                        physical_id = core_id = None
+            if core_id is not None:
+                cores.add((physical_id, core_id))
+            if cores:
+                topology['physical_cores'] = len(cores)
+        except OSError:
+            pass
+
+        for index_dir in glob.glob('/sys/devices/system/cpu/cpu0/cache/index*'):
+            try:
+                with open(os.path.join(index_dir, 'level')) as f:
+                    level = f.read().strip()
+                with open(os.path.join(index_dir, 'type')) as f:
+                    cache_type = f.read().strip()
+                with open(os.path.join(index_dir, 'size')) as f:
+                    size = _parse_cache_size(f.read())
+            except OSError:
+                continue
+            if level == '1' and cache_type == 'Data':
+                topology['l1d_cache'] = size
+            elif level in ('2', '3'):
+                topology[f'l{level}_cache'] = size
+
+    elif system == 'darwin':
+        sysctl_keys = {
+            'physical_cores': 'hw.physicalcpu',
+            'l1d_cache': 'hw.l1dcachesize',
+            'l2_cache': 'hw.l2cachesize',
+            'l3_cache': 'hw.l3cachesize',
+        }
+        for key, sysctl_name in sysctl_keys.items():
+            try:
+                output = subprocess.check_output(['sysctl', '-n', sysctl_name], stderr=subprocess.DEVNULL)
+                topology[key] = int(output.strip())
+            except (OSError, subprocess.CalledProcessError, ValueError):
+                continue
+
+    topology['physical_cores'] = max(1, min(topology['physical_cores'], logical_cores))
+    return topology
+
+
+def candidate_grid(topology: Dict[str, Any]) -> List[Dict[str, int]]:
+    """
+    Build the thread/batch grid to calibrate for this CPU
+
+    Thread counts centre on the physical core count (llama.cpp generation is
+    memory-bound, so SMT siblings rarely help). Larger batches are only tried
+    when the last-level cache is big enough to benefit from them.
+
+    Args:
+        topology: Output of detect_cpu_topology()
+
+    Returns:
+        List of {'n_threads', 'n_batch'} candidates
+    """
+    physical = topology['physical_cores']
+    logical = topology['logical_cores']
+    thread_counts = sorted({max(1, physical // 2), max(1, physical - 1), physical, logical})
+
+    last_level_cache = topology['l3_cache'] or topology['l2_cache']
+    batch_sizes = [128, 256, 512]
+    if last_level_cache >= 16 * 1024 ** 2:
+        batch_sizes.append(1024)
+
+    return [{'n_threads': t, 'n_batch': b} for t in thread_counts for b in batch_sizes]
+
+
+def _tuning_key(model_path: str) -> str:
+    """Key tuned configs by host and model file identity"""
+    try:
+        size = os.path.getsize(model_path)
+    except OSError:
+        size = 0
+    return f"{socket.gethostname()}|{os.path.abspath(model_path)}|{size}"
+
+
+def load_tuned_config(model_path: str, cache_path: str = TUNING_CACHE_PATH) -> Optional[Dict[str, Any]]:
+    """
+    Load the persisted best config for this host and model
+
+    Args:
+        model_path: Path to the GGUF model file
+        cache_path: Location of the tuning cache
+
+    Returns:
+        Tuned config entry, or None if this host/model has not been tuned
+    """
+    try:
+        with open(cache_path) as f:
+            return json.load(f).get(_tuning_key(model_path))
+    except (OSError, ValueError):
+        return None
+
+
+def save_tuned_config(model_path: str, entry: Dict[str, Any], cache_path: str = TUNING_CACHE_PATH):
+    """
+    Persist the best config for this host and model
+
+    Args:
+        model_path: Path to the GGUF model file
+        entry: Tuned config entry
+        cache_path: Location of the tuning cache
+    """
+    try:
+        with open(cache_path) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+
+    cache[_tuning_key(model_path)] = entry
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp_path, cache_path)
+
+
+def measure_config(model_path: str, llama_kwargs: Dict[str, Any]) -> Dict[str, float]:
+    """
+    Run the calibration generation with one configuration
+
+    Time to the first streamed token covers prompt evaluation; the rest of
+    the stream is generation.
+
+    Args:
+        model_path: Path to the GGUF model file
+        llama_kwargs: Keyword arguments for the Llama constructor
+
+    Returns:
+        Dictionary with prompt and generation throughput
+    """
+    from llama_cpp import Llama
+
+    llm = Llama(model_path=model_path, **llama_kwargs)
+    try:
+        prompt = calibration_prompt(lambda text: len(llm.tokenize(text.encode('utf-8'))))
+        prompt_tokens = len(llm.tokenize(prompt.encode('utf-8')))
+
+        start = time.perf_counter()
+        first_token_time = None
+        generated = 0
+        for _ in llm(prompt, max_tokens=CALIBRATION_MAX_TOKENS, temperature=0.0, stream=True):
+            if first_token_time is None:
+                first_token_time = time.perf_counter()
+            generated += 1
+        end = time.perf_counter()
+    finally:
+        del llm
+
+    first_token_time = first_token_time or end
+    prompt_seconds = max(first_token_time - start, 1e-6)
+    generation_seconds = max(end - first_token_time, 1e-6)
+
+    return {
+        'prompt_tokens_per_sec': prompt_tokens / prompt_seconds,
+        'generation_tokens_per_sec': max(generated - 1, 0) / generation_seconds,
+    }
+
+
+def estimated_latency(result: Dict[str, float]) -> float:
+    """Seconds a typical chat request would take with the measured throughput"""
+    if result['prompt_tokens_per_sec'] <= 0 or result['generation_tokens_per_sec'] <= 0:
+        return float('inf')
+    return (TYPICAL_PROMPT_TOKENS / result['prompt_tokens_per_sec'] +
+            TYPICAL_GENERATED_TOKENS / result['generation_tokens_per_sec'])
+
+
+def auto_tune(model_path: str, base_kwargs: Dict[str, Any], cache_path: str = TUNING_CACHE_PATH) -> Optional[Dict[str, Any]]:
+    """
+    Calibrate every grid candidate and persist the fastest
+
+    Args:
+        model_path: Path to the GGUF model file
+        base_kwargs: Llama constructor arguments shared by all candidates
+        cache_path: Location of the tuning cache
+
+    Returns:
+        Tuned config entry, or None if no candidate could run
+    """
+    topology = detect_cpu_topology()
+    grid = candidate_grid(topology)
+    logger.info(f"Auto-tuning {len(grid)} configurations on {topology['physical_cores']} physical cores")
+
+    results = []
+    for candidate in grid:
+        kwargs = dict(base_kwargs, **candidate)
+        try:
+            result = measure_config(model_path, kwargs)
+        except Exception as e:
+            logger.warning(f"⚠️ Calibration failed for {candidate}: {str(e)}")
+            continue
+        result.update(candidate)
+        result['estimated_latency'] = estimated_latency(result)
+        results.append(result)
+        logger.info(
+            f"threads={candidate['n_threads']:>3} batch={candidate['n_batch']:>4} → "
+            f"prompt {result['prompt_tokens_per_sec']:.1f} tok/s, "
+            f"generation {result['generation_tokens_per_sec']:.1f} tok/s"
+        )
+
+    if not results:
+        return None
+
+    best = min(results, key=lambda r: r['estimated_latency'])
+    entry = {
+        'n_threads': best['n_threads'],
+        'n_batch': best['n_batch'],
+        'prompt_tokens_per_sec': round(best['prompt_tokens_per_sec'], 2),
+        'generation_tokens_per_sec': round(best['generation_tokens_per_sec'], 2),
+        'topology': topology,
+        'tuned_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+    save_tuned_config(model_path, entry, cache_path)
+    logger.info(f"✅ Best config: threads={entry['n_threads']}, batch={entry['n_batch']}")
+    return entry
+
+
+def main():
+    """Command-line entry point: python autotune.py [model_path]"""
+    from llm_loader import LLMLoader
+
+    loader = LLMLoader(sys.argv[1] if len(sys.argv) > 1 else None)
+    print("🖥️  CPU topology:")
+    for key, value in detect_cpu_topology().items():
+        print(f"   • {key}: {value}")
+
+    if not os.path.exists(loader.model_path):
+        print(f"❌ Model file not found: {loader.model_path}")
+        return False
+
+    entry = loader.auto_tune()
+    if entry is None:
+        print("❌ Auto-tuning failed")
+        return False
+
+    print(f"\n✅ Tuned config saved to {TUNING_CACHE_PATH}")
+    print(f"   • n_threads: {entry['n_threads']}")
+    print(f"   • n_batch: {entry['n_batch']}")
+    print(f"   • Prompt eval: {entry['prompt_tokens_per_sec']} tok/s")
+    print(f"   • Generation: {entry['generation_tokens_per_sec']} tok/s")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,584 @@
+"""
+Benchmark Harness for the Chatbot
+Measures latency, throughput, memory and answer accuracy against BusinessLogic ground truth
+
+Usage:
+    python benchmark.py models [--max-tokens N] [--segments N]
+    python benchmark.py intents [--model PATH] [--repeats N]
+    python benchmark.py matcher [--queries N]
+    python benchmark.py classifier [--queries N]
+    python benchmark.py concurrency [--requests N] [--concurrency N] [--model PATH]
+    python benchmark.py retrieval [--segments N [N ...]] [--model PATH]
+    python benchmark.py charts [--rows N [N ...]]
+"""
+
+import re
+import sys
+import time
+import queue
+import random
+import asyncio
+import argparse
+import multiprocessing as mp
+from typing import List, Dict, Any
+
+import pandas as pd
+
+from model_variants import discover_model_variants, save_benchmark_results, BENCHMARK_RESULTS_PATH
+
+NUMBER_PATTERN = re.compile(r'-?\d[\d,]*(?:\.\d+)?')
+
+# Relative tolerance for a number in an answer to count as the ground-truth value
+ACCURACY_TOLERANCE = 0.01
+
+
+def build_question_set(business_logic, max_segments: int = 3) -> List[Dict[str, Any]]:
+    """
+    Fixed business questions with their ground-truth numbers
+
+    Args:
+        business_logic: BusinessLogic instance with the customer data
+        max_segments: Number of segments to ask per-segment questions about
+
+    Returns:
+        List of cases with 'question' and 'expected' numbers
+    """
+    summary = business_logic.get_segment_summary()
+    cases = []
+    for segment_id in sorted(summary)[:max_segments]:
+        data = summary[segment_id]
+        cases.append({'question': f"What is the total revenue of segment {segment_id}?",
+                      'expected': [data['total_revenue']]})
+        cases.append({'question': f"How many customers are in segment {segment_id}?",
+                      'expected': [data['customer_count']]})
+        cases.append({'question': f"What is the average recency of segment {segment_id}?",
+                      'expected': [data['avg_recency']]})
+
+    best_id, best_data = business_logic.get_most_profitable_segment()
+    cases.append({'question': "Which segment is most profitable and what is its revenue?",
+                  'expected': [best_id, best_data['total_revenue']]})
+    return cases
+
+
+def score_answer(answer: str, expected: List[float]) -> bool:
+    """
+    Check that every expected number appears in the answer
+
+    Args:
+        answer: Model answer text
+        expected: Ground-truth numbers
+
+    Returns:
+        True if each expected value is matched within ACCURACY_TOLERANCE
+    """
+    found = []
+    for token in NUMBER_PATTERN.findall(answer):
+        try:
+            found.append(float(token.replace(',', '')))
+        except ValueError:
+            continue
+
+    def matches(value: float) -> bool:
+        tolerance = max(abs(value) * ACCURACY_TOLERANCE, 0.5)
+        return any(abs(number - value) <= tolerance for number in found)
+
+    return all(matches(float(value)) for value in expected)
+
+
+def _peak_rss_mb() -> float:
+    """Peak resident set size of the current process"""
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes on Linux
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def _run_variant(model_path: str, cases: List[Dict[str, Any]], max_tokens: int, result_queue):
+    """
+    Worker process: load one variant and answer every case
+
+    Runs in its own process so peak RSS belongs to this variant alone.
+    """
+    from llm_loader import LLMLoader
+
+    try:
+        loader = LLMLoader(model_path)
+        loader.config['temperature'] = 0.0
+
+        start = time.perf_counter()
+        if not loader.load_model():
+            raise RuntimeError(loader.get_load_status()['error'] or "load failed")
+        load_seconds = time.perf_counter() - start
+
+        answers = []
+        for case in cases:
+            prompt = loader.create_business_prompt(case['question'], case['context'])
+            started = time.perf_counter()
+            answer = loader.generate_response(prompt, max_tokens=max_tokens)
+            answers.append({
+                'answer': answer,
+                'seconds': time.perf_counter() - started,
+                'completion_tokens': loader.last_generation_stats.get('completion_tokens', 0),
+            })
+
+        result_queue.put({'load_seconds': load_seconds, 'answers': answers, 'peak_rss_mb': _peak_rss_mb()})
+    except Exception as e:
+        result_queue.put({'error': str(e)})
+
+
+def _await_result(process, result_queue, timeout: float) -> Dict[str, Any]:
+    """
+    Wait for a worker process's result, failing if it dies or runs past the timeout
+
+    Args:
+        process: Started worker process
+        result_queue: Queue the worker puts its result dict on
+        timeout: Seconds to wait for the result
+
+    Returns:
+        The worker's result, or {'error': ...} if it crashed or timed out
+    """
+    deadline = time.time() + timeout
+    try:
+        while True:
+            try:
+                return result_queue.get(timeout=1.0)
+            except queue.Empty:
+                pass
+            if not process.is_alive():
+                # The result may have been queued just before the process exited
+                try:
+                    return result_queue.get(timeout=1.0)
+                except queue.Empty:
+                    return {'error': f"variant process exited with code {process.exitcode} without a result"}
+            if time.time() >= deadline:
+                process.terminate()
+                return {'error': f"variant timed out after {timeout:.0f}s"}
+    finally:
+        process.join(10)
+        if process.is_alive():
+            process.kill()
+
+
+def benchmark_variant(model_path: str, cases: List[Dict[str, Any]], max_tokens: int = 256,
+                      timeout: float = 1800.0) -> Dict[str, Any]:
+    """
+    Benchmark one model variant in a fresh process
+
+    Args:
+        model_path: Path to the GGUF model file
+        cases: Cases from build_question_set() with a 'context' added
+        max_tokens: Max tokens per answer
+        timeout: Seconds allowed for loading the variant and answering every case
+
+    Returns:
+        Load time, throughput, latency, peak RSS and accuracy, or {'error': ...}
+        if the variant failed to load, crashed (e.g. out of memory) or timed out
+    """
+    ctx = mp.get_context('spawn')
+    result_queue = ctx.Queue()
+    process = ctx.Process(target=_run_variant, args=(model_path, cases, max_tokens, result_queue))
+    process.start()
+    result = _await_result(process, result_queue, timeout)
+
+    if 'error' in result:
+        return result
+
+    answers = result['answers']
+    total_seconds = sum(a['seconds'] for a in answers)
+    total_tokens = sum(a['completion_tokens'] for a in answers)
+    correct = sum(score_answer(a['answer'], case['expected']) for a, case in zip(answers, cases))
+
+    return {
+        'load_seconds': round(result['load_seconds'], 2),
+        'tokens_per_sec': round(total_tokens / total_seconds, 2) if total_seconds else 0.0,
+        'avg_latency_ms': round(total_seconds / len(answers) * 1000, 1) if answers else 0.0,
+        'peak_rss_mb': round(result['peak_rss_mb'], 1),
+        'accuracy': round(correct / len(cases), 3) if cases else 0.0,
+    }
+
+
+# Representative question per intent for the generation profile benchmark
+INTENT_QUESTIONS = {
+    'business_metrics': "What is the total revenue and average order value?",
+    'segment_analysis': "Which segment has the best performance?",
+    'comparison': "Compare segment 0 and segment 2",
+    'churn_analysis': "Which customers are at risk of churning?",
+    'customer_behavior': "What buying patterns do customers in segment 1 show?",
+    'marketing_strategy': "What marketing campaign should we run for segment 0?",
+    'general': "Give me an overview of our customers",
+}
+
+
+def run_intent_benchmark(args) -> bool:
+    """Compare a flat generation limit with the per-intent profiles and early stop"""
+    from business_logic import BusinessLogic
+    from chatbot_controller import ChatbotController
+
+    controller = ChatbotController(args.model)
+    controller.set_business_logic(BusinessLogic(pd.read_csv(args.data)))
+    loader = controller.llm_loader
+    if not loader.load_model():
+        print(f"❌ Could not load model: {loader.get_load_status()['error']}")
+        return False
+
+    def measure(prompt: str, intent: str, flat: bool) -> Dict[str, float]:
+        early_stop = loader.config['early_stop']
+        loader.config['early_stop'] = not flat and early_stop
+        try:
+            started = time.perf_counter()
+            if flat:
+                loader.generate_response(prompt, max_tokens=loader.config['max_tokens'])
+            else:
+                loader.generate_response(prompt, intent=intent)
+            return {'seconds': time.perf_counter() - started,
+                    'tokens': loader.last_generation_stats.get('completion_tokens', 0)}
+        finally:
+            loader.config['early_stop'] = early_stop
+
+    print(f"🧪 Flat max_tokens={loader.config['max_tokens']} vs per-intent profiles ({args.repeats} runs each)\n")
+    print(f"{'intent':<20}{'flat ms':>10}{'profile ms':>12}{'flat tok':>10}{'profile tok':>13}{'saved':>8}")
+    for intent, question in INTENT_QUESTIONS.items():
+        prompt = loader.create_business_prompt(question, controller.generate_focused_context(intent, question))
+        runs = {'flat': [], 'profile': []}
+        for _ in range(args.repeats):
+            runs['flat'].append(measure(prompt, intent, flat=True))
+            runs['profile'].append(measure(prompt, intent, flat=False))
+
+        avg = {name: {key: sum(r[key] for r in results) / len(results) for key in ('seconds', 'tokens')}
+               for name, results in runs.items()}
+        saved = 1 - avg['profile']['seconds'] / avg['flat']['seconds'] if avg['flat']['seconds'] else 0.0
+        print(f"{intent:<20}{avg['flat']['seconds'] * 1000:>10.0f}{avg['profile']['seconds'] * 1000:>12.0f}"
+              f"{avg['flat']['tokens']:>10.0f}{avg['profile']['tokens']:>13.0f}{saved:>8.0%}")
+
+    loader.unload_model()
+    return True
+
+
+def _regex_loop_analyze(intent_patterns: Dict[str, List[str]], query: str):
+    """Reference intent/segment detection: one re.search per pattern, then four findall passes"""
+    query_lower = query.lower()
+    intent = next((name for name, patterns in intent_patterns.items()
+                   if any(re.search(pattern, query_lower) for pattern in patterns)), 'general')
+    numbers = []
+    for pattern in (r'segment\s+(\d+)', r'cluster\s+(\d+)', r'group\s+(\d+)', r'\b(\d+)\b'):
+        numbers.extend(int(match) for match in re.findall(pattern, query_lower))
+    return intent, sorted(set(numbers))
+
+
+def run_matcher_benchmark(args) -> bool:
+    """Throughput of the compiled intent matcher against the per-pattern regex loop"""
+    from chatbot_controller import ChatbotController
+
+    controller = ChatbotController()
+    matcher = controller.intent_matcher
+    rng = random.Random(0)
+    phrases = list(INTENT_QUESTIONS.values()) + [
+        "Compare segment 1 vs segment 3", "How do we reduce churn in cluster 2?",
+        "What's the CLV of group 4", "hello there", "Show me the data for 2023",
+    ]
+    queries = [rng.choice(phrases) + ' ' + rng.choice(phrases).lower() for _ in range(args.queries)]
+
+    started = time.perf_counter()
+    expected = [_regex_loop_analyze(controller.intent_patterns, query) for query in queries]
+    loop_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    scanned = matcher.scan_batch(queries)
+    scan_seconds = time.perf_counter() - started
+
+    mismatches = sum(intent != ref_intent or sorted(set(numbers)) != ref_numbers
+                     for (intent, numbers), (ref_intent, ref_numbers) in zip(scanned, expected))
+    print(f"🧪 Intent detection + segment extraction on {len(queries):,} queries\n")
+    print(f"   regex loop:       {len(queries) / loop_seconds:>12,.0f} queries/s")
+    print(f"   compiled matcher: {len(queries) / scan_seconds:>12,.0f} queries/s "
+          f"({loop_seconds / scan_seconds:.1f}x)")
+    print(f"   disagreements:    {mismatches}")
+    return mismatches == 0
+
+
+def run_classifier_benchmark(args) -> bool:
+    """Held-out accuracy and batch throughput of the committed intent classifier vs the regex intents"""
+    from chatbot_controller import ChatbotController
+    from intent_classifier import IntentClassifier, INTENT_EXAMPLES_PATH, evaluate_intent_classifier
+
+    examples = pd.read_csv(INTENT_EXAMPLES_PATH)
+    test = examples[examples['split'] == 'test']
+    classifier = IntentClassifier.load()
+
+    controller = ChatbotController()
+    controller.intent_classifier = classifier
+    queries = test['query'].tolist()
+    evaluation = evaluate_intent_classifier(classifier, queries, test['intent'].tolist())
+
+    print(f"🧪 Intent accuracy on {len(test)} held-out queries\n")
+    print(f"   regex patterns:        {evaluation['regex_accuracy']:.1%} ({evaluation['regex_us_per_query']} µs/query)")
+    print(f"   classifier:            {evaluation['classifier_accuracy']:.1%} "
+          f"({evaluation['classifier_us_per_query']} µs/query)")
+    print(f"   classifier + fallback: {evaluation['combined_accuracy']:.1%} "
+          f"(regex below {controller.intent_confidence_threshold:.0%} confidence)")
+
+    batch = (queries * (args.queries // len(queries) + 1))[:args.queries]
+    timings = {}
+    for name, run in (('regex matcher', lambda: controller.intent_matcher.scan_batch(batch)),
+                      ('classify_batch', lambda: classifier.classify_batch(batch)),
+                      ('classify per query', lambda: [classifier.classify(q) for q in batch[:len(batch) // 10]])):
+        started = time.perf_counter()
+        count = len(run())
+        timings[name] = count / (time.perf_counter() - started)
+    print(f"\n   Throughput on {len(batch):,} queries:")
+    for name, rate in timings.items():
+        print(f"   {name + ':':<20}{rate:>12,.0f} queries/s")
+    return True
+
+
+def run_concurrency_benchmark(args) -> bool:
+    """Serve many requests through aget_response and measure throughput and event loop stalls"""
+    from business_logic import BusinessLogic
+    from chatbot_controller import ChatbotController
+    from telemetry import percentile
+
+    controller = ChatbotController(args.model)
+    controller.set_business_logic(BusinessLogic(pd.read_csv(args.data)))
+    controller.max_concurrent_requests = args.concurrency
+    if args.model and not controller.llm_loader.load_model():
+        print(f"❌ Could not load model: {controller.llm_loader.get_load_status()['error']}")
+        return False
+
+    rng = random.Random(0)
+    phrases = list(INTENT_QUESTIONS.values())
+    queries = [rng.choice(phrases) for _ in range(args.requests)]
+
+    started = time.perf_counter()
+    for i, query in enumerate(queries):
+        controller.get_response(query, session_id=f"sync-{i}")
+    sync_seconds = time.perf_counter() - started
+
+    async def serve():
+        latencies, lags = [], []
+        done = asyncio.Event()
+
+        async def heartbeat():
+            # How late the event loop wakes up a 10 ms timer while requests run
+            while not done.is_set():
+                expected = time.perf_counter() + 0.01
+                await asyncio.sleep(0.01)
+                lags.append(time.perf_counter() - expected)
+
+        async def request(i: int, query: str):
+            request_started = time.perf_counter()
+            await controller.aget_response(query, session_id=f"async-{i}")
+            latencies.append(time.perf_counter() - request_started)
+
+        monitor = asyncio.create_task(heartbeat())
+        await asyncio.gather(*(request(i, query) for i, query in enumerate(queries)))
+        done.set()
+        await monitor
+        return latencies, lags
+
+    started = time.perf_counter()
+    latencies, lags = asyncio.run(serve())
+    async_seconds = time.perf_counter() - started
+
+    backend = 'model' if controller.llm_loader.is_loaded else 'templates only'
+    print(f"🧪 {len(queries)} requests ({backend}), concurrency {args.concurrency}\n")
+    print(f"   get_response sequential: {len(queries) / sync_seconds:>8.1f} req/s")
+    print(f"   aget_response gathered:  {len(queries) / async_seconds:>8.1f} req/s "
+          f"(p50 {percentile(latencies, 0.5) * 1000:.0f} ms, p95 {percentile(latencies, 0.95) * 1000:.0f} ms)")
+    print(f"   event loop lag:          p95 {percentile(lags, 0.95) * 1000:.1f} ms, max {max(lags, default=0) * 1000:.1f} ms")
+    controller.llm_loader.unload_model()
+    return True
+
+
+def _synthetic_segments(df: pd.DataFrame, n_segments: int) -> pd.DataFrame:
+    """Copies of the customer data as n_segments segments with distinct spend and recency"""
+    copies = []
+    for segment_id in range(n_segments):
+        shift = segment_id / max(n_segments - 1, 1)
+        copies.append(df.assign(
+            CustomerID=df['CustomerID'].astype(str) + f"_{segment_id}",
+            Monetary=df['Monetary'] * (0.5 + shift),
+            Recency=df['Recency'] + round(120 * shift),
+            Cluster=segment_id,
+        ))
+    return pd.concat(copies, ignore_index=True)
+
+
+def run_retrieval_benchmark(args) -> bool:
+    """Prompt size and latency of retrieved facts against the full report as segment count grows"""
+    from business_logic import BusinessLogic
+    from chatbot_controller import ChatbotController
+
+    controller = ChatbotController(args.model)
+    loader = controller.llm_loader
+    if args.model and not loader.load_model():
+        print(f"❌ Could not load model: {loader.get_load_status()['error']}")
+        return False
+
+    def measure(question: str, intent: str, mode: str) -> Dict[str, float]:
+        controller.context_mode = mode
+        started = time.perf_counter()
+        prompt = loader.create_business_prompt(question, controller.generate_focused_context(intent, question))
+        result = {'prompt_tokens': loader.count_tokens(prompt),
+                  'build_ms': (time.perf_counter() - started) * 1000, 'latency_ms': 0.0}
+        if loader.is_loaded:
+            started = time.perf_counter()
+            loader.generate_response(prompt, max_tokens=args.max_tokens)
+            result['latency_ms'] = (time.perf_counter() - started) * 1000
+        return result
+
+    base = pd.read_csv(args.data)
+    print(f"🧪 Full report vs retrieved facts ({'model' if loader.is_loaded else 'prompt size only'})\n")
+    print(f"{'segments':>8}{'report tok':>12}{'facts tok':>11}{'report ms':>11}{'facts ms':>10}{'saved':>8}")
+    for n_segments in args.segments:
+        controller.set_business_logic(BusinessLogic(_synthetic_segments(base, n_segments)))
+        runs = {'report': [], 'retrieval': []}
+        for mode in runs:
+            # Fragments and the fact index are built once per data version; time steady state
+            controller.context_mode = mode
+            controller.generate_focused_context('general', '')
+        for intent, question in INTENT_QUESTIONS.items():
+            for mode in runs:
+                runs[mode].append(measure(question, intent, mode))
+        avg = {mode: {key: sum(r[key] for r in results) / len(results) for key in results[0]}
+               for mode, results in runs.items()}
+        timing = 'latency_ms' if loader.is_loaded else 'build_ms'
+        saved = 1 - avg['retrieval']['prompt_tokens'] / avg['report']['prompt_tokens']
+        print(f"{n_segments:>8}{avg['report']['prompt_tokens']:>12.0f}{avg['retrieval']['prompt_tokens']:>11.0f}"
+              f"{avg['report'][timing]:>11.1f}{avg['retrieval'][timing]:>10.1f}{saved:>8.0%}")
+
+    if not loader.is_loaded:
+        print("\n   (ms = context + prompt build time; pass --model to time generation)")
+    loader.unload_model()
+    return True
+
+
+def run_chart_benchmark(args) -> bool:
+    """Browser payload and build time of the dashboard charts as the customer count grows"""
+    import plotly.express as px
+    from business_logic import BusinessLogic
+    from dashboard_charts import build_dashboard_figures
+
+    base = pd.read_csv(args.data)
+    print("🧪 Raw-row box plot vs dashboard figures from quartiles\n")
+    print(f"{'rows':>10}{'raw box KB':>12}{'raw ms':>9}{'figures KB':>12}{'figures ms':>12}")
+    for rows in args.rows:
+        df = base.sample(n=rows, replace=True, random_state=0).reset_index(drop=True)
+        df['CustomerID'] = [f"CUST_{i}" for i in range(rows)]
+        business_logic = BusinessLogic(df)
+
+        started = time.perf_counter()
+        raw_payload = len(px.box(business_logic.df, x='Cluster', y='Monetary').to_json())
+        raw_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        figures = build_dashboard_figures(business_logic)
+        payload = sum(len(figure.to_json()) for figure in figures.values())
+        figures_ms = (time.perf_counter() - started) * 1000
+
+        print(f"{rows:>10,}{raw_payload / 1024:>12,.0f}{raw_ms:>9.0f}{payload / 1024:>12,.0f}{figures_ms:>12.0f}")
+    return True
+
+
+def run_model_benchmark(args) -> bool:
+    """Benchmark every local quantization variant and persist the results"""
+    from business_logic import BusinessLogic
+    from chatbot_controller import ChatbotController
+
+    variants = discover_model_variants(family=args.family)
+    if not variants:
+        print("❌ No GGUF model variants found in models/, the current directory or ~/models")
+        return False
+
+    business_logic = BusinessLogic(pd.read_csv(args.data))
+    controller = ChatbotController()
+    controller.set_business_logic(business_logic)
+
+    cases = build_question_set(business_logic, args.segments)
+    for case in cases:
+        intent = controller.detect_intent(case['question'])
+        case['context'] = controller.generate_focused_context(intent, case['question'])
+
+    print(f"🧪 Benchmarking {len(variants)} variants on {len(cases)} questions\n")
+    results = {}
+    failures = {}
+    for variant in variants:
+        print(f"⏳ {variant['name']} ({variant['quant']}, {variant['size_mb']:.0f} MB)")
+        result = benchmark_variant(variant['path'], cases, args.max_tokens, args.timeout)
+        if 'error' in result:
+            failures[variant['name']] = result['error']
+            print(f"   ❌ {result['error']}")
+            continue
+
+        result.update(quant=variant['quant'], size_mb=round(variant['size_mb'], 1))
+        results[variant['name']] = result
+        print(f"   load {result['load_seconds']}s · {result['tokens_per_sec']} tok/s · "
+              f"{result['avg_latency_ms']:.0f} ms/answer · peak RSS {result['peak_rss_mb']:.0f} MB · "
+              f"accuracy {result['accuracy']:.0%}")
+
+    if failures:
+        print(f"\n⚠️ {len(failures)} of {len(variants)} variants failed:")
+        for name, error in failures.items():
+            print(f"   • {name}: {error}")
+    if not results:
+        return False
+
+    save_benchmark_results(results)
+    print(f"\n✅ Results saved to {BENCHMARK_RESULTS_PATH} (used for latency_target_ms selection)")
+    return True
+
+
+def main():
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Chatbot performance benchmarks")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    models = subparsers.add_parser('models', help="Compare local quantization variants")
+    models.add_argument('--family', default='mistral-7b-instruct', help="Model file-name prefix")
+    models.add_argument('--data', default='customer_segments.csv', help="Customer data CSV")
+    models.add_argument('--segments', type=int, default=3, help="Segments to ask about")
+    models.add_argument('--max-tokens', type=int, default=256, help="Max tokens per answer")
+    models.add_argument('--timeout', type=float, default=1800.0, help="Seconds allowed per variant")
+    models.set_defaults(handler=run_model_benchmark)
+
+    intents = subparsers.add_parser('intents', help="Latency of per-intent generation profiles vs a flat limit")
+    intents.add_argument('--model', default=None, help="GGUF model path (default: auto-detect)")
+    intents.add_argument('--data', default='customer_segments.csv', help="Customer data CSV")
+    intents.add_argument('--repeats', type=int, default=3, help="Runs per intent and configuration")
+    intents.set_defaults(handler=run_intent_benchmark)
+
+    matcher = subparsers.add_parser('matcher', help="Compiled intent matcher vs the per-pattern regex loop")
+    matcher.add_argument('--queries', type=int, default=100000, help="Number of generated queries")
+    matcher.set_defaults(handler=run_matcher_benchmark)
+
+    classifier = subparsers.add_parser('classifier', help="Trained intent classifier accuracy and throughput")
+    classifier.add_argument('--queries', type=int, default=100000, help="Queries for the throughput test")
+    classifier.set_defaults(handler=run_classifier_benchmark)
+
+    retrieval = subparsers.add_parser('retrieval', help="Retrieved facts vs full report: prompt size and latency")
+    retrieval.add_argument('--model', default=None, help="GGUF model path (default: prompt size only)")
+    retrieval.add_argument('--data', default='customer_segments.csv', help="Customer data CSV")
+    retrieval.add_argument('--segments', type=int, nargs='+', default=[3, 10, 30], help="Segment counts to test")
+    retrieval.add_argument('--max-tokens', type=int, default=16, help="Tokens generated per timed request")
+    retrieval.set_defaults(handler=run_retrieval_benchmark)
+
+    charts = subparsers.add_parser('charts', help="Dashboard chart payload as the customer count grows")
+    charts.add_argument('--data', default='customer_segments.csv', help="Customer data CSV to resample")
+    charts.add_argument('--rows', type=int, nargs='+', default=[1000, 100000, 1000000], help="Customer counts")
+    charts.set_defaults(handler=run_chart_benchmark)
+
+    concurrency = subparsers.add_parser('concurrency', help="Async serving throughput and event loop lag")
+    concurrency.add_argument('--model', default=None, help="GGUF model path (default: templates only)")
+    concurrency.add_argument('--data', default='customer_segments.csv', help="Customer data CSV")
+    concurrency.add_argument('--requests', type=int, default=200, help="Requests to serve")
+    concurrency.add_argument('--concurrency', type=int, default=16, help="max_concurrent_requests")
+    concurrency.set_defaults(handler=run_concurrency_benchmark)
+
+    args = parser.parse_args()
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -26,9 +26,13 @@ class BusinessLogic:
             df: DataFrame with columns [CustomerID, Recency, Frequency, Monetary, Cluster]
         """
         self.df = df.copy()
+        self._summary_cache = None  # (data_version, segment summary)
         self.validate_data()
         self.compute_derived_metrics()
         
+        # Identifies the data; caches of values derived from it are keyed on this
+        self.data_version = format(int(pd.util.hash_pandas_object(self.df, index=False).sum()), '016x')
+        
         logger.info(f"Initialized BusinessLogic with {len(self.df)} customers")
     
     def validate_data(self):
@@ -96,9 +100,14 @@ class BusinessLogic:
         """
         Get comprehensive summary for each customer segment
         
+        Computed once per data_version; each call returns its own copy.
+        
         Returns:
             Dictionary with segment statistics
         """
+        if self._summary_cache is not None and self._summary_cache[0] == self.data_version:
+            return {cluster: dict(data) for cluster, data in self._summary_cache[1].items()}
+        
         summary = {}
         
         for cluster in sorted(self.df['Cluster'].unique()):
@@ -121,7 +130,49 @@ class BusinessLogic:
                 'max_monetary': cluster_data['Monetary'].max()
             }
         
-        return summary
+        self._summary_cache = (self.data_version, summary)
+        return {cluster: dict(data) for cluster, data in summary.items()}
+    
+    def get_metric_distribution(self, column: str = 'Monetary') -> Dict[int, Dict[str, float]]:
+        """
+        Box-plot statistics of a metric for each segment
+        
+        Quartiles and Tukey whiskers (most extreme values within 1.5 IQR of
+        the quartiles) are computed with grouped, vectorized operations, so
+        charts can be drawn from a few numbers per segment instead of every row.
+        
+        Args:
+            column: Numeric column to summarize
+            
+        Returns:
+            Dictionary of segment -> q1, median, q3, lower_fence, upper_fence, mean, count, outliers
+        """
+        values = self.df[column]
+        clusters = self.df['Cluster']
+        grouped = values.groupby(clusters)
+        quartiles = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+        iqr = quartiles[0.75] - quartiles[0.25]
+        low = clusters.map(quartiles[0.25] - 1.5 * iqr)
+        high = clusters.map(quartiles[0.75] + 1.5 * iqr)
+        inside = (values >= low) & (values <= high)
+        whiskers = values[inside].groupby(clusters[inside]).agg(['min', 'max'])
+        outliers = (~inside).groupby(clusters).sum()
+        means = grouped.mean()
+        counts = grouped.size()
+        
+        return {
+            cluster: {
+                'q1': float(quartiles.loc[cluster, 0.25]),
+                'median': float(quartiles.loc[cluster, 0.5]),
+                'q3': float(quartiles.loc[cluster, 0.75]),
+                'lower_fence': float(whiskers.loc[cluster, 'min']),
+                'upper_fence': float(whiskers.loc[cluster, 'max']),
+                'mean': float(means[cluster]),
+                'count': int(counts[cluster]),
+                'outliers': int(outliers[cluster])
+            }
+            for cluster in quartiles.index
+        }
     
     def get_most_profitable_segment(self) -> Tuple[int, Dict[str, Any]]:
         """
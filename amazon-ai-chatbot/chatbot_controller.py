@@ -3,13 +3,26 @@ Chatbot Controller - Orchestrates LLM and Business Logic
 Handles conversation flow, intent detection, and response generation
 """
 
-import re
+import time
+import asyncio
 import logging
-from typing import List, Dict, Any, Optional
-from datetime import datetime
+import weakref
+import functools
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Callable, Tuple
 
 from llm_loader import get_llm_instance
 from business_logic import BusinessLogic
+from structured_output import render_structured_response
+from template_engine import TemplateAnswerEngine
+from context_fragments import ContextFragmentCache
+from context_retriever import ContextRetriever, create_context_retriever
+from intent_matcher import IntentMatcher
+from intent_classifier import load_intent_classifier
+from conversation_store import ConversationStore
+from telemetry import percentile
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -21,17 +34,39 @@ class ChatbotController:
     Handles conversation management and response generation
     """
     
-    def __init__(self, model_path: str = None):
+    def __init__(self, model_path: str = None, conversation_db_path: str = None):
         """
         Initialize the chatbot controller
         
         Args:
             model_path: Path to the LLM model file
+            conversation_db_path: SQLite file logging every conversation (None = memory only)
         """
         self.llm_loader = get_llm_instance(model_path)
         self.business_logic: Optional[BusinessLogic] = None
-        self.conversation_memory: List[Dict] = []
-        self.max_memory_turns = 10  # Keep last 10 conversation turns
+        self.template_engine: Optional[TemplateAnswerEngine] = None
+        self.context_fragments: Optional[ContextFragmentCache] = None
+        self.context_retriever: Optional[ContextRetriever] = None
+        self.context_mode = 'retrieval'  # 'retrieval' (top-k relevant facts) or 'report' (full report)
+        self.template_confidence_threshold = 0.75  # Answer from templates (no LLM) at or above this confidence
+        self.max_memory_turns = 10  # Keep last 10 conversation turns per session
+        # Per-session memory; the controller is shared by every Streamlit session
+        self.conversation_store = ConversationStore(max_turns_per_session=self.max_memory_turns,
+                                                    db_path=conversation_db_path,
+                                                    persist=conversation_db_path is not None)
+        self.response_timeout = 60.0  # Default seconds per answer (None = no deadline)
+        self.min_partial_chars = 200  # Shorter partial answers are replaced by the template answer
+        
+        # In-flight requests per session; a new message cancels the previous one
+        self._active_requests: Dict[str, threading.Event] = {}
+        self._request_lock = threading.Lock()
+        self.response_metrics = {'requests': 0, 'outcomes': {}}
+        self._response_latencies = deque(maxlen=500)
+        
+        # aget_response: concurrent requests per event loop and the analytics thread pool
+        self.max_concurrent_requests = 8
+        self._async_semaphores = weakref.WeakKeyDictionary()
+        self._analytics_executor: Optional[ThreadPoolExecutor] = None
         
         # Intent patterns for business queries
         self.intent_patterns = {
@@ -41,11 +76,11 @@ class ChatbotController:
             ],
             'comparison': [
                 r'compare.*segment', r'segment.*vs', r'difference.*between',
-                r'segment.*comparison', r'versus', r'vs'
+                r'segment.*comparison', r'versus', r'\bvs\b'
             ],
             'churn_analysis': [
                 r'churn.*risk', r'retention', r'customer.*leaving',
-                r'why.*churn', r'prevent.*churn', r'at.*risk'
+                r'why.*churn', r'prevent.*churn', r'at\s+risk'
             ],
             'marketing_strategy': [
                 r'marketing.*strategy', r'campaign', r'promote',
@@ -60,12 +95,21 @@ class ChatbotController:
                 r'total.*sales', r'performance.*metric'
             ]
         }
+        # All patterns compiled into one scan (rebuild it after changing intent_patterns)
+        self.intent_matcher = IntentMatcher(self.intent_patterns)
+        
+        # Trained classifier; below this confidence a matching regex pattern decides instead
+        self.intent_classifier = load_intent_classifier()
+        self.intent_confidence_threshold = 0.4
         
         logger.info("ChatbotController initialized")
     
     def set_business_logic(self, business_logic: BusinessLogic):
         """Set the business logic instance"""
         self.business_logic = business_logic
+        self.template_engine = TemplateAnswerEngine(business_logic)
+        self.context_fragments = ContextFragmentCache(business_logic)
+        self.context_retriever = create_context_retriever(business_logic, self.llm_loader.count_tokens)
         logger.info("Business logic connected to chatbot")
     
     def detect_intent(self, user_query: str) -> str:
@@ -78,16 +122,7 @@ class ChatbotController:
         Returns:
             Detected intent category
         """
-        query_lower = user_query.lower()
-        
-        for intent, patterns in self.intent_patterns.items():
-            for pattern in patterns:
-                if re.search(pattern, query_lower):
-                    logger.info(f"Detected intent: {intent}")
-                    return intent
-        
-        logger.info("Detected intent: general")
-        return 'general'
+        return self.analyze_query(user_query)[0]
     
     def extract_segment_numbers(self, user_query: str) -> List[int]:
         """
@@ -99,21 +134,76 @@ class ChatbotController:
         Returns:
             List of segment numbers
         """
-        # Look for patterns like "segment 1", "cluster 2", etc.
-        patterns = [
-            r'segment\s+(\d+)',
-            r'cluster\s+(\d+)',
-            r'group\s+(\d+)',
-            r'\b(\d+)\b'  # Any standalone number
-        ]
+        _, numbers = self.intent_matcher.scan(user_query)
+        return self._valid_segments(numbers)
+    
+    def analyze_query(self, user_query: str) -> Tuple[str, List[int]]:
+        """
+        Detect intent and extract segment numbers in a single scan
         
-        segments = []
-        for pattern in patterns:
-            matches = re.findall(pattern, user_query.lower())
-            segments.extend([int(match) for match in matches])
+        Args:
+            user_query: User's input text
+            
+        Returns:
+            Tuple of (intent, segment numbers)
+        """
+        regex_intent, numbers = self.intent_matcher.scan(user_query)
+        intent = regex_intent
+        if self.intent_classifier is not None:
+            predicted, confidence = self.intent_classifier.classify(user_query)
+            intent = self._combine_intents(predicted, confidence, regex_intent)
+            logger.info(f"Detected intent: {intent} (classifier {predicted} {confidence:.2f}, regex {regex_intent})")
+        else:
+            logger.info(f"Detected intent: {intent}")
+        return intent, self._valid_segments(numbers)
+    
+    def analyze_queries(self, queries: List[str]) -> List[Tuple[str, List[int]]]:
+        """
+        Detect intent and extract segment numbers for many queries at once
         
-        # Remove duplicates and sort
-        segments = sorted(list(set(segments)))
+        Uses one vectorized classifier pass; low-confidence queries that
+        match a regex pattern get the regex intent.
+        
+        Args:
+            queries: User queries
+            
+        Returns:
+            (intent, segment numbers) per query
+        """
+        scanned = self.intent_matcher.scan_batch(queries)
+        if self.intent_classifier is None:
+            return [(intent, self._valid_segments(numbers)) for intent, numbers in scanned]
+        return [(self._combine_intents(predicted, confidence, regex_intent), self._valid_segments(numbers))
+                for (predicted, confidence), (regex_intent, numbers)
+                in zip(self.intent_classifier.classify_batch(queries), scanned)]
+    
+    def classify_intents(self, queries: List[str]) -> List[str]:
+        """
+        Detect the intent of many queries at once (e.g. logged conversations)
+        
+        Args:
+            queries: User queries
+            
+        Returns:
+            Intent per query
+        """
+        return [intent for intent, _ in self.analyze_queries(queries)]
+    
+    def _combine_intents(self, predicted: str, confidence: float, regex_intent: str) -> str:
+        """Classifier intent, unless it is unsure and a regex pattern matched"""
+        if confidence >= self.intent_confidence_threshold or regex_intent == 'general':
+            return predicted
+        return regex_intent
+    
+    def _valid_segments(self, numbers: List[int]) -> List[int]:
+        """
+        Deduplicate and sort numbers found in a query
+        
+        Numbers like "segment 1", "cluster 2" or any standalone number are
+        candidates; they are filtered to existing segments when business
+        logic is available.
+        """
+        segments = sorted(set(numbers))
         
         # Filter to valid segment numbers if business logic is available
         if self.business_logic:
@@ -126,6 +216,10 @@ class ChatbotController:
         """
         Generate focused business context based on detected intent
         
+        In 'retrieval' mode the context is the facts most relevant to the
+        question (see ContextRetriever); in 'report' mode it is the full
+        report joined from cached fragments (see ContextFragmentCache).
+        
         Args:
             intent: Detected user intent
             user_query: Original user query
@@ -136,117 +230,457 @@ class ChatbotController:
         if not self.business_logic:
             return "Business data not available."
         
-        base_context = self.business_logic.get_business_context_for_llm(user_query)
         segments = self.extract_segment_numbers(user_query)
-        
-        focused_context = base_context
-        
-        # Add intent-specific context
-        if intent == 'segment_analysis' and segments:
-            for segment_id in segments:
-                characteristics = self.business_logic.get_segment_characteristics(segment_id)
-                if 'error' not in characteristics:
-                    focused_context += f"\n\nDETAILED ANALYSIS FOR SEGMENT {segment_id}:\n"
-                    focused_context += f"• Behavioral Pattern: {characteristics['behavioral_patterns']}\n"
-                    focused_context += f"• Business Value: {characteristics['business_value']}\n"
-                    focused_context += f"• Top Customers: {characteristics['top_customers']}\n"
-        
-        elif intent == 'comparison' and len(segments) >= 2:
-            comparison = self.business_logic.compare_segments(segments[0], segments[1])
-            if 'error' not in comparison:
-                focused_context += f"\n\nSEGMENT COMPARISON ({segments[0]} vs {segments[1]}):\n"
-                focused_context += f"• Revenue Difference: ${comparison['revenue_diff']:,.2f}\n"
-                focused_context += f"• CLV Difference: ${comparison['clv_diff']:.2f}\n"
-                focused_context += f"• Customer Count Difference: {comparison['customer_count_diff']}\n"
-                focused_context += f"• Better Performing Segment: {comparison['better_segment']}\n"
-        
-        elif intent == 'churn_analysis':
-            churn_analysis = self.business_logic.get_churn_risk_analysis()
-            focused_context += f"\n\nCHURN RISK DETAILED ANALYSIS:\n"
-            focused_context += f"• Low Churn Risk Segments: {churn_analysis['low_churn_segments']}\n"
-            focused_context += f"• High Churn Risk Segments: {churn_analysis['high_churn_segments']}\n"
-            focused_context += f"• Overall Churn Distribution: {churn_analysis['overall_churn_distribution']}\n"
-        
-        elif intent == 'marketing_strategy' and segments:
-            for segment_id in segments:
-                recommendations = self.business_logic.get_marketing_recommendations(segment_id)
-                focused_context += f"\n\nMARKETING RECOMMENDATIONS FOR SEGMENT {segment_id}:\n"
-                for rec in recommendations:
-                    focused_context += f"• {rec}\n"
-        
-        return focused_context
-    
-    def update_conversation_memory(self, user_query: str, assistant_response: str):
+        if self.context_mode == 'retrieval' and self.context_retriever is not None:
+            return self.context_retriever.build_context(user_query, intent, segments)
+        return self.context_fragments.focused_context(intent, segments)
+    
+    @property
+    def conversation_memory(self) -> List[Dict]:
+        """Recent messages of the default session"""
+        return self.conversation_store.get_history('default')
+    
+    def update_conversation_memory(self, user_query: str, assistant_response: str, session_id: str = None,
+                                   intent: str = None, outcome: str = None):
         """
         Update conversation memory with the latest exchange
         
         Args:
             user_query: User's question
             assistant_response: Assistant's response
+            session_id: Conversation the exchange belongs to
+            intent: Detected intent (kept in the conversation log)
+            outcome: How the answer was produced (kept in the conversation log)
         """
-        self.conversation_memory.append({
-            'role': 'user',
-            'content': user_query,
-            'timestamp': datetime.now()
-        })
+        self.conversation_store.add_exchange(session_id or 'default', user_query, assistant_response,
+                                             intent=intent, outcome=outcome)
+    
+    def _begin_request(self, session_id: Optional[str]) -> threading.Event:
+        """Register a request, cancelling the session's previous one if still running"""
+        key = session_id or 'default'
+        cancel_event = threading.Event()
+        with self._request_lock:
+            previous = self._active_requests.get(key)
+            if previous is not None:
+                previous.set()
+            self._active_requests[key] = cancel_event
+        return cancel_event
+    
+    def _end_request(self, session_id: Optional[str], cancel_event: threading.Event, outcome: str, elapsed: float):
+        """Unregister a request and record its outcome and latency"""
+        key = session_id or 'default'
+        with self._request_lock:
+            if self._active_requests.get(key) is cancel_event:
+                del self._active_requests[key]
+            self.response_metrics['requests'] += 1
+            outcomes = self.response_metrics['outcomes']
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+            self._response_latencies.append(elapsed)
+        logger.info(f"Response outcome: {outcome} in {elapsed:.2f}s")
+    
+    def cancel_request(self, session_id: str = None) -> bool:
+        """
+        Cancel the session's in-flight request (e.g. the user navigated away)
         
-        self.conversation_memory.append({
-            'role': 'assistant',
-            'content': assistant_response,
-            'timestamp': datetime.now()
-        })
+        Args:
+            session_id: Session whose request to cancel
+            
+        Returns:
+            True if a request was running
+        """
+        with self._request_lock:
+            cancel_event = self._active_requests.get(session_id or 'default')
+        if cancel_event is None:
+            return False
+        cancel_event.set()
+        return True
+    
+    def get_response_metrics(self) -> Dict[str, Any]:
+        """
+        Get response latency and outcome metrics
+        
+        Outcomes are template, fallback (model not ready), complete, partial
+        (cut at the deadline), deadline_fallback (template after the deadline),
+        cancelled and error.
         
-        # Keep only the last N turns
-        if len(self.conversation_memory) > self.max_memory_turns * 2:
-            self.conversation_memory = self.conversation_memory[-self.max_memory_turns * 2:]
+        Returns:
+            Request count, outcome counts, in-flight requests and p50/p95/max latency in seconds
+        """
+        with self._request_lock:
+            latencies = list(self._response_latencies)
+            metrics = {
+                'requests': self.response_metrics['requests'],
+                'outcomes': dict(self.response_metrics['outcomes']),
+                'in_flight': len(self._active_requests),
+            }
+        
+        metrics.update(p50_seconds=percentile(latencies, 0.5), p95_seconds=percentile(latencies, 0.95),
+                       max_seconds=max(latencies, default=0.0))
+        return metrics
     
-    def get_response(self, user_query: str, conversation_history: List[Dict] = None) -> str:
+    def get_response(self, user_query: str, conversation_history: List[Dict] = None, deadline: float = None,
+                     session_id: str = None, on_text: Callable[[str], None] = None) -> str:
         """
         Generate a response to the user's query
         
         Args:
             user_query: User's input question
             conversation_history: Previous conversation turns
+            deadline: Absolute time.time() by which to answer (defaults to now + response_timeout)
+            session_id: Conversation the request belongs to; its previous request is cancelled
+            on_text: Called with the partial answer as tokens stream in
             
         Returns:
             Generated response from the AI
         """
+        start_time = time.time()
+        if deadline is None and self.response_timeout:
+            deadline = start_time + self.response_timeout
+        
+        cancel_event = self._begin_request(session_id)
+        outcome = 'cancelled'  # Kept if the request is interrupted (e.g. the UI session stops)
         try:
-            # Detect intent and extract relevant information
-            intent = self.detect_intent(user_query)
-            segments = self.extract_segment_numbers(user_query)
-            
-            logger.info(f"Processing query: '{user_query[:50]}...'")
-            logger.info(f"Intent: {intent}, Segments: {segments}")
-            
-            # Generate focused business context
-            business_context = self.generate_focused_context(intent, user_query)
+            response, outcome = self._answer(user_query, conversation_history, deadline, cancel_event,
+                                             on_text, session_id or 'default')
+            return response
+        finally:
+            self._end_request(session_id, cancel_event, outcome, time.time() - start_time)
+    
+    async def aget_response(self, user_query: str, conversation_history: List[Dict] = None,
+                            deadline: float = None, session_id: str = None,
+                            on_text: Callable[[str], None] = None) -> str:
+        """
+        Async variant of get_response for serving from an event loop
+        
+        Analytics (intent detection, templates, context and prompt building)
+        run on a thread pool and inference goes through the worker pool or
+        an inference thread, so the event loop is never blocked. At most
+        max_concurrent_requests run at once per event loop; cancelling the
+        task stops the request's generation.
+        
+        Args:
+            Same as get_response; on_text is called from a worker thread
             
-            # Use provided conversation history or internal memory
-            history = conversation_history or self.conversation_memory
+        Returns:
+            Generated response from the AI
+        """
+        start_time = time.time()
+        if deadline is None and self.response_timeout:
+            deadline = start_time + self.response_timeout
+        
+        cancel_event = self._begin_request(session_id)
+        outcome = 'cancelled'
+        try:
+            async with self._async_request_slot():
+                response, outcome = await self._aanswer(user_query, conversation_history, deadline, cancel_event,
+                                                        on_text, session_id or 'default')
+            return response
+        except asyncio.CancelledError:
+            cancel_event.set()
+            raise
+        finally:
+            self._end_request(session_id, cancel_event, outcome, time.time() - start_time)
+    
+    def _async_request_slot(self) -> asyncio.Semaphore:
+        """Concurrency limit for aget_response on the running event loop"""
+        loop = asyncio.get_running_loop()
+        semaphore = self._async_semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._async_semaphores[loop] = asyncio.Semaphore(self.max_concurrent_requests)
+        return semaphore
+    
+    def _offload(self, func: Callable, *args) -> "asyncio.Future":
+        """Run CPU-bound analytics on the controller's thread pool"""
+        if self._analytics_executor is None:
+            self._analytics_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="analytics")
+        return asyncio.get_running_loop().run_in_executor(self._analytics_executor, functools.partial(func, *args))
+    
+    def _answer(self, user_query: str, conversation_history: Optional[List[Dict]], deadline: Optional[float],
+                cancel_event: threading.Event, on_text: Optional[Callable[[str], None]],
+                session_id: Optional[str] = None) -> Tuple[str, str]:
+        """
+        Answer a query within the deadline
+        
+        Returns:
+            Tuple of (response, outcome)
+        """
+        intent, segments = 'general', []
+        try:
+            # Detect intent and extract relevant information
+            intent, segments = self.analyze_query(user_query)
+            prompt, response, outcome = self._prepare_answer(user_query, intent, segments, conversation_history,
+                                                             session_id)
+            if prompt is not None:
+                response, outcome = self._generate_llm_answer(user_query, intent, segments, prompt, deadline,
+                                                              cancel_event, on_text, session_id)
+            return self._remember_answer(user_query, response, outcome, session_id, intent)
             
-            # Create the prompt for the LLM
-            prompt = self.llm_loader.create_business_prompt(
-                user_query=user_query,
-                context_data=business_context,
-                conversation_history=history
+        except Exception as e:
+            logger.error(f"Error generating response: {str(e)}")
+            return self._generate_fallback_response(user_query, intent, segments), 'error'
+    
+    async def _aanswer(self, user_query: str, conversation_history: Optional[List[Dict]], deadline: Optional[float],
+                       cancel_event: threading.Event, on_text: Optional[Callable[[str], None]],
+                       session_id: Optional[str] = None) -> Tuple[str, str]:
+        """
+        Answer a query within the deadline without blocking the event loop
+        
+        Returns:
+            Tuple of (response, outcome)
+        """
+        intent, segments = 'general', []
+        try:
+            intent, segments = await self._offload(self.analyze_query, user_query)
+            prompt, response, outcome = await self._offload(
+                self._prepare_answer, user_query, intent, segments, conversation_history, session_id
             )
+            if prompt is not None:
+                if self.llm_loader.config['structured_output']:
+                    structured = await self.llm_loader.agenerate_structured_response(
+                        prompt, deadline=deadline, cancel_event=cancel_event, session_id=session_id
+                    )
+                    response, outcome = self._finish_structured_answer(user_query, intent, segments, structured,
+                                                                       deadline, cancel_event)
+                else:
+                    text, finish_reason = await self.llm_loader.agenerate_with_deadline(
+                        prompt, deadline=deadline, cancel_event=cancel_event, on_text=on_text,
+                        session_id=session_id, intent=intent
+                    )
+                    response, outcome = self._finish_llm_answer(user_query, intent, segments, text, finish_reason)
+            return self._remember_answer(user_query, response, outcome, session_id, intent)
             
-            # Generate response using the LLM
-            response = self.llm_loader.generate_response(prompt)
-            
-            # Post-process the response
-            response = self._post_process_response(response, intent, segments)
+        except Exception as e:
+            logger.error(f"Error generating response: {str(e)}")
+            return self._generate_fallback_response(user_query, intent, segments), 'error'
+    
+    def _prepare_answer(self, user_query: str, intent: str, segments: List[int],
+                        conversation_history: Optional[List[Dict]],
+                        session_id: Optional[str]) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+        """
+        Analytics half of answering a query
+        
+        Returns:
+            Tuple of (prompt, response, outcome): either the LLM prompt, or
+            (prompt None) a template or fallback answer with its outcome
+        """
+        logger.info(f"Processing query: '{user_query[:50]}...'")
+        logger.info(f"Intent: {intent}, Segments: {segments}")
+        
+        # Data questions are answered exactly from the analytics, without the LLM
+        if self.template_engine is not None:
+            confidence = self.template_engine.score_confidence(user_query, intent, segments)
+            if confidence >= self.template_confidence_threshold:
+                logger.info(f"Template answer (confidence {confidence:.2f})")
+                return None, self.template_engine.render(user_query, intent, segments), 'template'
+        
+        # Answer from the analytics templates until the model has finished loading
+        if not self.llm_loader.is_loaded:
+            self.llm_loader.start_background_load()
+            logger.info("Model not ready, using template response")
+            return None, self._generate_fallback_response(user_query, intent, segments), 'fallback'
+        
+        # Generate focused business context
+        business_context = self.generate_focused_context(intent, user_query)
+        
+        # Use provided conversation history or the session's memory
+        history = conversation_history or self.conversation_store.get_history(session_id)
+        
+        # Create the prompt for the LLM
+        prompt = self.llm_loader.create_business_prompt(
+            user_query=user_query,
+            context_data=business_context,
+            conversation_history=history,
+            session_id=session_id,
+            intent=intent
+        )
+        return prompt, None, None
+    
+    def _remember_answer(self, user_query: str, response: str, outcome: str,
+                         session_id: Optional[str], intent: str = None) -> Tuple[str, str]:
+        """Store the exchange in the session's memory unless the request was cancelled"""
+        if outcome == 'cancelled':
+            # Superseded by a newer message; the answer is not shown or remembered
+            return response, outcome
+        
+        # Update conversation memory
+        self.update_conversation_memory(user_query, response, session_id, intent, outcome)
+        
+        if outcome not in ('template', 'fallback'):
+            logger.info("Response generated successfully")
+        return response, outcome
+    
+    def _generate_llm_answer(self, user_query: str, intent: str, segments: List[int], prompt: str,
+                             deadline: Optional[float], cancel_event: Optional[threading.Event],
+                             on_text: Optional[Callable[[str], None]] = None,
+                             session_id: Optional[str] = None) -> Tuple[str, str]:
+        """
+        Generate and post-process the model's answer to a prompt
+        
+        Returns:
+            Tuple of (response, outcome); the template answer replaces
+            answers that failed or were cut off too early
+        """
+        if self.llm_loader.config['structured_output']:
+            structured = self.llm_loader.generate_structured_response(
+                prompt, deadline=deadline, cancel_event=cancel_event, session_id=session_id
+            )
+            return self._finish_structured_answer(user_query, intent, segments, structured, deadline, cancel_event)
+        
+        # Generate response using the LLM, stopping at the deadline
+        response, finish_reason = self.llm_loader.generate_with_deadline(
+            prompt, deadline=deadline, cancel_event=cancel_event, on_text=on_text,
+            session_id=session_id, intent=intent
+        )
+        return self._finish_llm_answer(user_query, intent, segments, response, finish_reason)
+    
+    def _finish_structured_answer(self, user_query: str, intent: str, segments: List[int],
+                                  structured: Optional[Dict], deadline: Optional[float],
+                                  cancel_event: Optional[threading.Event]) -> Tuple[str, str]:
+        """
+        Render a grammar-constrained answer, or fall back when there is none
+        
+        Returns:
+            Tuple of (response, outcome); no cleanup passes are needed
+        """
+        if structured is None:
+            if cancel_event is not None and cancel_event.is_set():
+                return self._generate_fallback_response(user_query, intent, segments), 'cancelled'
+            timed_out = deadline is not None and time.time() >= deadline
+            outcome = 'deadline_fallback' if timed_out else 'fallback'
+            return self._generate_fallback_response(user_query, intent, segments), outcome
+        return render_structured_response(structured), 'complete'
+    
+    def _finish_llm_answer(self, user_query: str, intent: str, segments: List[int], response: str,
+                           finish_reason: str) -> Tuple[str, str]:
+        """
+        Turn generated text and its finish reason into the final answer and outcome
+        
+        Returns:
+            Tuple of (response, outcome)
+        """
+        if finish_reason == 'cancelled':
+            return self._generate_fallback_response(user_query, intent, segments), 'cancelled'
+        
+        outcome = 'complete'
+        if finish_reason == 'deadline':
+            if len(response) < self.min_partial_chars:
+                return self._generate_fallback_response(user_query, intent, segments), 'deadline_fallback'
+            outcome = 'partial'
+        
+        # Post-process the response
+        response = self._post_process_response(response, intent, segments)
+        if outcome == 'partial':
+            response += "\n\n⏱️ *Answer shortened to stay within the response time limit.*"
+        return response, outcome
+    
+    def get_responses(self, queries: List[str], deadline: float = None,
+                      max_workers: int = None) -> List[Dict[str, Any]]:
+        """
+        Answer many independent questions, e.g. for a weekly report
+        
+        Intents are detected for all queries in one vectorized pass,
+        identical questions are answered once, template-answerable ones are
+        rendered immediately and the rest run on the model in parallel (as
+        many at a time as the worker pool or model server can serve). Each
+        business context is built once and shared by every query that needs
+        it, and queries whose prompts come out identical share one
+        generation. Without a loaded model every answer comes from the
+        templates. The conversation memory is not used or updated.
+        
+        Args:
+            queries: Questions to answer
+            deadline: Absolute time.time() by which all answers must finish (None = no limit)
+            max_workers: Parallel model requests (defaults to the backend's concurrency)
             
-            # Update conversation memory
-            self.update_conversation_memory(user_query, response)
+        Returns:
+            One dict per query, in order, with 'query', 'response', 'outcome',
+            'intent', 'segments', 'seconds' (time spent on that answer) and
+            'duplicate_of' (index of the query it shares an answer with, or None)
+        """
+        batch_start = time.time()
+        results: List[Dict[str, Any]] = []
+        first_index: Dict[Tuple[str, str], int] = {}
+        first_prompt: Dict[Tuple[str, str], int] = {}
+        contexts: Dict[Tuple, str] = {}
+        prompts: Dict[int, str] = {}
+        pending: List[int] = []
+        # Retrieved context depends on the question's wording; the report context only on intent and segments
+        query_specific_context = self.context_mode == 'retrieval' and self.context_retriever is not None
+        
+        for index, (query, (intent, segments)) in enumerate(zip(queries, self.analyze_queries(queries))):
+            result = {'query': query, 'response': None, 'outcome': None, 'intent': intent,
+                      'segments': segments, 'seconds': 0.0, 'duplicate_of': None}
+            results.append(result)
             
-            logger.info("Response generated successfully")
-            return response
+            # Identical questions (ignoring case and spacing) share one answer
+            key = (intent, ' '.join(query.lower().split()))
+            if key in first_index:
+                result['duplicate_of'] = first_index[key]
+                continue
+            first_index[key] = index
             
-        except Exception as e:
-            logger.error(f"Error generating response: {str(e)}")
-            return self._generate_fallback_response(user_query, intent, segments)
+            started = time.perf_counter()
+            if (self.template_engine is not None and
+                    self.template_engine.score_confidence(query, intent, segments) >= self.template_confidence_threshold):
+                result.update(response=self.template_engine.render(query, intent, segments), outcome='template')
+            elif not self.llm_loader.is_loaded:
+                result.update(response=self._generate_fallback_response(query, intent, segments), outcome='fallback')
+            else:
+                try:
+                    context_key = (intent, tuple(segments), query if query_specific_context else None)
+                    if context_key not in contexts:
+                        contexts[context_key] = self.generate_focused_context(intent, query)
+                    prompt = self.llm_loader.create_business_prompt(
+                        user_query=query,
+                        context_data=contexts[context_key],
+                        intent=intent
+                    )
+                except Exception as e:
+                    logger.error(f"Error building prompt: {str(e)}")
+                    result.update(response=self._generate_fallback_response(query, intent, segments),
+                                  outcome='error', seconds=time.perf_counter() - started)
+                    continue
+                
+                # Differently worded questions can still build the same prompt (the intent picks the
+                # generation settings, so it is part of the key)
+                prompt_key = (intent, prompt)
+                if prompt_key in first_prompt:
+                    result['duplicate_of'] = first_prompt[prompt_key]
+                    continue
+                first_prompt[prompt_key] = index
+                prompts[index] = prompt
+                pending.append(index)
+                continue
+            result['seconds'] = time.perf_counter() - started
+        
+        def answer(index: int):
+            result = results[index]
+            started = time.perf_counter()
+            try:
+                response, outcome = self._generate_llm_answer(result['query'], result['intent'], result['segments'],
+                                                              prompts[index], deadline, None)
+            except Exception as e:
+                logger.error(f"Error generating response: {str(e)}")
+                response = self._generate_fallback_response(result['query'], result['intent'], result['segments'])
+                outcome = 'error'
+            result.update(response=response, outcome=outcome, seconds=time.perf_counter() - started)
+        
+        if pending:
+            workers = max_workers or self.llm_loader.generation_concurrency()
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-answer") as executor:
+                list(executor.map(answer, pending))
+        
+        for result in results:
+            if result['duplicate_of'] is not None:
+                original = results[result['duplicate_of']]
+                result.update(response=original['response'], outcome=original['outcome'])
+        
+        outcomes = {}
+        for result in results:
+            outcomes[result['outcome']] = outcomes.get(result['outcome'], 0) + 1
+        logger.info(f"Answered {len(queries)} queries in {time.time() - batch_start:.2f}s "
+                    f"({len(pending)} generated): {outcomes}")
+        return results
     
     def _post_process_response(self, response: str, intent: str, segments: List[int]) -> str:
         """
@@ -281,7 +715,7 @@ class ChatbotController:
     
     def _generate_fallback_response(self, user_query: str, intent: str, segments: List[int]) -> str:
         """
-        Generate a fallback response when LLM fails
+        Generate a fallback response from the template engine when the LLM fails or is not ready
         
         Args:
             user_query: User's query
@@ -291,71 +725,44 @@ class ChatbotController:
         Returns:
             Fallback response with basic analytics
         """
-        if not self.business_logic:
+        if not self.template_engine:
             return "❌ I'm sorry, but I don't have access to the customer data right now. Please ensure the data is loaded properly."
         
         try:
-            if intent == 'segment_analysis' and segments:
-                segment_id = segments[0]
-                summary = self.business_logic.get_segment_summary()
-                if segment_id in summary:
-                    data = summary[segment_id]
-                    return f"""📊 **Segment {segment_id} Analysis**
-                    
-**Key Metrics:**
-• Customer Count: {data['customer_count']:,}
-• Total Revenue: ${data['total_revenue']:,.2f}
-• Average Monetary Value: ${data['avg_monetary']:.2f}
-• Average Frequency: {data['avg_frequency']:.1f}
-• Average Recency: {data['avg_recency']:.0f} days
-
-This segment represents {data['percentage']:.1f}% of your customer base."""
-            
-            elif intent == 'comparison' and len(segments) >= 2:
-                comparison = self.business_logic.compare_segments(segments[0], segments[1])
-                if 'error' not in comparison:
-                    return f"""⚖️ **Segment Comparison: {segments[0]} vs {segments[1]}**
-                    
-**Revenue Difference:** ${comparison['revenue_diff']:,.2f}
-**CLV Difference:** ${comparison['clv_diff']:.2f}
-**Better Performing:** Segment {comparison['better_segment']}
-
-Segment {comparison['better_segment']} shows superior performance in overall revenue generation."""
-            
-            # General fallback
-            most_profitable = self.business_logic.get_most_profitable_segment()
-            return f"""📊 **Customer Segmentation Overview**
-            
-I can help you analyze your customer segments! Here's a quick overview:
-
-**Most Profitable Segment:** Segment {most_profitable[0]}
-• Revenue: ${most_profitable[1]['total_revenue']:,.2f}
-• Customers: {most_profitable[1]['customer_count']:,}
-
-Ask me about specific segments, comparisons, or marketing strategies!"""
+            return self.template_engine.render(user_query, intent, segments)
             
         except Exception as e:
             logger.error(f"Fallback response generation failed: {str(e)}")
             return "❌ I'm experiencing technical difficulties. Please try rephrasing your question or check if the customer data is properly loaded."
     
-    def get_conversation_summary(self) -> Dict[str, Any]:
+    def get_conversation_summary(self, session_id: str = None) -> Dict[str, Any]:
         """
         Get a summary of the current conversation
         
+        Args:
+            session_id: Conversation to summarize
+            
         Returns:
             Conversation summary statistics
         """
+        memory = self.conversation_store.get_history(session_id or 'default')
         return {
-            'total_turns': len(self.conversation_memory),
-            'user_queries': len([msg for msg in self.conversation_memory if msg['role'] == 'user']),
-            'assistant_responses': len([msg for msg in self.conversation_memory if msg['role'] == 'assistant']),
-            'conversation_start': self.conversation_memory[0]['timestamp'] if self.conversation_memory else None,
-            'last_interaction': self.conversation_memory[-1]['timestamp'] if self.conversation_memory else None
+            'total_turns': len(memory),
+            'user_queries': len([msg for msg in memory if msg['role'] == 'user']),
+            'assistant_responses': len([msg for msg in memory if msg['role'] == 'assistant']),
+            'conversation_start': memory[0]['timestamp'] if memory else None,
+            'last_interaction': memory[-1]['timestamp'] if memory else None
         }
     
-    def clear_conversation_memory(self):
-        """Clear the conversation memory"""
-        self.conversation_memory = []
+    def clear_conversation_memory(self, session_id: str = None):
+        """
+        Clear the conversation memory
+        
+        Args:
+            session_id: Conversation to clear (None = every session)
+        """
+        self.conversation_store.clear(session_id)
+        self.llm_loader.forget_session(session_id)
         logger.info("Conversation memory cleared")
     
     def get_system_status(self) -> Dict[str, Any]:
@@ -369,9 +776,15 @@ Ask me about specific segments, comparisons, or marketing strategies!"""
         
         return {
             'llm_loaded': llm_info['is_loaded'],
+            'llm_load_status': llm_info['load_status'],
+            'response_metrics': self.get_response_metrics(),
+            'telemetry': llm_info['telemetry'],
             'model_path': llm_info['model_path'],
             'model_exists': llm_info['model_exists'],
             'business_logic_connected': self.business_logic is not None,
-            'conversation_turns': len(self.conversation_memory),
+            'context_fragments': self.context_fragments.get_stats() if self.context_fragments else None,
+            'context_mode': self.context_mode if self.context_retriever else 'report',
+            'conversation_turns': self.conversation_store.get_stats()['messages'],
+            'conversation_store': self.conversation_store.get_stats(),
             'supported_intents': list(self.intent_patterns.keys())
         }
\ No newline at end of file
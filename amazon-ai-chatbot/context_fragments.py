@@ -0,0 +1,133 @@
+"""
+Cached LLM Context Fragments
+Renders each block of business context once per data version and assembles focused contexts from them
+"""
+
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Tuple
+
+from business_logic import BusinessLogic
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class ContextFragmentCache:
+    """
+    Rendered context fragments keyed by (kind, segments)
+
+    The base report, per-segment detail, pair comparison, churn block and
+    per-segment recommendations are each rendered once and reused by every
+    query that needs them. The cache is tied to the BusinessLogic's
+    data_version and empties itself when the data changes.
+    """
+
+    def __init__(self, business_logic: BusinessLogic):
+        """
+        Initialize the cache
+
+        Args:
+            business_logic: Business logic instance the fragments are rendered from
+        """
+        self.business_logic = business_logic
+        self._fragments: Dict[Tuple, str] = {}
+        self._version = business_logic.data_version
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def _get(self, key: Tuple, render: Callable[[], str]) -> str:
+        """Return a cached fragment, rendering it on first use"""
+        with self._lock:
+            if self.business_logic.data_version != self._version:
+                self._fragments.clear()
+                self._version = self.business_logic.data_version
+            fragment = self._fragments.get(key)
+            if fragment is not None:
+                self.stats['hits'] += 1
+                return fragment
+            self.stats['misses'] += 1
+            version = self._version
+
+        fragment = render()
+        with self._lock:
+            if self._version == version:
+                self._fragments[key] = fragment
+        return fragment
+
+    def base_report(self) -> str:
+        """Full multi-segment report"""
+        return self._get(('base',), self.business_logic.get_business_context_for_llm)
+
+    def segment_detail(self, segment_id: int) -> str:
+        """Behavior, business value and top customers of one segment ('' if unknown)"""
+        def render():
+            characteristics = self.business_logic.get_segment_characteristics(segment_id)
+            if 'error' in characteristics:
+                return ''
+            return (f"\n\nDETAILED ANALYSIS FOR SEGMENT {segment_id}:\n"
+                    f"• Behavioral Pattern: {characteristics['behavioral_patterns']}\n"
+                    f"• Business Value: {characteristics['business_value']}\n"
+                    f"• Top Customers: {characteristics['top_customers']}\n")
+        return self._get(('segment', segment_id), render)
+
+    def comparison(self, segment1: int, segment2: int) -> str:
+        """Differences between two segments ('' if either is unknown)"""
+        def render():
+            comparison = self.business_logic.compare_segments(segment1, segment2)
+            if 'error' in comparison:
+                return ''
+            return (f"\n\nSEGMENT COMPARISON ({segment1} vs {segment2}):\n"
+                    f"• Revenue Difference: ${comparison['revenue_diff']:,.2f}\n"
+                    f"• CLV Difference: ${comparison['clv_diff']:.2f}\n"
+                    f"• Customer Count Difference: {comparison['customer_count_diff']}\n"
+                    f"• Better Performing Segment: {comparison['better_segment']}\n")
+        return self._get(('comparison', segment1, segment2), render)
+
+    def churn(self) -> str:
+        """Churn risk block"""
+        def render():
+            churn_analysis = self.business_logic.get_churn_risk_analysis()
+            return ("\n\nCHURN RISK DETAILED ANALYSIS:\n"
+                    f"• Low Churn Risk Segments: {churn_analysis['low_churn_segments']}\n"
+                    f"• High Churn Risk Segments: {churn_analysis['high_churn_segments']}\n"
+                    f"• Overall Churn Distribution: {churn_analysis['overall_churn_distribution']}\n")
+        return self._get(('churn',), render)
+
+    def recommendations(self, segment_id: int) -> str:
+        """Marketing recommendations for one segment"""
+        def render():
+            recommendations = self.business_logic.get_marketing_recommendations(segment_id)
+            return (f"\n\nMARKETING RECOMMENDATIONS FOR SEGMENT {segment_id}:\n"
+                    + ''.join(f"• {rec}\n" for rec in recommendations))
+        return self._get(('recommendations', segment_id), render)
+
+    def focused_context(self, intent: str, segments: List[int]) -> str:
+        """
+        Assemble the context for an intent from cached fragments
+
+        Args:
+            intent: Detected user intent
+            segments: Valid segment numbers mentioned in the query
+
+        Returns:
+            Base report followed by the intent's fragments
+        """
+        parts = [self.base_report()]
+
+        if intent == 'segment_analysis':
+            parts.extend(self.segment_detail(segment_id) for segment_id in segments)
+        elif intent == 'comparison' and len(segments) >= 2:
+            parts.append(self.comparison(segments[0], segments[1]))
+        elif intent == 'churn_analysis':
+            parts.append(self.churn())
+        elif intent == 'marketing_strategy':
+            parts.extend(self.recommendations(segment_id) for segment_id in segments)
+
+        return ''.join(parts)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit/miss counts and number of cached fragments"""
+        with self._lock:
+            return dict(self.stats, fragments=len(self._fragments), data_version=self._version)
@@ -0,0 +1,266 @@
+"""
+Retrieval-Based Context Selection
+Indexes fine-grained facts from BusinessLogic and selects the ones relevant to a question within a token budget
+"""
+
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from business_logic import BusinessLogic
+from text_features import HashedNgramIndex
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Fact kinds each intent prefers; these get a score boost on top of text similarity
+INTENT_FACT_KINDS = {
+    'segment_analysis': {'metrics', 'behavior', 'top_customers', 'value_tier', 'ranking'},
+    'comparison': {'metrics', 'ranking'},
+    'churn_analysis': {'churn', 'insight'},
+    'marketing_strategy': {'recommendation', 'behavior'},
+    'customer_behavior': {'behavior', 'metrics'},
+    'business_metrics': {'metrics', 'ranking', 'insight'},
+    'general': {'metrics', 'insight'},
+}
+
+# Named facts each intent always gets (when they fit the budget), whatever the wording of the question
+INTENT_REQUIRED_FACTS = {
+    'segment_analysis': ('most_profitable', 'highest_clv', 'revenue_ranking'),
+    'comparison': ('revenue_ranking', 'clv_ranking'),
+    'churn_analysis': ('churn_segments', 'churn_overall'),
+    'marketing_strategy': ('most_profitable', 'churn_segments', 'frequency_profile'),
+    'customer_behavior': ('frequency_profile',),
+    'business_metrics': ('most_profitable', 'highest_clv', 'revenue_ranking'),
+    'general': ('most_profitable', 'highest_clv', 'churn_segments'),
+}
+
+INTENT_KIND_BOOST = 0.3
+SEGMENT_MATCH_BOOST = 0.5
+OTHER_SEGMENT_PENALTY = 1.0
+# Facts scoring below this share of the best fact's score are left out even with budget to spare
+MIN_RELATIVE_SCORE = 0.5
+
+
+# Hashed char n-gram features of facts and queries (the intent classifier uses the same family)
+NGRAM_RANGE = (3, 5)
+N_FEATURES = 2 ** 16
+
+
+def build_facts(business_logic: BusinessLogic) -> List[Dict[str, Any]]:
+    """
+    Break the business report into small self-contained facts
+
+    Args:
+        business_logic: Business logic instance providing the data
+
+    Returns:
+        Facts as dicts with 'text' (rendered into the prompt), 'keywords'
+        (indexed but not rendered), 'kind', 'segments' and 'name' (set for
+        the facts listed in INTENT_REQUIRED_FACTS)
+    """
+    df = business_logic.df
+    summary = business_logic.get_segment_summary()
+    churn = business_logic.get_churn_risk_analysis()
+    most_profitable = business_logic.get_most_profitable_segment()
+    highest_clv = business_logic.get_highest_clv_segment()
+    facts = []
+
+    def add(kind: str, text: str, keywords: str = '', segments=(), name: str = None):
+        facts.append({'kind': kind, 'text': text, 'keywords': keywords,
+                      'segments': frozenset(int(s) for s in segments), 'name': name})
+
+    add('overview', f"Overall: {len(df):,} customers, total revenue ${df['Monetary'].sum():,.2f}, "
+                    f"average CLV ${df['CLV'].mean():.2f}, {len(summary)} segments")
+    add('insight', f"Most profitable segment: Segment {most_profitable[0]} "
+                   f"(${most_profitable[1]['total_revenue']:,.2f} revenue)",
+        'best top highest revenue profit', [most_profitable[0]], name='most_profitable')
+    add('insight', f"Highest CLV segment: Segment {highest_clv[0]} "
+                   f"(${highest_clv[1]['avg_clv']:.2f} average CLV)",
+        'most valuable lifetime value best', [highest_clv[0]], name='highest_clv')
+    add('insight', f"Low churn risk segments: {churn['low_churn_segments']}; "
+                   f"high churn risk segments: {churn['high_churn_segments']}",
+        'churn retention at risk losing customers', churn['low_churn_segments'] + churn['high_churn_segments'],
+        name='churn_segments')
+    add('churn', f"Overall churn risk distribution: {churn['overall_churn_distribution']}",
+        'churn risk at risk inactive retention', name='churn_overall')
+
+    for metric, label, name in (('total_revenue', 'total revenue', 'revenue_ranking'),
+                                ('avg_clv', 'average CLV', 'clv_ranking'),
+                                ('customer_count', 'customer count', None),
+                                ('avg_rfm_score', 'RFM score', None)):
+        ranked = sorted(summary, key=lambda s: summary[s][metric], reverse=True)
+        add('ranking', f"Segments ranked by {label}: " + " > ".join(
+                f"{s} ({summary[s][metric]:,.2f})" if isinstance(summary[s][metric], float)
+                else f"{s} ({summary[s][metric]:,})" for s in ranked),
+            'compare rank best worst highest lowest versus', name=name)
+
+    by_frequency = sorted(summary, key=lambda s: summary[s]['avg_frequency'])
+    add('behavior', "Purchase frequency by segment: " + ", ".join(
+            f"Segment {s} {summary[s]['avg_frequency']:.1f} purchases" for s in by_frequency) +
+        f" (lowest-frequency segment: {by_frequency[0]}, highest-frequency segment: {by_frequency[-1]})",
+        'low-frequency high-frequency infrequent frequent occasional repeat buyers purchase frequency',
+        name='frequency_profile')
+
+    for segment_id, data in summary.items():
+        add('metrics', f"Segment {segment_id}: {data['customer_count']:,} customers "
+                       f"({data['percentage']:.1f}%), revenue ${data['total_revenue']:,.2f}, "
+                       f"average CLV ${data['avg_clv']:.2f}, RFM score {data['avg_rfm_score']:.1f}/100",
+            'size revenue profit value lifetime performance', [segment_id])
+        add('behavior', f"Segment {segment_id} behavior: average spend ${data['avg_monetary']:.2f}, "
+                        f"{data['avg_frequency']:.1f} purchases, last purchase {data['avg_recency']:.0f} days ago",
+            'buying patterns purchase frequency recency monetary spending habits', [segment_id])
+        add('value_tier', f"Segment {segment_id} value tiers: {data['value_tier_distribution']}",
+            'value tier premium high medium low', [segment_id])
+
+        cells = ', '.join(f"{level} {churn['churn_percentages'][level][segment_id]:.1f}%"
+                          for level in churn['churn_percentages'])
+        add('churn', f"Segment {segment_id} churn risk: {cells}",
+            'churn risk at risk churning retention inactive', [segment_id])
+
+        characteristics = business_logic.get_segment_characteristics(segment_id)
+        top_customers = ', '.join(f"{c['CustomerID']} (${c['Monetary']:,.2f})"
+                                  for c in characteristics['top_customers'])
+        add('top_customers', f"Segment {segment_id} top customers: {top_customers}",
+            'top best biggest customers spenders', [segment_id])
+        patterns = characteristics['behavioral_patterns']
+        add('behavior', f"Segment {segment_id} patterns: {patterns['purchase_frequency_pattern']} frequency, "
+                        f"{patterns['spending_pattern']} spending, {patterns['engagement_level']} engagement",
+            'buying patterns engagement habits', [segment_id])
+
+        for recommendation in business_logic.get_marketing_recommendations(segment_id):
+            add('recommendation', f"Segment {segment_id} recommendation: {recommendation}",
+                'marketing campaign strategy promotion offer', [segment_id])
+
+    return facts
+
+
+class ContextRetriever:
+    """
+    Top-k fact retrieval over the business data
+
+    Facts are indexed once per data version as hashed character n-gram
+    vectors. The overview and the facts the intent relies on
+    (INTENT_REQUIRED_FACTS) are always included. The rest are scored by
+    n-gram similarity to the query; intent-preferred fact kinds and
+    facts about the segments the query mentions are boosted, and facts
+    about other segments are pushed down. The best facts are added until
+    top_k or the token budget is reached, skipping weak matches, and
+    everything is rendered in the original report order.
+    """
+
+    def __init__(self, business_logic: BusinessLogic, count_tokens: Callable[[str], int] = None,
+                 top_k: int = 8, token_budget: int = 300):
+        """
+        Initialize the retriever
+
+        Args:
+            business_logic: Business logic instance the facts come from
+            count_tokens: Token counter for the budget (defaults to ~4 characters per token)
+            top_k: Maximum number of facts per context
+            token_budget: Maximum tokens of facts per context
+        """
+        self.business_logic = business_logic
+        self.count_tokens = count_tokens or (lambda text: -(-len(text) // 4))
+        self.top_k = top_k
+        self.token_budget = token_budget
+        self._version = None
+        self._facts: List[Dict[str, Any]] = []
+        self._index: Optional[HashedNgramIndex] = None
+        self._lock = threading.Lock()
+
+    def _ensure_index(self):
+        """Rebuild the fact index when the data version changed"""
+        with self._lock:
+            if self._version == self.business_logic.data_version:
+                return
+            facts = build_facts(self.business_logic)
+            for fact in facts:
+                fact['tokens'] = self.count_tokens(fact['text']) + 1
+            self._index = HashedNgramIndex([f"{f['text']} {f['keywords']}" for f in facts], NGRAM_RANGE, N_FEATURES)
+            self._facts = facts
+            self._version = self.business_logic.data_version
+            logger.info(f"✅ Context index built: {len(facts)} facts")
+
+    def retrieve(self, user_query: str, intent: str = 'general', segments: List[int] = None,
+                 top_k: int = None, token_budget: int = None) -> List[Dict[str, Any]]:
+        """
+        Select the facts most relevant to a question
+
+        Args:
+            user_query: User's question
+            intent: Detected intent
+            segments: Valid segment numbers mentioned in the query
+            top_k: Maximum number of facts (defaults to self.top_k)
+            token_budget: Maximum tokens of facts (defaults to self.token_budget)
+
+        Returns:
+            Selected facts with their 'score', in report order
+        """
+        self._ensure_index()
+        top_k = top_k or self.top_k
+        token_budget = token_budget or self.token_budget
+        segments = set(segments or [])
+        preferred = INTENT_FACT_KINDS.get(intent, INTENT_FACT_KINDS['general'])
+
+        scores = self._index.scores(user_query)
+        for index, fact in enumerate(self._facts):
+            if fact['kind'] in preferred:
+                scores[index] += INTENT_KIND_BOOST
+            if segments and fact['segments']:
+                scores[index] += SEGMENT_MATCH_BOOST if fact['segments'] & segments else -OTHER_SEGMENT_PENALTY
+
+        # The overview is the frame every other fact refers to; the required facts answer the intent itself
+        selected, used = [0], self._facts[0]['tokens']
+        required = INTENT_REQUIRED_FACTS.get(intent, INTENT_REQUIRED_FACTS['general'])
+        for index, fact in enumerate(self._facts):
+            if fact['name'] in required and used + fact['tokens'] <= token_budget:
+                selected.append(index)
+                used += fact['tokens']
+
+        min_score = max(scores[1:].max(initial=0.0) * MIN_RELATIVE_SCORE, 0.0)
+        for index in np.argsort(-scores, kind='stable'):
+            if len(selected) >= top_k or scores[index] <= min_score:
+                break
+            if index in selected:
+                continue
+            tokens = self._facts[index]['tokens']
+            if used + tokens <= token_budget:
+                selected.append(int(index))
+                used += tokens
+
+        return [dict(self._facts[index], score=float(scores[index])) for index in sorted(selected)]
+
+    def build_context(self, user_query: str, intent: str = 'general', segments: List[int] = None) -> str:
+        """
+        Render the retrieved facts as the prompt's business context
+
+        Args:
+            user_query: User's question
+            intent: Detected intent
+            segments: Valid segment numbers mentioned in the query
+
+        Returns:
+            Bulleted facts relevant to the question
+        """
+        facts = self.retrieve(user_query, intent, segments)
+        return "CUSTOMER SEGMENTATION FACTS:\n" + ''.join(f"• {fact['text']}\n" for fact in facts)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Index size and data version"""
+        return {'facts': len(self._facts), 'data_version': self._version,
+                'top_k': self.top_k, 'token_budget': self.token_budget}
+
+
+def create_context_retriever(business_logic: BusinessLogic,
+                             count_tokens: Callable[[str], int] = None) -> ContextRetriever:
+    """
+    Create a retriever for the business data
+
+    Returns:
+        ContextRetriever
+    """
+    return ContextRetriever(business_logic, count_tokens)
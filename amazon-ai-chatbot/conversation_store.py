@@ -0,0 +1,368 @@
+"""
+Session-Scoped Conversation Store
+Bounded per-session chat memory with idle eviction and an optional SQLite archive or persistent log
+"""
+
+import os
+import re
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CONVERSATION_DB_PATH = os.path.expanduser("~/.cache/amazon-ai-chatbot/conversations.db")
+
+# Session IDs are uuid4 hex strings; anything else from a URL is not a session
+SESSION_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+def is_valid_session_id(session_id: Optional[str]) -> bool:
+    """Whether a session ID (e.g. from a URL) has the format of the IDs the app generates"""
+    return isinstance(session_id, str) and bool(SESSION_ID_PATTERN.match(session_id))
+
+
+class ConversationStore:
+    """
+    Conversation memory keyed by session ID
+
+    Each session keeps its last max_turns_per_session exchanges in a
+    bounded deque. The store as a whole holds at most max_total_messages;
+    the least recently active sessions are evicted to stay under it, as are
+    sessions idle for longer than idle_timeout. With a db_path, messages
+    that fall out of memory are archived to SQLite instead of being lost.
+    With persist=True every message is written to SQLite as it arrives,
+    so conversations survive restarts: a session that is not in memory is
+    reloaded from its latest logged messages, and get_messages() pages
+    through the full log. Clearing a session only hides its logged messages
+    from the conversation (a cleared-before marker); the log keeps them.
+    """
+
+    def __init__(self, max_turns_per_session: int = 10, max_total_messages: int = 50000,
+                 idle_timeout: float = 3600.0, db_path: Optional[str] = None, persist: bool = False):
+        """
+        Initialize the store
+
+        Args:
+            max_turns_per_session: Exchanges (user + assistant message) kept per session
+            max_total_messages: Messages kept in memory across all sessions
+            idle_timeout: Seconds without activity after which a session is evicted (None = never)
+            db_path: SQLite file for archiving messages dropped from memory (None = drop them)
+            persist: Log every message to db_path as it is added, not only dropped ones
+        """
+        self.max_messages_per_session = max_turns_per_session * 2
+        self.max_total_messages = max_total_messages
+        self.idle_timeout = idle_timeout
+        self.persist = persist and db_path is not None
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._total_messages = 0
+        self._lock = threading.Lock()
+        self.stats = {'evicted_sessions': 0, 'archived_messages': 0, 'logged_messages': 0, 'restored_sessions': 0}
+
+        self._db = None
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            # WAL lets several app processes read the log while one writes
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS conversation_turns (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                intent TEXT,
+                outcome TEXT)""")
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(conversation_turns)")}
+            for column in ('intent', 'outcome'):
+                if column not in columns:
+                    self._db.execute(f"ALTER TABLE conversation_turns ADD COLUMN {column} TEXT")
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_turns_session ON conversation_turns (session_id, id)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_turns_time ON conversation_turns (timestamp)")
+            # Messages up to cleared_before are hidden from the session ('*' = every session)
+            self._db.execute("""CREATE TABLE IF NOT EXISTS conversation_clears (
+                session_id TEXT PRIMARY KEY,
+                cleared_before INTEGER NOT NULL)""")
+            self._db.commit()
+
+    def _insert(self, session_id: str, messages: List[Dict]):
+        """Write messages to SQLite (caller holds the lock)"""
+        cursor = None
+        for m in messages:
+            cursor = self._db.execute(
+                "INSERT INTO conversation_turns (session_id, role, content, timestamp, intent, outcome) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, m['role'], m['content'], m['timestamp'].isoformat(), m.get('intent'), m.get('outcome'))
+            )
+            m['id'] = cursor.lastrowid
+        self._db.commit()
+
+    def _archive(self, session_id: str, messages: List[Dict]):
+        """Write messages dropped from memory to SQLite (caller holds the lock)"""
+        # Persisted messages are already in the log
+        if self._db is None or self.persist or not messages:
+            return
+        self._insert(session_id, messages)
+        self.stats['archived_messages'] += len(messages)
+
+    @staticmethod
+    def _row_to_message(row) -> Dict:
+        message_id, role, content, timestamp, intent, outcome = row
+        message = {'id': message_id, 'role': role, 'content': content,
+                   'timestamp': datetime.fromisoformat(timestamp)}
+        if intent is not None:
+            message['intent'] = intent
+        if outcome is not None:
+            message['outcome'] = outcome
+        return message
+
+    def _cleared_before(self, session_id: str) -> int:
+        """ID of the last message hidden by clear() for a session, 0 if never cleared (caller holds the lock)"""
+        row = self._db.execute("SELECT MAX(cleared_before) FROM conversation_clears WHERE session_id IN (?, '*')",
+                               (session_id,)).fetchone()
+        return row[0] or 0
+
+    def _load_session(self, session_id: str, now: float) -> Optional[Dict[str, Any]]:
+        """Restore a persisted session's latest (uncleared) messages into memory (caller holds the lock)"""
+        rows = self._db.execute(
+            "SELECT id, role, content, timestamp, intent, outcome FROM conversation_turns "
+            "WHERE session_id = ? AND id > ? ORDER BY id DESC LIMIT ?",
+            (session_id, self._cleared_before(session_id), self.max_messages_per_session)
+        ).fetchall()
+        if not rows:
+            return None
+        session = {'messages': deque((self._row_to_message(row) for row in reversed(rows)),
+                                     maxlen=self.max_messages_per_session),
+                   'last_active': now}
+        self._sessions[session_id] = session
+        self._total_messages += len(session['messages'])
+        self.stats['restored_sessions'] += 1
+        return session
+
+    def _evict_session(self, session_id: str):
+        """Remove a session from memory, archiving its messages (caller holds the lock)"""
+        session = self._sessions.pop(session_id)
+        self._total_messages -= len(session['messages'])
+        self._archive(session_id, list(session['messages']))
+        self.stats['evicted_sessions'] += 1
+
+    def _enforce_limits(self, now: float):
+        """Evict idle sessions, then least recently active ones over the total cap (caller holds the lock)"""
+        # Sessions are ordered by last activity, so idle ones are at the front
+        while self._sessions and self.idle_timeout is not None:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session['last_active'] < self.idle_timeout:
+                break
+            self._evict_session(session_id)
+
+        while self._total_messages > self.max_total_messages and len(self._sessions) > 1:
+            self._evict_session(next(iter(self._sessions)))
+
+    def add_message(self, session_id: str, role: str, content: str, timestamp: datetime = None,
+                    intent: str = None, outcome: str = None):
+        """
+        Append a message to a session
+
+        Args:
+            session_id: Conversation the message belongs to
+            role: 'user' or 'assistant'
+            content: Message text
+            timestamp: Message time (defaults to now)
+            intent: Detected intent of the question (logged with the message)
+            outcome: How the answer was produced, e.g. 'llm' or 'template' (logged with the message)
+        """
+        now = time.time()
+        message = {'role': role, 'content': content, 'timestamp': timestamp or datetime.now()}
+        if intent is not None:
+            message['intent'] = intent
+        if outcome is not None:
+            message['outcome'] = outcome
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None and self.persist:
+                session = self._load_session(session_id, now)
+            if session is None:
+                session = {'messages': deque(maxlen=self.max_messages_per_session), 'last_active': now}
+                self._sessions[session_id] = session
+            if self.persist:
+                self._insert(session_id, [message])
+                self.stats['logged_messages'] += 1
+
+            messages = session['messages']
+            if len(messages) == messages.maxlen:
+                self._archive(session_id, [messages[0]])
+                self._total_messages -= 1
+            messages.append(message)
+            self._total_messages += 1
+
+            session['last_active'] = now
+            self._sessions.move_to_end(session_id)
+            self._enforce_limits(now)
+
+    def add_exchange(self, session_id: str, user_query: str, assistant_response: str,
+                     intent: str = None, outcome: str = None):
+        """Append a user question and the assistant's answer"""
+        self.add_message(session_id, 'user', user_query, intent=intent)
+        self.add_message(session_id, 'assistant', assistant_response, intent=intent, outcome=outcome)
+
+    def get_history(self, session_id: str) -> List[Dict]:
+        """
+        Recent messages of a session, oldest first
+
+        Returns:
+            Copy of the in-memory messages (empty for unknown or evicted sessions)
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None and self.persist:
+                session = self._load_session(session_id, time.time())
+            if session is None:
+                return []
+            session['last_active'] = time.time()
+            self._sessions.move_to_end(session_id)
+            return list(session['messages'])
+
+    def get_archived(self, session_id: str, limit: int = 100) -> List[Dict]:
+        """
+        Most recent archived messages of a session from SQLite, oldest first
+
+        Returns:
+            Archived messages (empty without a database)
+        """
+        if self._db is None:
+            return []
+        return self.get_messages(session_id, limit)
+
+    def get_messages(self, session_id: str, limit: int = 50, before_id: int = None,
+                     since: datetime = None, include_cleared: bool = False) -> List[Dict]:
+        """
+        One page of a session's logged messages, oldest first
+
+        Pages are read from SQLite through the (session_id, id) index, so
+        the cost depends on the page size, not the conversation length.
+        Without a database the page comes from the in-memory history.
+
+        Args:
+            session_id: Conversation to read
+            limit: Maximum number of messages
+            before_id: Only messages older than this message ID (the next older page)
+            since: Only messages at or after this time
+            include_cleared: Also return messages hidden by clear()
+
+        Returns:
+            Messages with 'id', 'role', 'content', 'timestamp' and, for logged answers, 'intent'/'outcome'
+        """
+        if self._db is None:
+            with self._lock:
+                session = self._sessions.get(session_id)
+                messages = list(session['messages']) if session is not None and before_id is None else []
+            if since is not None:
+                messages = [m for m in messages if m['timestamp'] >= since]
+            return messages[-limit:] if limit > 0 else []
+
+        query = ("SELECT id, role, content, timestamp, intent, outcome FROM conversation_turns "
+                 "WHERE session_id = ?")
+        params = [session_id]
+        if before_id is not None:
+            query += " AND id < ?"
+            params.append(before_id)
+        if since is not None:
+            query += " AND timestamp >= ?"
+            params.append(since.isoformat())
+        with self._lock:
+            if not include_cleared:
+                query += " AND id > ?"
+                params.append(self._cleared_before(session_id))
+            rows = self._db.execute(query + " ORDER BY id DESC LIMIT ?", params + [limit]).fetchall()
+        return [self._row_to_message(row) for row in reversed(rows)]
+
+    def get_sessions(self, since: datetime = None, limit: int = 50) -> List[Dict]:
+        """
+        Logged sessions, most recently active first
+
+        Args:
+            since: Only sessions with messages at or after this time
+            limit: Maximum number of sessions
+
+        Returns:
+            Dicts with 'session_id', 'last_message' and 'messages' (empty without a database)
+        """
+        if self._db is None:
+            return []
+        query = "SELECT session_id, MAX(timestamp), COUNT(*) FROM conversation_turns"
+        params = []
+        if since is not None:
+            query += " WHERE timestamp >= ?"
+            params.append(since.isoformat())
+        with self._lock:
+            rows = self._db.execute(query + " GROUP BY session_id ORDER BY 2 DESC LIMIT ?",
+                                    params + [limit]).fetchall()
+        return [{'session_id': session_id, 'last_message': datetime.fromisoformat(last), 'messages': count}
+                for session_id, last, count in rows]
+
+    def evict_idle(self) -> int:
+        """
+        Evict sessions idle for longer than idle_timeout
+
+        Returns:
+            Number of sessions evicted
+        """
+        with self._lock:
+            before = len(self._sessions)
+            self._enforce_limits(time.time())
+            return before - len(self._sessions)
+
+    def clear(self, session_id: str = None):
+        """
+        Start one session's conversation afresh, or every session's
+
+        In-memory messages are dropped (archived first, with a database).
+        Logged messages are never deleted: a cleared-before marker hides
+        them from the session's history and from get_messages(), so the
+        session is not restored from them, while the log keeps the record.
+
+        Args:
+            session_id: Conversation to clear (None = every session)
+        """
+        with self._lock:
+            cleared = list(self._sessions) if session_id is None else [session_id]
+            for cleared_id in cleared:
+                session = self._sessions.pop(cleared_id, None)
+                if session is not None:
+                    self._total_messages -= len(session['messages'])
+                    self._archive(cleared_id, list(session['messages']))
+
+            if self._db is not None:
+                # Message IDs only grow, so everything logged so far predates the clear
+                last_id = self._db.execute("SELECT MAX(id) FROM conversation_turns").fetchone()[0] or 0
+                self._db.execute("INSERT OR REPLACE INTO conversation_clears (session_id, cleared_before) "
+                                 "VALUES (?, ?)", ('*' if session_id is None else session_id, last_id))
+                self._db.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Session and message counts"""
+        with self._lock:
+            return dict(
+                self.stats,
+                sessions=len(self._sessions),
+                messages=self._total_messages,
+                max_total_messages=self.max_total_messages,
+                archive=self._db is not None,
+                persist=self.persist,
+            )
+
+    def close(self):
+        """Archive in-memory messages (unless already persisted) and close the database"""
+        if self._db is None:
+            return
+        with self._lock:
+            for session_id, session in self._sessions.items():
+                self._archive(session_id, list(session['messages']))
+            self._db.close()
+            self._db = None
@@ -0,0 +1,184 @@
+"""
+Rolling Conversation Summarizer
+Condenses older chat turns into a compact extractive summary, cached per session
+"""
+
+import re
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Tuple, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+NUMBER_PATTERN = re.compile(r'\$?\d[\d,]*(?:\.\d+)?%?')
+SEGMENT_PATTERN = re.compile(r'\bsegment\s+\d+', re.IGNORECASE)
+MARKDOWN_PATTERN = re.compile(r'[*_#`>]+|^[\s•\-–]+', re.MULTILINE)
+SENTENCE_SPLIT_PATTERN = re.compile(r'(?<=[.!?])\s+|\n+')
+
+# Words that mark a sentence as carrying a finding or a recommendation
+KEY_TERMS = ('revenue', 'churn', 'clv', 'lifetime', 'profit', 'recency', 'frequency',
+             'monetary', 'recommend', 'should', 'focus', 'highest', 'lowest', 'risk')
+
+
+def _message_key(message: Dict) -> Tuple:
+    """Stable identity of a message: its log ID, else its timestamp, role and content"""
+    if message.get('id') is not None:
+        return ('id', message['id'])
+    digest = hashlib.sha1(f"{message.get('role')}:{message.get('content')}".encode('utf-8')).hexdigest()
+    return ('message', str(message.get('timestamp')), digest)
+
+
+class ConversationSummarizer:
+    """
+    Rolling extractive summary of older conversation turns
+
+    Recent messages stay verbatim; each message that scrolls out of that
+    window is condensed once into a short line (the question, or the
+    answer's most data-dense sentences) and appended to the session's
+    running summary. The summary is capped at max_summary_chars by dropping
+    its oldest lines, so prompt memory stays bounded however long the
+    conversation gets.
+    """
+
+    def __init__(self, max_summary_chars: int = 600, sentences_per_answer: int = 2,
+                 max_line_chars: int = 160, max_sessions: int = 256):
+        """
+        Initialize the summarizer
+
+        Args:
+            max_summary_chars: Upper bound on the running summary length
+            sentences_per_answer: Sentences kept from each assistant answer
+            max_line_chars: Upper bound on each summarized sentence or question
+            max_sessions: Sessions whose summaries are cached (least recently used are dropped)
+        """
+        self.max_summary_chars = max_summary_chars
+        self.sentences_per_answer = sentences_per_answer
+        self.max_line_chars = max_line_chars
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _clip(self, text: str) -> str:
+        text = ' '.join(text.split())
+        return text if len(text) <= self.max_line_chars else text[:self.max_line_chars - 1].rstrip() + '…'
+
+    def _score_sentence(self, sentence: str) -> int:
+        lowered = sentence.lower()
+        return (2 * len(NUMBER_PATTERN.findall(sentence)) + 2 * len(SEGMENT_PATTERN.findall(sentence)) +
+                sum(term in lowered for term in KEY_TERMS))
+
+    def summarize_message(self, message: Dict) -> Optional[str]:
+        """
+        Condense one message into a summary line
+
+        Args:
+            message: Conversation message with 'role' and 'content'
+
+        Returns:
+            Summary line, or None for messages with nothing worth keeping
+        """
+        content = message.get('content') or ''
+        if message.get('role') == 'user':
+            return f"Q: {self._clip(content)}"
+
+        if message.get('role') != 'assistant':
+            return None
+
+        plain = MARKDOWN_PATTERN.sub('', content)
+        sentences = [s.strip() for s in SENTENCE_SPLIT_PATTERN.split(plain) if len(s.strip()) > 15]
+        scored = [(self._score_sentence(s), i, s) for i, s in enumerate(sentences)]
+        best = sorted(scored, key=lambda item: (-item[0], item[1]))[:self.sentences_per_answer]
+        best = [s for score, i, s in sorted(best, key=lambda item: item[1]) if score > 0]
+        if not best:
+            return None
+        return "A: " + ' '.join(self._clip(s) for s in best)
+
+    def _bound(self, lines: List[str]) -> List[str]:
+        """Drop the oldest lines until the summary fits max_summary_chars"""
+        while lines and sum(len(line) + 1 for line in lines) > self.max_summary_chars:
+            lines.pop(0)
+        return lines
+
+    def summarize(self, session_id: str, history: List[Dict], keep_recent: int) -> Tuple[str, List[Dict]]:
+        """
+        Split history into a running summary and the recent verbatim messages
+
+        Only messages that scrolled out of the recent window since the last
+        call are summarized; the rest comes from the session cache. The
+        cache remembers the last summarized message by its ID (or timestamp
+        and content), not by its position, so it stays valid when the
+        history is a bounded window whose oldest messages roll off.
+
+        Args:
+            session_id: Conversation the history belongs to
+            history: Conversation history (or its most recent window), oldest first
+            keep_recent: Messages kept verbatim at the end of the history
+
+        Returns:
+            Tuple of (summary text, recent messages)
+        """
+        keep_recent = max(keep_recent, 0)
+        older_count = max(len(history) - keep_recent, 0)
+        recent = history[older_count:]
+        if older_count == 0:
+            return "", recent
+
+        with self._lock:
+            state = self._sessions.get(session_id)
+            start = self._resume_position(state, history, older_count)
+            if start is None:
+                # The history was cleared or replaced: rebuild from what is left
+                state = {'lines': [], 'last_key': None, 'last_timestamp': None}
+                start = 0
+
+            for message in history[start:older_count]:
+                line = self.summarize_message(message)
+                if line:
+                    state['lines'].append(line)
+            state['lines'] = self._bound(state['lines'])
+            state['last_key'] = _message_key(history[older_count - 1])
+            state['last_timestamp'] = history[older_count - 1].get('timestamp')
+
+            self._sessions[session_id] = state
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+            return '\n'.join(state['lines']), recent
+
+    @staticmethod
+    def _resume_position(state: Optional[Dict], history: List[Dict], older_count: int) -> Optional[int]:
+        """
+        Index of the first older message not yet in the cached summary
+
+        Returns:
+            Position to resume summarizing from, or None if the cache no longer applies
+        """
+        if state is None:
+            return None
+        last_key = state['last_key']
+        for position in range(older_count - 1, -1, -1):
+            if _message_key(history[position]) == last_key:
+                return position + 1
+        if any(_message_key(message) == last_key for message in history[older_count:]):
+            # Already-summarized messages are back in the recent window: the history shrank
+            return None
+
+        # The last summarized message rolled out of the window: keep the
+        # summary if everything left is newer than it
+        last_timestamp, first_timestamp = state['last_timestamp'], history[0].get('timestamp')
+        if last_timestamp is not None and first_timestamp is not None and first_timestamp > last_timestamp:
+            return 0
+        return None
+
+    def clear(self, session_id: str = None):
+        """Forget one session's summary, or all of them"""
+        with self._lock:
+            if session_id is None:
+                self._sessions.clear()
+            else:
+                self._sessions.pop(session_id, None)
@@ -0,0 +1,84 @@
+"""
+Dashboard Charts
+Plotly figures for the analytics dashboard, built from per-segment aggregates
+"""
+
+import logging
+from typing import Dict
+
+import plotly.express as px
+import plotly.graph_objects as go
+
+from business_logic import BusinessLogic
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def build_dashboard_figures(business_logic: BusinessLogic) -> Dict[str, go.Figure]:
+    """
+    Build the dashboard charts from segment summaries and box-plot quartiles
+
+    No chart carries per-customer rows, so the payload sent to the browser
+    depends on the number of segments, not the number of customers.
+
+    Args:
+        business_logic: Business logic instance providing the data
+
+    Returns:
+        Figures keyed 'segment_pie', 'rfm_bubble' and 'monetary_box'
+    """
+    segment_summary = business_logic.get_segment_summary()
+    distribution = business_logic.get_metric_distribution('Monetary')
+    segments = list(segment_summary.keys())
+
+    segment_pie = px.pie(
+        values=[segment_summary[s]['customer_count'] for s in segments],
+        names=[f"Segment {s}" for s in segments],
+        title="Customer Segments"
+    )
+    segment_pie.update_layout(height=300)
+
+    rfm_bubble = go.Figure()
+    rfm_bubble.add_trace(go.Scatter(
+        x=[segment_summary[s]['avg_recency'] for s in segments],
+        y=[segment_summary[s]['avg_monetary'] for s in segments],
+        mode='markers+text',
+        marker=dict(
+            size=[segment_summary[s]['avg_frequency'] * 5 for s in segments],
+            color=segments,
+            colorscale='viridis',
+            showscale=True
+        ),
+        text=[f"Segment {s}" for s in segments],
+        textposition="middle center",
+        name="Segments"
+    ))
+    rfm_bubble.update_layout(
+        title="RFM Bubble Chart (Size = Frequency)",
+        xaxis_title="Recency (Days)",
+        yaxis_title="Monetary Value ($)",
+        height=400
+    )
+
+    # Precomputed quartiles and whiskers; plotly draws the boxes without the raw values
+    box_segments = list(distribution.keys())
+    monetary_box = go.Figure(go.Box(
+        x=[str(s) for s in box_segments],
+        q1=[distribution[s]['q1'] for s in box_segments],
+        median=[distribution[s]['median'] for s in box_segments],
+        q3=[distribution[s]['q3'] for s in box_segments],
+        lowerfence=[distribution[s]['lower_fence'] for s in box_segments],
+        upperfence=[distribution[s]['upper_fence'] for s in box_segments],
+        mean=[distribution[s]['mean'] for s in box_segments],
+        name="Monetary"
+    ))
+    monetary_box.update_layout(
+        title="Monetary Value by Segment",
+        xaxis_title="Segment",
+        yaxis_title="Monetary Value ($)",
+        height=400
+    )
+
+    return {'segment_pie': segment_pie, 'rfm_bubble': rfm_bubble, 'monetary_box': monetary_box}
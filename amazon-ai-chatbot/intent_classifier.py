@@ -0,0 +1,251 @@
+"""
+Trained Intent Classifier
+Hashed character n-gram linear model, trained offline and shipped as a weights artifact with its evaluation
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+from typing import Any, Dict, List, Tuple, Optional
+
+import numpy as np
+
+from text_features import hashed_ngrams
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+INTENT_EXAMPLES_PATH = os.path.join(_HERE, "intent_examples.csv")
+# Committed artifacts, rebuilt with `python intent_classifier.py` (needs scikit-learn)
+INTENT_CLASSIFIER_PATH = os.path.join(_HERE, "intent_classifier.npz")
+INTENT_EVALUATION_PATH = os.path.join(_HERE, "intent_classifier_eval.json")
+
+# Hashing space and n-gram range; changing either invalidates saved artifacts
+N_FEATURES = 2 ** 14
+NGRAM_RANGE = (2, 5)
+
+
+def _examples_fingerprint(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read() + f"{N_FEATURES}:{NGRAM_RANGE}".encode()).hexdigest()
+
+
+class IntentClassifier:
+    """
+    Linear intent classifier over hashed character n-grams
+
+    The model is a weight matrix over a fixed hashing space, so the stored
+    artifact is only the weights, biases and class names, and inference
+    needs nothing but numpy: each query's n-gram weights pick and sum rows
+    of the weight matrix, and the softmax probability of the best class is
+    its confidence. Training (offline, see main()) uses scikit-learn.
+    """
+
+    def __init__(self, classes: List[str], coef: np.ndarray, intercept: np.ndarray, fingerprint: str = ''):
+        """
+        Initialize from trained weights
+
+        Args:
+            classes: Intent names, one per row of coef
+            coef: Weight matrix of shape (n_classes, N_FEATURES)
+            intercept: Bias per class
+            fingerprint: Identity of the training data the weights came from
+        """
+        self.classes = list(classes)
+        self.coef_t = np.ascontiguousarray(coef.T, dtype=np.float32)
+        self.intercept = intercept.astype(np.float32)
+        self.fingerprint = fingerprint
+        self.evaluation: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def train(cls, queries: List[str], intents: List[str], fingerprint: str = '') -> 'IntentClassifier':
+        """
+        Fit a multinomial logistic regression on labeled queries (offline only)
+
+        Args:
+            queries: Example user queries
+            intents: Intent label per query
+            fingerprint: Identity of the training data (stored with the artifact)
+
+        Returns:
+            Trained classifier
+        """
+        from scipy.sparse import csr_matrix
+        from sklearn.linear_model import LogisticRegression
+
+        rows = [hashed_ngrams(query, NGRAM_RANGE, N_FEATURES) for query in queries]
+        features = csr_matrix((np.concatenate([values for _, values in rows]),
+                               np.concatenate([indices for indices, _ in rows]),
+                               np.cumsum([0] + [len(indices) for indices, _ in rows])),
+                              shape=(len(queries), N_FEATURES))
+        model = LogisticRegression(C=10.0, max_iter=2000)
+        model.fit(features, intents)
+        return cls(list(model.classes_), model.coef_, model.intercept_, fingerprint)
+
+    def save(self, path: str = INTENT_CLASSIFIER_PATH):
+        """Write the weights as a compressed .npz artifact"""
+        with open(path + '.tmp', 'wb') as f:
+            np.savez_compressed(f, classes=np.array(self.classes), coef=self.coef_t.T,
+                                intercept=self.intercept, fingerprint=np.array(self.fingerprint))
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path: str = INTENT_CLASSIFIER_PATH) -> 'IntentClassifier':
+        """Load weights saved by save()"""
+        with np.load(path) as artifact:
+            return cls([str(c) for c in artifact['classes']], artifact['coef'], artifact['intercept'],
+                       str(artifact['fingerprint']))
+
+    def classify_batch(self, queries: List[str]) -> List[Tuple[str, float]]:
+        """
+        Classify many queries at once
+
+        Args:
+            queries: User queries
+
+        Returns:
+            (intent, confidence) per query, confidence in [0, 1]
+        """
+        if not queries:
+            return []
+        # Sparse rows in CSR form: concatenated feature ids and weights plus each row's start offset
+        rows = [hashed_ngrams(query, NGRAM_RANGE, N_FEATURES) for query in queries]
+        lengths = np.fromiter((len(indices) for indices, _ in rows), dtype=np.int64, count=len(rows))
+        indices = np.concatenate([indices for indices, _ in rows])
+        values = np.concatenate([values for _, values in rows])
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+
+        # X @ coef for the whole batch: one gather of the used weight rows, scaled and summed per query
+        scores = np.tile(self.intercept, (len(queries), 1))
+        nonempty = lengths > 0
+        if nonempty.any():
+            weighted = self.coef_t[indices] * values[:, None]
+            scores[nonempty] += np.add.reduceat(weighted, starts[nonempty], axis=0)
+        scores -= scores.max(axis=1, keepdims=True)
+        probabilities = np.exp(scores)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+        best = probabilities.argmax(axis=1)
+        confidence = probabilities[np.arange(len(queries)), best]
+        return [(self.classes[index], float(conf)) for index, conf in zip(best, confidence)]
+
+    def classify(self, query: str) -> Tuple[str, float]:
+        """Classify one query, returning (intent, confidence)"""
+        return self.classify_batch([query])[0]
+
+
+def load_intent_classifier(artifact_path: str = INTENT_CLASSIFIER_PATH,
+                           evaluation_path: str = INTENT_EVALUATION_PATH,
+                           examples_path: str = INTENT_EXAMPLES_PATH) -> Optional[IntentClassifier]:
+    """
+    Load the committed classifier if its evaluation shows it beats the regex matcher
+
+    Nothing is trained at runtime. The artifact's held-out evaluation
+    (written by main()) must show higher accuracy for the classifier with
+    regex fallback than for the regex matcher alone; otherwise the ~50x
+    cheaper regex matcher is used on its own.
+
+    Returns:
+        IntentClassifier with its evaluation, or None to use regex intents only
+    """
+    try:
+        classifier = IntentClassifier.load(artifact_path)
+        with open(evaluation_path) as f:
+            evaluation = json.load(f)
+    except (OSError, KeyError, ValueError) as e:
+        logger.warning(f"⚠️ Intent classifier artifact unavailable ({str(e)}); using regex intents only")
+        return None
+
+    if evaluation.get('fingerprint') != classifier.fingerprint:
+        logger.warning("⚠️ Intent classifier evaluation does not match its artifact; using regex intents only")
+        return None
+    try:
+        if _examples_fingerprint(examples_path) != classifier.fingerprint:
+            logger.warning("⚠️ intent_examples.csv changed since the classifier was trained; "
+                           "run `python intent_classifier.py` to retrain")
+    except OSError:
+        pass
+
+    if evaluation['combined_accuracy'] <= evaluation['regex_accuracy']:
+        logger.info(f"Intent classifier ({evaluation['combined_accuracy']:.1%}) does not beat the regex "
+                    f"matcher ({evaluation['regex_accuracy']:.1%}) on held-out queries; using regex intents only")
+        return None
+
+    classifier.evaluation = evaluation
+    logger.info(f"✅ Intent classifier loaded: {evaluation['combined_accuracy']:.1%} held-out accuracy "
+                f"vs {evaluation['regex_accuracy']:.1%} for regex alone")
+    return classifier
+
+
+def evaluate_intent_classifier(classifier: IntentClassifier, queries: List[str], labels: List[str]) -> Dict[str, Any]:
+    """
+    Held-out accuracy and per-query cost of the classifier against the regex matcher
+
+    Args:
+        classifier: Classifier to evaluate
+        queries: Held-out queries
+        labels: Intent per query
+
+    Returns:
+        Evaluation dict stored next to the artifact
+    """
+    from chatbot_controller import ChatbotController
+
+    controller = ChatbotController()
+    controller.intent_classifier = classifier
+
+    def accuracy(predicted: List[str]) -> float:
+        return round(sum(p == label for p, label in zip(predicted, labels)) / len(labels), 4)
+
+    def microseconds_per_query(run) -> float:
+        started = time.perf_counter()
+        for query in queries:
+            run(query)
+        return round((time.perf_counter() - started) / len(queries) * 1e6, 1)
+
+    return {
+        'fingerprint': classifier.fingerprint,
+        'test_queries': len(queries),
+        'regex_accuracy': accuracy([intent for intent, _ in controller.intent_matcher.scan_batch(queries)]),
+        'classifier_accuracy': accuracy([intent for intent, _ in classifier.classify_batch(queries)]),
+        'combined_accuracy': accuracy(controller.classify_intents(queries)),
+        'confidence_threshold': controller.intent_confidence_threshold,
+        'regex_us_per_query': microseconds_per_query(controller.intent_matcher.scan),
+        'classifier_us_per_query': microseconds_per_query(classifier.classify),
+        'trained_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def main():
+    """Train on the 'train' split, evaluate on the 'test' split and write both artifacts"""
+    import pandas as pd
+
+    examples = pd.read_csv(INTENT_EXAMPLES_PATH)
+    train, test = examples[examples['split'] == 'train'], examples[examples['split'] == 'test']
+    classifier = IntentClassifier.train(train['query'].tolist(), train['intent'].tolist(),
+                                        _examples_fingerprint(INTENT_EXAMPLES_PATH))
+    evaluation = evaluate_intent_classifier(classifier, test['query'].tolist(), test['intent'].tolist())
+    evaluation['train_queries'] = len(train)
+
+    classifier.save(INTENT_CLASSIFIER_PATH)
+    with open(INTENT_EVALUATION_PATH, 'w') as f:
+        json.dump(evaluation, f, indent=2)
+        f.write('\n')
+
+    print(f"✅ Trained on {len(train)} queries, evaluated on {len(test)} held-out queries")
+    print(f"   • regex matcher:         {evaluation['regex_accuracy']:.1%} "
+          f"({evaluation['regex_us_per_query']} µs/query)")
+    print(f"   • classifier:            {evaluation['classifier_accuracy']:.1%} "
+          f"({evaluation['classifier_us_per_query']} µs/query)")
+    print(f"   • classifier + fallback: {evaluation['combined_accuracy']:.1%}")
+    print(f"   Saved {INTENT_CLASSIFIER_PATH} and {INTENT_EVALUATION_PATH}")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
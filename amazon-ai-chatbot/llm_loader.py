@@ -4,26 +4,106 @@ Handles loading and inference with Mistral-7B-Instruct GGUF model
 """
 
 import os
+import time
+import asyncio
 import logging
-from typing import Optional, List, Dict
-import streamlit as st
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Optional, List, Dict, Any, Callable, Tuple
 
-try:
-    from llama_cpp import Llama
-except ImportError:
-    st.error("❌ llama-cpp-python not installed. Run: pip install llama-cpp-python")
-    st.stop()
+from llm_pool import LLMWorkerPool, stream_completion
+from llm_server import LLMServerClient
+from autotune import detect_cpu_topology, load_tuned_config, auto_tune as run_auto_tune
+from speculative import GGUFDraftModel
+from conversation_summary import ConversationSummarizer
+from model_variants import discover_model_variants, select_model_variant
+from telemetry import InferenceTelemetry
+from session_state import SessionStateCache, SESSION_STATE_DIR
+from structured_output import BUSINESS_ANSWER_GBNF, STRUCTURED_PROMPT_INSTRUCTIONS, parse_structured_response
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+LLAMA_CPP_INSTALL_HINT = "llama-cpp-python not installed. Run: pip install llama-cpp-python"
+
+# Sign-offs no answer needs; generation stops before them
+SIGN_OFF_STOPS = ["\n\nLet me know", "\n\nI hope", "\n\nFeel free", "\n\nIf you have any"]
+# Short factual answers also end after the recommendations, before any closing summary
+CLOSING_SUMMARY_STOPS = SIGN_OFF_STOPS + ["\n\nOverall", "\n\nIn summary", "\n\nIn conclusion",
+                                          "\n\nTo summarize"]
+
+
+def _import_llama():
+    """
+    Import the Llama class on first use
+    
+    Keeps llama_cpp (and its native library) out of module import so the
+    analytics side works without it.
+    
+    Returns:
+        The llama_cpp.Llama class
+    """
+    try:
+        from llama_cpp import Llama
+    except ImportError as e:
+        raise ImportError(LLAMA_CPP_INSTALL_HINT) from e
+    return Llama
+
+
 class LLMLoader:
     """
     Handles loading and inference with local GGUF models
     Optimized for CPU usage with Mistral-7B-Instruct
     """
     
+    # Conservative estimate used when no tokenizer is available (numbers tokenize per digit)
+    CHARS_PER_TOKEN_ESTIMATE = 3
+    
+    PROMPT_TEMPLATE = """[INST] You are an expert business analyst specializing in customer segmentation and marketing strategy. You have access to real customer data and must provide data-driven insights.
+
+CUSTOMER SEGMENTATION DATA:
+{context_data}
+
+CONVERSATION HISTORY:
+{conversation_context}
+
+CURRENT QUESTION: {user_query}
+
+{instructions}
+
+Respond now: [/INST]"""
+    
+    PROMPT_INSTRUCTIONS = """INSTRUCTIONS:
+1. Analyze the provided customer data thoroughly
+2. Provide specific, data-backed insights (use actual numbers from the data)
+3. Explain business reasoning behind patterns
+4. Give actionable marketing recommendations
+5. Use professional business language
+6. Structure your response clearly with headers
+7. Do NOT make up data - only use the provided information
+
+RESPONSE FORMAT:
+📊 **Data Analysis**
+[Specific findings from the data]
+
+🧠 **Business Insights**
+[Why these patterns exist]
+
+🎯 **Recommendations**
+[Actionable strategies]"""
+    
+    # Extra seconds to wait past a deadline for a worker or server to return its partial text
+    DEADLINE_GRACE_SECONDS = 2.0
+    
+    # Follow-up turn appended to a session's transcript so its KV cache is reused
+    FOLLOWUP_TURN_TEMPLATE = """ [INST] {context_block}CURRENT QUESTION: {user_query}
+
+{instructions} [/INST]"""
+    
+    COMPACT_PROMPT_INSTRUCTIONS = """Use only the numbers above. Answer with 📊 **Data Analysis**, 🧠 **Business Insights** and 🎯 **Recommendations** sections."""
+    
     def __init__(self, model_path: str = None):
         """
         Initialize the LLM loader
@@ -31,14 +111,19 @@ class LLMLoader:
         Args:
             model_path: Path to the GGUF model file
         """
-        self.model_path = model_path or self._find_model_path()
-        self.llm: Optional[Llama] = None
+        self.llm: Optional[Any] = None
         self.is_loaded = False
+        self._load_lock = threading.Lock()
+        self._preload_lock = threading.Lock()
+        self._load_thread: Optional[threading.Thread] = None
+        self.load_status = {'state': 'not_started', 'progress': 0.0, 'message': 'Model not loaded', 'error': None}
+        self.cpu_topology = detect_cpu_topology()
+        self.tuned_config: Optional[Dict] = None
         
         # Model configuration optimized for CPU
         self.config = {
             'n_ctx': 2048,          # Context window
-            'n_threads': 4,         # CPU threads (adjust based on your CPU)
+            'n_threads': self.cpu_topology['physical_cores'],  # CPU threads (overridden by a tuned config)
             'n_gpu_layers': 0,      # Use CPU only
             'verbose': False,       # Reduce output
             'use_mmap': True,       # Memory mapping for efficiency
@@ -48,8 +133,109 @@ class LLMLoader:
             'top_p': 0.9,          # Nucleus sampling
             'top_k': 40,           # Top-k sampling
             'repeat_penalty': 1.1,  # Prevent repetition
-            'max_tokens': 512,      # Max response length
+            'max_tokens': 512,      # Max response length (default profile)
+            'generation_profiles': {  # Per-intent limits; factual questions need far fewer tokens
+                'business_metrics':   {'max_tokens': 256, 'temperature': 0.3, 'stop': CLOSING_SUMMARY_STOPS},
+                'segment_analysis':   {'max_tokens': 320, 'temperature': 0.5, 'stop': CLOSING_SUMMARY_STOPS},
+                'comparison':         {'max_tokens': 320, 'temperature': 0.4, 'stop': CLOSING_SUMMARY_STOPS},
+                'churn_analysis':     {'max_tokens': 384, 'temperature': 0.6, 'stop': SIGN_OFF_STOPS},
+                'customer_behavior':  {'max_tokens': 384, 'temperature': 0.6, 'stop': SIGN_OFF_STOPS},
+                'marketing_strategy': {'max_tokens': 512, 'temperature': 0.7, 'stop': SIGN_OFF_STOPS},
+                'general':            {'max_tokens': 384, 'temperature': 0.7, 'stop': SIGN_OFF_STOPS},
+            },
+            'early_stop': True,     # Stop once the required answer sections are complete
+            'required_sections': ['data analysis', 'business insights', 'recommendations'],
+            'backend': 'local',     # 'local' loads the model here, 'server' uses a shared model server
+            'server_url': 'http://127.0.0.1:8080',  # Model server URL (http://host:port or unix:///path.sock)
+            'server_pool_size': 4,  # Persistent connections kept open to the model server
+            'server_timeout': 300,  # Seconds to wait for the server (startup and per request)
+            'pool_size': 0,         # Worker processes (0 = single in-process model)
+            'pool_threads_per_worker': None,  # Threads per worker (None = split n_threads evenly)
+            'draft_model_path': None,  # Small GGUF model for speculative decoding (None = off)
+            'draft_lookahead': 4,   # Tokens the draft model proposes per step
+            'structured_output': False,  # Grammar-constrained JSON answers rendered by the app
+            'structured_max_tokens': 384,  # Max JSON answer length (the grammar keeps answers compact)
+            'latency_target_ms': None,  # Pick the best quantization variant within this answer latency
+            'memory_cap_mb': None,  # Pick the best quantization variant within this memory
+            'use_tuned_config': True,  # Apply the persisted auto-tune result for this host/model
+            'auto_tune': False,     # Calibrate threads/batch on first load if no tuned config exists
+            'session_state_reuse': True,  # Keep each conversation's KV cache across turns (in-process model)
+            'session_state_memory_mb': 1024,  # Memory cap for snapshots of inactive sessions
+            'session_state_dir': SESSION_STATE_DIR,  # Evicted/saved session states (None = don't persist)
+            'session_state_disk_mb': 4096,  # Disk cap for saved session states (least recently used deleted)
+            'max_history_turns': 2, # Recent messages kept verbatim; older ones are summarized
+            'prompt_budget_split': {  # Share of the prompt budget (n_ctx - max_tokens); context gets the rest
+                'history': 0.25,
+                'instructions': 0.25,
+            },
         }
+        self.pool: Optional[LLMWorkerPool] = None
+        self.client: Optional[LLMServerClient] = None
+        self._generate_lock = threading.Lock()
+        self._inference_executor: Optional[ThreadPoolExecutor] = None
+        self.draft_model: Optional[GGUFDraftModel] = None
+        self.last_generation_stats: Dict = {}
+        self.telemetry = InferenceTelemetry()
+        self._structured_grammar = None
+        self._tokenizer = None
+        self._tokenizer_failed = False
+        self.last_prompt_usage: Dict = {}
+        self.summarizer = ConversationSummarizer()
+        self.session_states = SessionStateCache(
+            max_memory_mb=self.config['session_state_memory_mb'],
+            spill_dir=self.config['session_state_dir'],
+            max_disk_mb=self.config['session_state_disk_mb']
+        )
+        self._active_session: Optional[str] = None
+        self._pending_session_context: Dict[str, str] = {}
+        self.model_variant: Optional[Dict] = None
+        self.model_path = model_path or self._select_model_path()
+    
+    def _select_model_path(self) -> str:
+        """
+        Choose among local quantization variants (Q3/Q4/Q5...) of the model
+        
+        Picks the highest-quality variant within the configured latency
+        target and memory cap, falling back to the known file names.
+        
+        Returns:
+            Path to the model file
+        """
+        variants = discover_model_variants(family="mistral-7b-instruct")
+        variant = select_model_variant(
+            variants,
+            latency_target_ms=self.config['latency_target_ms'],
+            memory_cap_mb=self.config['memory_cap_mb'],
+            n_ctx=self.config['n_ctx']
+        )
+        if variant is None:
+            return self._find_model_path()
+        
+        self.model_variant = variant
+        logger.info(f"Selected model variant {variant['quant']} ({variant['size_mb']:.0f} MB) of {len(variants)}: {variant['path']}")
+        return variant['path']
+    
+    def choose_model_variant(self, latency_target_ms: float = None, memory_cap_mb: float = None) -> str:
+        """
+        Re-select the quantization variant for new constraints
+        
+        Takes effect on the next load; call before load_model().
+        
+        Args:
+            latency_target_ms: Maximum latency for a typical answer
+            memory_cap_mb: Maximum resident memory for the model
+            
+        Returns:
+            Path to the selected model file
+        """
+        self.config['latency_target_ms'] = latency_target_ms
+        self.config['memory_cap_mb'] = memory_cap_mb
+        if self.is_loaded:
+            logger.warning("Model already loaded; unload it to switch variants")
+            return self.model_path
+        
+        self.model_path = self._select_model_path()
+        return self.model_path
     
     def _find_model_path(self) -> str:
         """
@@ -77,6 +263,11 @@ class LLMLoader:
         logger.warning(f"Model not found. Expected at: {default_path}")
         return default_path
     
+    def _set_load_status(self, state: str, progress: float, message: str, error: str = None):
+        """Record model loading progress for the UI"""
+        self.load_status = {'state': state, 'progress': progress, 'message': message, 'error': error}
+        logger.info(f"Model load [{int(progress * 100)}%]: {message}")
+    
     def load_model(self) -> bool:
         """
         Load the GGUF model into memory
@@ -84,77 +275,673 @@ class LLMLoader:
         Returns:
             True if successful, False otherwise
         """
-        if self.is_loaded:
-            return True
+        with self._load_lock:
+            if self.is_loaded:
+                return True
+            
+            if self.config['backend'] == 'server':
+                return self._connect_server()
+            
+            if not os.path.exists(self.model_path):
+                logger.error(f"Model file not found: {self.model_path}")
+                self._set_load_status('failed', 0.0, 'Model file not found', f"Model file not found: {self.model_path}")
+                return False
+            
+            try:
+                self._set_load_status('loading', 0.05, 'Importing llama-cpp-python')
+                Llama = _import_llama()
+            except ImportError as e:
+                logger.error(f"❌ {str(e)}")
+                self._set_load_status('failed', 0.0, 'llama-cpp-python not installed', str(e))
+                return False
+            
+            self._set_load_status('loading', 0.1, 'Applying CPU configuration')
+            self._apply_tuned_config()
+            
+            if self.config['pool_size'] > 0:
+                self._set_load_status('loading', 0.2, f"Starting {self.config['pool_size']} model workers")
+                if not self._start_pool():
+                    self._set_load_status('failed', 0.0, 'No model worker could load the model', 'LLM pool failed to start')
+                    return False
+                self._set_load_status('ready', 1.0, 'Model ready')
+                return True
+            
+            try:
+                logger.info(f"Loading model from: {self.model_path}")
+                logger.info("This may take a few minutes on first load...")
+                self._set_load_status('loading', 0.2, 'Loading model weights')
+                
+                self.draft_model = self._load_draft_model()
+                self.llm = Llama(model_path=self.model_path, draft_model=self.draft_model, **self._llama_kwargs())
+                
+                if self.draft_model is not None and self.draft_model.n_vocab != self.llm.n_vocab():
+                    logger.warning("⚠️ Draft model vocabulary does not match the main model, speculative decoding disabled")
+                    self.llm.draft_model = None
+                    self.draft_model = None
+                
+                # Evaluate one token so the first real request doesn't page the weights in
+                self._set_load_status('loading', 0.9, 'Warming up')
+                self.llm.eval(self.llm.tokenize(b" "))
+                self.llm.reset()
+                
+                self.is_loaded = True
+                self._set_load_status('ready', 1.0, 'Model ready')
+                logger.info("✅ Model loaded successfully!")
+                return True
+                
+            except Exception as e:
+                logger.error(f"❌ Failed to load model: {str(e)}")
+                self.llm = None
+                self._set_load_status('failed', 0.0, 'Failed to load model', str(e))
+                return False
+    
+    def start_background_load(self) -> threading.Thread:
+        """
+        Load the model in a background thread
         
-        if not os.path.exists(self.model_path):
-            logger.error(f"Model file not found: {self.model_path}")
-            return False
+        Safe to call repeatedly: a load that is running, finished or failed is not restarted.
+        Progress is available from get_load_status().
+        
+        Returns:
+            The loader thread
+        """
+        with self._preload_lock:
+            if not self.is_loaded and not self.is_loading() and self.load_status['state'] == 'not_started':
+                self._set_load_status('loading', 0.0, 'Queued for loading')
+                self._load_thread = threading.Thread(target=self.load_model, name='llm-preload', daemon=True)
+                self._load_thread.start()
+        return self._load_thread
+    
+    def is_loading(self) -> bool:
+        """Whether a background load is in progress"""
+        return self._load_thread is not None and self._load_thread.is_alive()
+    
+    def get_load_status(self) -> Dict:
+        """
+        Get model loading progress
+        
+        Returns:
+            Dictionary with state (not_started/loading/ready/failed), progress (0-1), message and error
+        """
+        return dict(self.load_status)
+    
+    def _load_draft_model(self) -> Optional[GGUFDraftModel]:
+        """
+        Load the speculative decoding draft model if one is configured
+        
+        Only used for the in-process model; pool workers decode without a draft.
+        
+        Returns:
+            Draft model, or None if disabled or unavailable
+        """
+        draft_path = self.config['draft_model_path']
+        if not draft_path:
+            return None
+        
+        if not os.path.exists(draft_path):
+            logger.warning(f"⚠️ Draft model not found: {draft_path}, speculative decoding disabled")
+            return None
         
         try:
-            logger.info(f"Loading model from: {self.model_path}")
-            logger.info("This may take a few minutes on first load...")
-            
-            self.llm = Llama(
-                model_path=self.model_path,
+            self._set_load_status('loading', 0.15, 'Loading draft model')
+            return GGUFDraftModel(
+                draft_path,
+                lookahead=self.config['draft_lookahead'],
                 n_ctx=self.config['n_ctx'],
                 n_threads=self.config['n_threads'],
-                n_gpu_layers=self.config['n_gpu_layers'],
-                verbose=self.config['verbose'],
-                use_mmap=self.config['use_mmap'],
-                use_mlock=self.config['use_mlock'],
                 n_batch=self.config['n_batch']
             )
-            
-            self.is_loaded = True
-            logger.info("✅ Model loaded successfully!")
-            return True
-            
         except Exception as e:
-            logger.error(f"❌ Failed to load model: {str(e)}")
+            logger.warning(f"⚠️ Failed to load draft model, speculative decoding disabled: {str(e)}")
+            return None
+    
+    def _apply_tuned_config(self):
+        """Use the persisted auto-tune result for this host and model, calibrating first if enabled"""
+        if not self.config['use_tuned_config'] and not self.config['auto_tune']:
+            return
+        
+        entry = load_tuned_config(self.model_path)
+        if entry is None and self.config['auto_tune']:
+            entry = self.auto_tune()
+        
+        if entry is not None:
+            self.config['n_threads'] = entry['n_threads']
+            self.config['n_batch'] = entry['n_batch']
+            self.tuned_config = entry
+            logger.info(f"Using tuned config: n_threads={entry['n_threads']}, n_batch={entry['n_batch']}")
+    
+    def auto_tune(self) -> Optional[Dict]:
+        """
+        Benchmark thread/batch settings on this CPU and persist the best
+        
+        Returns:
+            Tuned config entry, or None if calibration failed
+        """
+        base_kwargs = self._llama_kwargs()
+        del base_kwargs['n_threads'], base_kwargs['n_batch']
+        return run_auto_tune(self.model_path, base_kwargs)
+    
+    def _llama_kwargs(self, n_threads: int = None) -> Dict:
+        """
+        Build the Llama constructor arguments from the config
+        
+        Args:
+            n_threads: Override for the CPU thread count
+            
+        Returns:
+            Keyword arguments for Llama()
+        """
+        return {
+            'n_ctx': self.config['n_ctx'],
+            'n_threads': n_threads or self.config['n_threads'],
+            'n_gpu_layers': self.config['n_gpu_layers'],
+            'verbose': self.config['verbose'],
+            'use_mmap': self.config['use_mmap'],
+            'use_mlock': self.config['use_mlock'],
+            'n_batch': self.config['n_batch']
+        }
+    
+    def _start_pool(self) -> bool:
+        """
+        Start the multi-process worker pool
+        
+        Each worker maps the same GGUF file (use_mmap), so the weights are
+        shared through the page cache and the configured (or tuned) thread
+        count is split between workers.
+        
+        Returns:
+            True if at least one worker loaded the model, False otherwise
+        """
+        pool_size = self.config['pool_size']
+        threads_per_worker = self.config['pool_threads_per_worker'] or max(1, self.config['n_threads'] // pool_size)
+        llama_kwargs = self._llama_kwargs(n_threads=threads_per_worker)
+        llama_kwargs['use_mmap'] = True
+        
+        logger.info(f"Starting LLM pool: {pool_size} workers x {threads_per_worker} threads")
+        self.pool = LLMWorkerPool(self.model_path, llama_kwargs, num_workers=pool_size)
+        if not self.pool.start():
+            self.pool = None
             return False
+        
+        self.is_loaded = True
+        return True
     
-    def generate_response(self, prompt: str, max_tokens: int = None) -> str:
+    def _connect_server(self) -> bool:
         """
-        Generate a response using the loaded model
+        Use a shared model server instead of loading the model in this process
+        
+        Returns:
+            True if the server is reachable and its model is loaded, False otherwise
+        """
+        server_url = self.config['server_url']
+        self._set_load_status('loading', 0.2, f"Waiting for model server at {server_url}")
+        self.client = LLMServerClient(
+            server_url,
+            pool_size=self.config['server_pool_size'],
+            timeout=self.config['server_timeout']
+        )
+        
+        if not self.client.wait_until_ready(timeout=self.config['server_timeout']):
+            self.client.close()
+            self.client = None
+            self._set_load_status('failed', 0.0, 'Model server unavailable', f"No ready model server at {server_url}")
+            return False
+        
+        self.is_loaded = True
+        self._set_load_status('ready', 1.0, 'Model server ready')
+        logger.info(f"✅ Connected to model server at {server_url}")
+        return True
+    
+    def _generation_kwargs(self, max_tokens: int = None, intent: str = None) -> Dict:
+        """
+        Build the sampling arguments for a completion call
+        
+        Args:
+            max_tokens: Maximum tokens to generate (overrides the intent profile)
+            intent: Query intent selecting a profile from config['generation_profiles']
+            
+        Returns:
+            Keyword arguments for the Llama call
+        """
+        profile = self.config['generation_profiles'].get(intent, {}) if intent else {}
+        generation_kwargs = {
+            'max_tokens': max_tokens or profile.get('max_tokens', self.config['max_tokens']),
+            'temperature': profile.get('temperature', self.config['temperature']),
+            'top_p': self.config['top_p'],
+            'top_k': self.config['top_k'],
+            'repeat_penalty': self.config['repeat_penalty'],
+            'stop': ["</s>", "[INST]", "[/INST]"] + profile.get('stop', []),  # Stop tokens for Mistral
+            'echo': False  # Don't echo the prompt
+        }
+        if intent and self.config['early_stop']:
+            generation_kwargs['early_stop_sections'] = profile.get('sections', self.config['required_sections'])
+        return generation_kwargs
+    
+    def _ensure_loaded(self) -> Optional[str]:
+        """
+        Make sure the model is available for generation
+        
+        Returns:
+            None if ready, otherwise a user-facing error message
+        """
+        if self.is_loaded:
+            return None
+        if self.is_loading():
+            return "⏳ The model is still loading. Please try again in a moment."
+        if not self.load_model():
+            return "❌ Error: Model not loaded. Please check the model path and try again."
+        return None
+    
+    @staticmethod
+    def _stopped_response(finish_reason: str) -> Dict:
+        """Empty completion for a request that stopped before any text was generated"""
+        return {'choices': [{'text': '', 'finish_reason': finish_reason}],
+                'usage': {'prompt_tokens': 0, 'completion_tokens': 0}}
+    
+    def _acquire_generate_lock(self, deadline: float = None,
+                               cancel_event: threading.Event = None) -> Optional[str]:
+        """
+        Wait for the in-process model without outliving the deadline
+        
+        Returns:
+            None once the lock is held, otherwise 'deadline' or 'cancelled'
+        """
+        while True:
+            wait = 0.1
+            if deadline is not None:
+                wait = min(wait, deadline - time.time())
+                if wait <= 0:
+                    return 'deadline'
+            if self._generate_lock.acquire(timeout=wait):
+                return None
+            if cancel_event is not None and cancel_event.is_set():
+                return 'cancelled'
+    
+    def _wait_for_pool(self, prompt: str, generation_kwargs: Dict, deadline: float = None,
+                       cancel_event: threading.Event = None) -> Dict:
+        """
+        Run a pool completion, giving up at the deadline or on cancellation
+        
+        The worker stops generating at the same deadline. Giving up cancels
+        the pool job, so a queued job never starts and a running one stops
+        at its next token, freeing the worker.
+        """
+        future = self.pool.submit(prompt, deadline=deadline, **generation_kwargs)
+        while True:
+            try:
+                return future.result(timeout=0.1)
+            except FutureTimeoutError:
+                if cancel_event is not None and cancel_event.is_set():
+                    future.cancel()
+                    return self._stopped_response('cancelled')
+                if deadline is not None and time.time() >= deadline + self.DEADLINE_GRACE_SECONDS:
+                    future.cancel()
+                    return self._stopped_response('deadline')
+    
+    def _run_completion(self, prompt: str, generation_kwargs: Dict, deadline: float = None,
+                        cancel_event: threading.Event = None,
+                        on_text: Callable[[str], None] = None, session_id: str = None) -> Dict:
+        """
+        Run a completion on the in-process model, worker pool or model server and record its stats
+        
+        Args:
+            prompt: Input prompt for the model
+            generation_kwargs: Keyword arguments for the Llama call
+            deadline: Absolute time.time() at which to stop generating
+            cancel_event: Set to abandon the request
+            on_text: Called with the text so far as tokens arrive (in-process model only)
+            session_id: Conversation whose KV state to use and extend (in-process model only)
+            
+        Returns:
+            Raw llama.cpp completion dict; finish_reason is 'deadline' or
+            'cancelled' when generation stopped early
+        """
+        draft_usage = None
+        start_time = time.perf_counter()
+        request_started_at = time.time()
+        bounded = deadline is not None or cancel_event is not None or on_text is not None
+        
+        # Generate response (through the model server or worker pool when enabled)
+        if self.client is not None:
+            timeout = None
+            if deadline is not None:
+                # The server stops at the deadline too; the grace lets its partial text arrive
+                generation_kwargs = dict(generation_kwargs, deadline=deadline)
+                timeout = max(deadline - time.time(), 0.0) + self.DEADLINE_GRACE_SECONDS
+            try:
+                response = self.client.completion(prompt, timeout=timeout, **generation_kwargs)
+            except TimeoutError:
+                response = self._stopped_response('deadline')
+        elif self.pool is not None:
+            if bounded:
+                response = self._wait_for_pool(prompt, generation_kwargs, deadline, cancel_event)
+            else:
+                response = self.pool.generate(prompt, **generation_kwargs)
+        else:
+            # One Llama context can't serve concurrent completions
+            stop_reason = self._acquire_generate_lock(deadline, cancel_event)
+            if stop_reason is not None:
+                response = self._stopped_response(stop_reason)
+            else:
+                try:
+                    # Draft counters are shared, so only this request's share is measured under the lock
+                    draft_before = self.draft_model.get_stats() if self.draft_model is not None else None
+                    if self._session_reuse_enabled():
+                        self._activate_session(session_id)
+                    response = stream_completion(
+                        self.llm, prompt, generation_kwargs, deadline=deadline,
+                        cancel_check=cancel_event.is_set if cancel_event is not None else None,
+                        on_text=on_text
+                    )
+                    if draft_before is not None:
+                        draft_usage = self._draft_usage(draft_before)
+                    if session_id is not None and self._session_reuse_enabled():
+                        self._commit_session_turn(session_id, prompt, response['choices'][0]['text'])
+                finally:
+                    self._generate_lock.release()
+        
+        self._record_generation_stats(response, time.perf_counter() - start_time, draft_usage, request_started_at)
+        return response
+    
+    def generation_concurrency(self) -> int:
+        """
+        Completions that can usefully run at the same time on the active backend
+        
+        Returns:
+            Server connection pool size, worker count, or 1 for the in-process model
+        """
+        if self.client is not None:
+            return self.client.pool_size
+        if self.pool is not None:
+            return self.pool.num_workers
+        return 1
+    
+    def generate_with_deadline(self, prompt: str, max_tokens: int = None, deadline: float = None,
+                               cancel_event: threading.Event = None,
+                               on_text: Callable[[str], None] = None,
+                               session_id: str = None, intent: str = None) -> Tuple[str, str]:
+        """
+        Generate a response that stops at a deadline or when cancelled
         
         Args:
             prompt: Input prompt for the model
             max_tokens: Maximum tokens to generate
+            deadline: Absolute time.time() at which to stop generating
+            cancel_event: Set to abandon the request (e.g. the user sent a new message)
+            on_text: Called with the text so far as tokens arrive
+            session_id: Conversation the prompt was built for (see create_business_prompt)
+            intent: Query intent selecting the generation profile (max_tokens,
+                temperature, stop sequences) and enabling the early stop
             
         Returns:
-            Generated response text
+            Tuple of (response text, finish reason). The finish reason is
+            'stop'/'length'/'sections_complete' for complete answers,
+            'deadline' or 'cancelled' for partial ones and 'error' when the
+            model is unavailable.
         """
-        if not self.is_loaded:
-            if not self.load_model():
-                return "❌ Error: Model not loaded. Please check the model path and try again."
+        error_message = self._ensure_loaded()
+        if error_message:
+            return error_message, 'error'
         
         try:
-            max_tokens = max_tokens or self.config['max_tokens']
+            response = self._run_completion(
+                prompt, self._generation_kwargs(max_tokens, intent),
+                deadline=deadline, cancel_event=cancel_event, on_text=on_text, session_id=session_id
+            )
+            choice = response['choices'][0]
+            
+            # Extract and clean up the generated text
+            generated_text = self._clean_response(choice['text'].strip())
+            
+            return generated_text, choice.get('finish_reason') or 'stop'
             
-            # Generate response
-            response = self.llm(
-                prompt,
-                max_tokens=max_tokens,
-                temperature=self.config['temperature'],
-                top_p=self.config['top_p'],
-                top_k=self.config['top_k'],
-                repeat_penalty=self.config['repeat_penalty'],
-                stop=["</s>", "[INST]", "[/INST]"],  # Stop tokens for Mistral
-                echo=False  # Don't echo the prompt
+        except Exception as e:
+            logger.error(f"❌ Error generating response: {str(e)}")
+            return f"❌ Error generating response: {str(e)}", 'error'
+    
+    async def agenerate_with_deadline(self, prompt: str, max_tokens: int = None, deadline: float = None,
+                                      cancel_event: threading.Event = None,
+                                      on_text: Callable[[str], None] = None,
+                                      session_id: str = None, intent: str = None) -> Tuple[str, str]:
+        """
+        Async variant of generate_with_deadline
+        
+        Worker pool completions are awaited on the pool's future without
+        holding a thread; cancelling the awaiting task (or reaching the
+        deadline) cancels that future, which stops the worker's generation.
+        The in-process model and the model server client block, so they run
+        on a small inference thread pool. Cancelling the awaiting task sets
+        cancel_event, which stops in-process generation.
+        
+        Args:
+            Same as generate_with_deadline; on_text is called from a worker thread
+            
+        Returns:
+            Tuple of (response text, finish reason)
+        """
+        if self.pool is None:
+            cancel_event = cancel_event or threading.Event()
+            return await self._run_on_inference_executor(
+                functools.partial(self.generate_with_deadline, prompt, max_tokens, deadline, cancel_event,
+                                  on_text, session_id, intent),
+                cancel_event
             )
+        
+        error_message = self._ensure_loaded()
+        if error_message:
+            return error_message, 'error'
+        
+        start_time = time.perf_counter()
+        request_started_at = time.time()
+        timeout = None
+        if deadline is not None:
+            # The worker stops at the deadline too; the grace lets its partial text arrive
+            timeout = max(deadline - time.time(), 0.0) + self.DEADLINE_GRACE_SECONDS
+        try:
+            future = self.pool.submit(prompt, deadline=deadline, **self._generation_kwargs(max_tokens, intent))
+            response = await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            response = self._stopped_response('deadline')
+        except RuntimeError as e:
+            logger.error(f"❌ Error generating response: {str(e)}")
+            return f"❌ Error generating response: {str(e)}", 'error'
+        
+        self._record_generation_stats(response, time.perf_counter() - start_time, None, request_started_at)
+        choice = response['choices'][0]
+        return self._clean_response(choice['text'].strip()), choice.get('finish_reason') or 'stop'
+    
+    async def _run_on_inference_executor(self, call: Callable, cancel_event: threading.Event):
+        """
+        Await a blocking generation call on the inference thread pool
+        
+        Args:
+            call: Generation call to run
+            cancel_event: Event the call stops on; set when the awaiting task is cancelled
             
-            # Extract the generated text
-            generated_text = response['choices'][0]['text'].strip()
+        Returns:
+            The call's result
+        """
+        if self._inference_executor is None:
+            self._inference_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm-inference")
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._inference_executor, call)
+        except asyncio.CancelledError:
+            cancel_event.set()
+            raise
+    
+    def generate_response(self, prompt: str, max_tokens: int = None, deadline: float = None,
+                          cancel_event: threading.Event = None, intent: str = None) -> str:
+        """
+        Generate a response using the loaded model
+        
+        Args:
+            prompt: Input prompt for the model
+            max_tokens: Maximum tokens to generate
+            deadline: Absolute time.time() at which to stop (returns the partial text)
+            cancel_event: Set to abandon the request
+            intent: Query intent selecting the generation profile
             
-            # Clean up the response
-            generated_text = self._clean_response(generated_text)
+        Returns:
+            Generated response text
+        """
+        generated_text, _ = self.generate_with_deadline(prompt, max_tokens, deadline, cancel_event, intent=intent)
+        return generated_text
+    
+    def generate_structured_response(self, prompt: str, max_tokens: int = None, deadline: float = None,
+                                     cancel_event: threading.Event = None,
+                                     session_id: str = None) -> Optional[Dict]:
+        """
+        Generate a grammar-constrained JSON answer
+        
+        The GBNF grammar only admits the compact findings/insights/recommendations
+        schema, so no cleanup pass is needed; the caller renders the result.
+        
+        Args:
+            prompt: Input prompt built with structured_output enabled
+            max_tokens: Maximum tokens to generate
+            deadline: Absolute time.time() at which to stop generating
+            cancel_event: Set to abandon the request
+            session_id: Conversation the prompt was built for (see create_business_prompt)
             
-            return generated_text
+        Returns:
+            Parsed answer dict, or None if the model is unavailable or the output was incomplete
+        """
+        if self._ensure_loaded():
+            return None
+        
+        try:
+            generation_kwargs = self._generation_kwargs(max_tokens or self.config['structured_max_tokens'])
+            if self.client is not None:
+                # The server compiles the GBNF text itself
+                generation_kwargs['grammar'] = BUSINESS_ANSWER_GBNF
+            else:
+                if self._structured_grammar is None:
+                    from llama_cpp import LlamaGrammar
+                    self._structured_grammar = LlamaGrammar.from_string(BUSINESS_ANSWER_GBNF, verbose=False)
+                generation_kwargs['grammar'] = self._structured_grammar
+            response = self._run_completion(prompt, generation_kwargs, deadline=deadline,
+                                            cancel_event=cancel_event, session_id=session_id)
+            if response['choices'][0].get('finish_reason') in ('deadline', 'cancelled'):
+                return None
+            return parse_structured_response(response['choices'][0]['text'])
             
         except Exception as e:
-            logger.error(f"❌ Error generating response: {str(e)}")
-            return f"❌ Error generating response: {str(e)}"
+            logger.error(f"❌ Error generating structured response: {str(e)}")
+            return None
+    
+    async def agenerate_structured_response(self, prompt: str, max_tokens: int = None, deadline: float = None,
+                                            cancel_event: threading.Event = None,
+                                            session_id: str = None) -> Optional[Dict]:
+        """
+        Async variant of generate_structured_response
+        
+        Generation runs on the inference thread pool (like
+        agenerate_with_deadline), never on the caller's executor, and
+        cancelling the awaiting task stops it.
+        
+        Args:
+            Same as generate_structured_response
+            
+        Returns:
+            Parsed answer dict, or None if the model is unavailable or the output was incomplete
+        """
+        cancel_event = cancel_event or threading.Event()
+        return await self._run_on_inference_executor(
+            functools.partial(self.generate_structured_response, prompt, max_tokens, deadline, cancel_event,
+                              session_id),
+            cancel_event
+        )
+    
+    def _draft_usage(self, draft_before: Dict) -> Dict:
+        """
+        Draft tokens proposed and accepted since a get_stats() snapshot
+        
+        Args:
+            draft_before: Draft model stats captured before the completion
+            
+        Returns:
+            Dictionary with proposed_tokens and accepted_tokens
+        """
+        draft_after = self.draft_model.get_stats()
+        return {key: draft_after[key] - draft_before[key] for key in ('proposed_tokens', 'accepted_tokens')}
+    
+    def _record_generation_stats(self, response: Dict, elapsed: float, draft_usage: Optional[Dict],
+                                 request_started_at: float = None):
+        """
+        Record throughput, latency breakdown (and draft acceptance when
+        speculative decoding is on) for the last request and add it to telemetry
+        
+        Args:
+            response: Raw llama.cpp completion dict
+            elapsed: Seconds spent in the completion call
+            draft_usage: Draft tokens proposed/accepted during the call (speculative decoding only)
+            request_started_at: time.time() when the request was made, for queue wait
+        """
+        usage = response.get('usage', {})
+        completion_tokens = usage.get('completion_tokens', 0)
+        timings = response.get('timings') or {}
+        stats = {
+            'prompt_tokens': usage.get('prompt_tokens', 0),
+            'completion_tokens': completion_tokens,
+            'seconds': elapsed,
+            'tokens_per_sec': completion_tokens / elapsed if elapsed > 0 else 0.0,
+            'speculative': draft_usage is not None,
+            'finish_reason': response['choices'][0].get('finish_reason') if response.get('choices') else None,
+        }
+        
+        # Latency breakdown from the streamed completion (worker, server or in-process)
+        if 'started_at' in timings and request_started_at is not None:
+            queue_wait = max(timings['started_at'] - request_started_at, 0.0)
+            stats['queue_wait_seconds'] = queue_wait
+            if 'first_token_seconds' in timings:
+                stats['prompt_eval_seconds'] = timings['first_token_seconds']
+                stats['ttft_seconds'] = queue_wait + timings['first_token_seconds']
+                generation_seconds = timings['generation_seconds']
+                stats['generation_tokens_per_sec'] = (
+                    (completion_tokens - 1) / generation_seconds if completion_tokens > 1 and generation_seconds > 0 else 0.0
+                )
+        stats['cached_prompt_tokens'] = timings.get('cached_prompt_tokens')
+        
+        self.telemetry.record(
+            prompt_tokens=stats['prompt_tokens'],
+            cached_prompt_tokens=stats['cached_prompt_tokens'],
+            prompt_eval_seconds=stats.get('prompt_eval_seconds'),
+            ttft_seconds=stats.get('ttft_seconds'),
+            generated_tokens=completion_tokens,
+            generation_tokens_per_sec=stats.get('generation_tokens_per_sec'),
+            queue_wait_seconds=stats.get('queue_wait_seconds'),
+            total_seconds=elapsed,
+            backend='server' if self.client is not None else 'pool' if self.pool is not None else 'local',
+            finish_reason=stats['finish_reason']
+        )
+        
+        if draft_usage is not None:
+            proposed, accepted = draft_usage['proposed_tokens'], draft_usage['accepted_tokens']
+            stats['draft_proposed_tokens'] = proposed
+            stats['draft_accepted_tokens'] = accepted
+            stats['draft_acceptance_rate'] = accepted / proposed if proposed else 0.0
+        
+        self.last_generation_stats = stats
+        message = f"Generated {completion_tokens} tokens in {elapsed:.2f}s ({stats['tokens_per_sec']:.1f} tok/s)"
+        if 'ttft_seconds' in stats:
+            message += f", TTFT {stats['ttft_seconds']:.2f}s (queue {stats['queue_wait_seconds']:.2f}s)"
+        if draft_usage is not None:
+            message += f", draft acceptance {stats['draft_acceptance_rate']:.0%}"
+        logger.info(message)
+    
+    def get_telemetry(self, recent: int = 20) -> Dict:
+        """
+        Get inference telemetry
+        
+        Args:
+            recent: Number of most recent per-request records to include
+            
+        Returns:
+            Rolling summary (p50/p95 per metric, prompt cache hit rate) and recent records
+        """
+        summary = self.telemetry.get_summary()
+        summary['recent'] = self.telemetry.get_recent(recent)
+        return summary
     
     def _clean_response(self, text: str) -> str:
         """
@@ -177,61 +964,387 @@ class LLMLoader:
         
         return '\n\n'.join(lines)
     
-    def create_business_prompt(self, user_query: str, context_data: str, conversation_history: List[Dict] = None) -> str:
+    def count_tokens(self, text: str) -> int:
+        """
+        Count prompt tokens for a piece of text
+        
+        Uses the model tokenizer when available (the loaded model, or a
+        vocab-only instance when generation runs in the worker pool) and
+        a conservative characters-per-token estimate otherwise.
+        
+        Args:
+            text: Text to measure
+            
+        Returns:
+            Number of tokens
+        """
+        if not text:
+            return 0
+        
+        tokenizer = self._get_tokenizer()
+        if tokenizer is not None:
+            return len(tokenizer.tokenize(text.encode('utf-8'), add_bos=False))
+        
+        return -(-len(text) // self.CHARS_PER_TOKEN_ESTIMATE)
+    
+    def _get_tokenizer(self):
+        """Return a Llama instance usable for tokenization, or None"""
+        if self.llm is not None:
+            return self.llm
+        
+        if self._tokenizer is None and not self._tokenizer_failed and os.path.exists(self.model_path):
+            try:
+                # vocab_only loads just the tokenizer, not the weights
+                Llama = _import_llama()
+                self._tokenizer = Llama(model_path=self.model_path, vocab_only=True, verbose=False)
+            except Exception as e:
+                logger.warning(f"Tokenizer unavailable, estimating token counts: {str(e)}")
+                self._tokenizer_failed = True
+        
+        return self._tokenizer
+    
+    def _truncate_to_tokens(self, text: str, max_tokens: int) -> str:
+        """
+        Truncate text to at most max_tokens tokens
+        
+        Args:
+            text: Text to truncate
+            max_tokens: Token limit
+            
+        Returns:
+            Truncated text
+        """
+        if max_tokens <= 0:
+            return ""
+        if self.count_tokens(text) <= max_tokens:
+            return text
+        
+        tokenizer = self._get_tokenizer()
+        if tokenizer is not None:
+            tokens = tokenizer.tokenize(text.encode('utf-8'), add_bos=False)[:max_tokens]
+            return tokenizer.detokenize(tokens).decode('utf-8', errors='ignore')
+        
+        return text[:max_tokens * self.CHARS_PER_TOKEN_ESTIMATE]
+    
+    def _fit_context(self, context_data: str, budget: int) -> str:
+        """
+        Compress business context to fit a token budget
+        
+        Verbose distribution dumps go first, then whole paragraphs are dropped
+        from the middle of the report so the headline metrics at the top and
+        the query-focused sections appended at the end survive.
+        
+        Args:
+            context_data: Business data and analytics
+            budget: Token budget for the context section
+            
+        Returns:
+            Context that fits the budget
+        """
+        if self.count_tokens(context_data) <= budget:
+            return context_data
+        
+        lines = [line for line in context_data.split('\n') if 'Distribution:' not in line]
+        context_data = '\n'.join(lines)
+        if self.count_tokens(context_data) <= budget:
+            return context_data
+        
+        paragraphs = [p for p in context_data.split('\n\n') if p.strip()]
+        while len(paragraphs) > 2 and self.count_tokens('\n\n'.join(paragraphs)) > budget:
+            del paragraphs[len(paragraphs) // 2]
+        
+        return self._truncate_to_tokens('\n\n'.join(paragraphs), budget)
+    
+    def _fit_history(self, conversation_history: List[Dict], budget: int, session_id: str = None) -> str:
+        """
+        Render conversation history within a token budget
+        
+        The last max_history_turns messages are kept verbatim and older ones
+        are condensed into the session's rolling summary. Over budget, the
+        oldest verbatim turns are dropped first, then the summary; if the most
+        recent turn alone is still too large it is truncated.
+        
+        Args:
+            conversation_history: Previous conversation turns
+            budget: Token budget for the history section
+            session_id: Conversation whose cached summary to use
+            
+        Returns:
+            Formatted conversation history
+        """
+        if not conversation_history or budget <= 0:
+            return ""
+        
+        summary, recent = self.summarizer.summarize(
+            session_id or 'default', conversation_history, self.config['max_history_turns']
+        )
+        summary_block = f"Earlier in this conversation:\n{summary}\n" if summary else ""
+        
+        turns = []
+        for msg in recent:
+            if msg['role'] == 'user':
+                turns.append(f"Human: {msg['content']}\n")
+            elif msg['role'] == 'assistant':
+                turns.append(f"Assistant: {msg['content']}\n")
+        
+        while self.count_tokens(summary_block + ''.join(turns)) > budget:
+            if len(turns) > 1:
+                turns.pop(0)
+            elif summary_block:
+                summary_block = ""
+            elif turns:
+                return self._truncate_to_tokens(turns[0], budget)
+            else:
+                break
+        
+        return summary_block + ''.join(turns)
+    
+    def _session_reuse_enabled(self) -> bool:
+        """Whether conversations keep their KV state (only the in-process model holds one)"""
+        return (self.config['session_state_reuse'] and self.config['backend'] == 'local'
+                and self.config['pool_size'] == 0)
+    
+    def _activate_session(self, session_id: Optional[str]):
+        """
+        Give the model the session's KV state (caller holds the generate lock)
+        
+        The active session's state stays live in the model; it is only
+        snapshotted when another session needs the model.
+        """
+        if session_id == self._active_session:
+            return
+        
+        if self._active_session is not None:
+            self.session_states.store_state(self._active_session, self.llm.save_state())
+        self._active_session = session_id
+        
+        if session_id is not None:
+            state = self.session_states.take_state(session_id)
+            if state is not None:
+                self.llm.load_state(state)
+                logger.info(f"Restored KV state for session {session_id[:8]} ({state.n_tokens} tokens)")
+    
+    def _commit_session_turn(self, session_id: str, prompt: str, generated_text: str):
+        """Record the text now in the session's KV cache so the next turn extends it"""
+        fields = {'transcript': prompt + generated_text + "</s>"}
+        context = self._pending_session_context.pop(session_id, None)
+        if context is not None:
+            fields.update(context=context, turns=1)
+        else:
+            entry = self.session_states.get(session_id)
+            fields['turns'] = (entry['turns'] if entry else 0) + 1
+        self.session_states.update(session_id, **fields)
+    
+    def _prompt_budget(self, intent: str = None) -> int:
+        """Prompt tokens available: n_ctx minus the answer allowance of the intent's generation profile"""
+        if self.config['structured_output']:
+            max_tokens = self.config['structured_max_tokens']
+        else:
+            max_tokens = self._generation_kwargs(intent=intent)['max_tokens']
+        return self.config['n_ctx'] - max_tokens
+    
+    def _fit_question(self, user_query: str, available: int,
+                      render: Callable[[str, str], str]) -> Tuple[str, str, int, bool]:
+        """
+        Choose the instructions and fit the question into their share of the budget
+        
+        Instructions and the question are required. Above the instructions'
+        share the compact instructions are used, and a question still too
+        long is clipped to what the instructions leave of the share (but at
+        least that share of what they leave of the whole budget), so the
+        prompt always fits.
+        
+        Args:
+            user_query: User's question
+            available: Prompt token budget
+            render: Builds the prompt frame (no context or history) from a question and instructions
+            
+        Returns:
+            Tuple of (question, instructions, frame tokens, whether the question was clipped)
+        """
+        split = self.config['prompt_budget_split']
+        structured = self.config['structured_output']
+        instructions = STRUCTURED_PROMPT_INSTRUCTIONS if structured else self.PROMPT_INSTRUCTIONS
+        frame_tokens = self.count_tokens(render(user_query, instructions))
+        instructions_cap = int(available * split['instructions'])
+        if not structured and frame_tokens > instructions_cap:
+            instructions = self.COMPACT_PROMPT_INSTRUCTIONS
+            frame_tokens = self.count_tokens(render(user_query, instructions))
+        
+        question_clipped = False
+        if frame_tokens > instructions_cap:
+            base_tokens = self.count_tokens(render("", instructions))
+            question_budget = max(instructions_cap - base_tokens,
+                                  int((available - base_tokens) * split['instructions']))
+            if self.count_tokens(user_query) > question_budget:
+                user_query = self._truncate_to_tokens(user_query, question_budget)
+                question_clipped = True
+                frame_tokens = self.count_tokens(render(user_query, instructions))
+                logger.warning(f"⚠️ Question clipped to {question_budget} tokens to fit the context window")
+        return user_query, instructions, frame_tokens, question_clipped
+    
+    def _create_session_prompt(self, user_query: str, context_data: str,
+                               conversation_history: Optional[List[Dict]], session_id: str,
+                               intent: str = None) -> Optional[str]:
+        """
+        Extend the session's transcript with the new turn
+        
+        Only the new question (plus any context beyond what the session
+        already has) is appended, so llama.cpp reuses the cached prefix and
+        evaluates just the new tokens. The turn is budgeted like a full
+        prompt: same instructions, the question clipped to its share and
+        the extra context fitted to what is left. The transcript stands in
+        for the conversation history; once it outgrows the history and
+        context shares, the session starts a new transcript from a full
+        prompt, where older turns are condensed into the rolling summary.
+        
+        Returns:
+            Prompt, or None to start a new transcript (new conversation or budget exceeded)
+        """
+        entry = self.session_states.get(session_id)
+        if not entry or not entry['transcript']:
+            return None
+        
+        # A history without earlier questions means the conversation was restarted
+        if conversation_history is not None:
+            questions = [m for m in conversation_history if m.get('role') == 'user']
+            if questions and questions[-1].get('content') == user_query:
+                questions = questions[:-1]
+            if not questions:
+                return None
+        
+        available = self._prompt_budget(intent)
+        split = self.config['prompt_budget_split']
+        transcript_tokens = self.count_tokens(entry['transcript'])
+        if transcript_tokens > available - int(available * split['instructions']):
+            logger.info(f"Session {session_id[:8]} transcript is full, starting a new one")
+            return None
+        
+        def render(question: str, instructions: str, context_block: str = "") -> str:
+            return self.FOLLOWUP_TURN_TEMPLATE.format(context_block=context_block, user_query=question,
+                                                      instructions=instructions)
+        
+        user_query, instructions, frame_tokens, question_clipped = self._fit_question(user_query, available, render)
+        
+        base_context = entry['context']
+        if base_context and context_data.startswith(base_context):
+            extra_context = context_data[len(base_context):].strip()
+        else:
+            # The data changed since the session started; send it again
+            extra_context = context_data.strip()
+            self.session_states.update(session_id, context=context_data)
+        if extra_context:
+            context_wrapper_tokens = self.count_tokens("ADDITIONAL DATA:\n\n\n")
+            extra_context = self._fit_context(
+                extra_context, available - transcript_tokens - frame_tokens - context_wrapper_tokens)
+        
+        turn = render(user_query, instructions,
+                      f"ADDITIONAL DATA:\n{extra_context}\n\n" if extra_context else "")
+        prompt = entry['transcript'] + turn
+        total_tokens = self.count_tokens(prompt)
+        if total_tokens > available:
+            logger.info(f"Session {session_id[:8]} transcript is full, starting a new one")
+            return None
+        
+        self._pending_session_context.pop(session_id, None)
+        turn_tokens = self.count_tokens(turn)
+        self.last_prompt_usage = {
+            'session_reuse': True,
+            'session_turn': entry['turns'] + 1,
+            'new_tokens': turn_tokens,
+            'total_tokens': total_tokens,
+            'budget_tokens': available,
+            'compact_instructions': instructions is self.COMPACT_PROMPT_INSTRUCTIONS,
+            'question_clipped': question_clipped
+        }
+        logger.info(f"Prompt tokens: {total_tokens}/{available} (session turn {entry['turns'] + 1}, {turn_tokens} new)")
+        return prompt
+    
+    def create_business_prompt(self, user_query: str, context_data: str, conversation_history: List[Dict] = None,
+                               session_id: str = None, intent: str = None) -> str:
         """
         Create a structured prompt for business analysis
         
+        The prompt is kept within n_ctx minus the answer allowance of the
+        intent's generation profile. Instructions and history are capped by
+        their share in config['prompt_budget_split'] and the context gets
+        the rest; unused share flows to the other sections, and the
+        lowest-priority sections are compressed first: history, then
+        context, then instructions. A question too long for the
+        instructions' share is clipped to it.
+        
         Args:
             user_query: User's question
             context_data: Business data and analytics
             conversation_history: Previous conversation turns
+            session_id: Conversation whose rolling history summary (and, with
+                session_state_reuse, KV-cached transcript) to use
+            intent: Query intent whose generation profile sets the answer allowance
             
         Returns:
             Formatted prompt for the model
         """
-        # Build conversation context
-        conversation_context = ""
-        if conversation_history:
-            recent_history = conversation_history[-4:]  # Last 4 turns
-            for msg in recent_history:
-                if msg['role'] == 'user':
-                    conversation_context += f"Human: {msg['content']}\n"
-                elif msg['role'] == 'assistant':
-                    conversation_context += f"Assistant: {msg['content']}\n"
-        
-        prompt = f"""[INST] You are an expert business analyst specializing in customer segmentation and marketing strategy. You have access to real customer data and must provide data-driven insights.
-
-CUSTOMER SEGMENTATION DATA:
-{context_data}
-
-CONVERSATION HISTORY:
-{conversation_context}
-
-CURRENT QUESTION: {user_query}
-
-INSTRUCTIONS:
-1. Analyze the provided customer data thoroughly
-2. Provide specific, data-backed insights (use actual numbers from the data)
-3. Explain business reasoning behind patterns
-4. Give actionable marketing recommendations
-5. Use professional business language
-6. Structure your response clearly with headers
-7. Do NOT make up data - only use the provided information
-
-RESPONSE FORMAT:
-📊 **Data Analysis**
-[Specific findings from the data]
-
-🧠 **Business Insights**
-[Why these patterns exist]
-
-🎯 **Recommendations**
-[Actionable strategies]
-
-Respond now: [/INST]"""
-
+        if session_id is not None and self._session_reuse_enabled():
+            prompt = self._create_session_prompt(user_query, context_data, conversation_history, session_id, intent)
+            if prompt is not None:
+                return prompt
+            # This prompt starts the session's transcript
+            self._pending_session_context[session_id] = context_data
+        
+        available = self._prompt_budget(intent)
+        split = self.config['prompt_budget_split']
+        
+        def render(question: str, instructions: str) -> str:
+            return self.PROMPT_TEMPLATE.format(context_data="", conversation_context="",
+                                               user_query=question, instructions=instructions)
+        
+        user_query, instructions, frame_tokens, question_clipped = self._fit_question(user_query, available, render)
+        remaining = max(0, available - frame_tokens)
+        
+        # History is the lowest priority: it only gets more than its share if context leaves room
+        history_cap = int(available * split['history'])
+        full_history = self._fit_history(conversation_history, remaining, session_id)
+        history_tokens = min(self.count_tokens(full_history), history_cap)
+        
+        context_data = self._fit_context(context_data, remaining - history_tokens)
+        context_tokens = self.count_tokens(context_data)
+        
+        conversation_context = self._fit_history(conversation_history, remaining - context_tokens, session_id)
+        history_tokens = self.count_tokens(conversation_context)
+        
+        prompt = self.PROMPT_TEMPLATE.format(
+            context_data=context_data,
+            conversation_context=conversation_context,
+            user_query=user_query,
+            instructions=instructions
+        )
+        
+        self.last_prompt_usage = {
+            'context_tokens': context_tokens,
+            'history_tokens': history_tokens,
+            'instruction_tokens': frame_tokens,
+            'total_tokens': self.count_tokens(prompt),
+            'budget_tokens': available,
+            'compact_instructions': instructions is self.COMPACT_PROMPT_INSTRUCTIONS,
+            'question_clipped': question_clipped
+        }
+        logger.info(
+            f"Prompt tokens: {self.last_prompt_usage['total_tokens']}/{available} "
+            f"(context={context_tokens}, history={history_tokens}, instructions={frame_tokens})"
+        )
+        
         return prompt
     
+    def forget_session(self, session_id: str = None):
+        """
+        Drop a conversation's history summary and saved KV state, in memory and on disk
+        
+        Args:
+            session_id: Conversation to forget (None = every conversation)
+        """
+        self.summarizer.clear(session_id)
+        self.session_states.drop(session_id)
+    
     def get_model_info(self) -> Dict:
         """
         Get information about the loaded model
@@ -243,16 +1356,47 @@ Respond now: [/INST]"""
             'model_path': self.model_path,
             'is_loaded': self.is_loaded,
             'config': self.config,
-            'model_exists': os.path.exists(self.model_path) if self.model_path else False
+            'model_exists': os.path.exists(self.model_path) if self.model_path else False,
+            'load_status': self.get_load_status(),
+            'model_variant': self.model_variant,
+            'cpu_topology': self.cpu_topology,
+            'tuned_config': self.tuned_config,
+            'backend': self.config['backend'],
+            'server': self.client.get_stats() if self.client is not None else None,
+            'pool': self.pool.get_stats() if self.pool is not None else None,
+            'speculative': self.draft_model.get_stats() if self.draft_model is not None else None,
+            'last_generation': self.last_generation_stats,
+            'telemetry': self.telemetry.get_summary(),
+            'session_states': self.session_states.get_stats()
         }
     
     def unload_model(self):
         """Unload the model from memory"""
+        if self._inference_executor is not None:
+            self._inference_executor.shutdown(wait=False)
+            self._inference_executor = None
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+            self.is_loaded = False
+            logger.info("Disconnected from model server")
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+            self.is_loaded = False
+            logger.info("LLM pool stopped")
         if self.llm:
+            # Save conversation states so returning sessions skip re-evaluating their history
+            if self._active_session is not None and self.config['session_state_dir']:
+                self.session_states.persist(self._active_session, self.llm.save_state())
+            self.session_states.flush()
+            self._active_session = None
             del self.llm
             self.llm = None
+            self.draft_model = None
             self.is_loaded = False
             logger.info("Model unloaded from memory")
+        self.load_status = {'state': 'not_started', 'progress': 0.0, 'message': 'Model not loaded', 'error': None}
 
 # Singleton instance for caching
 _llm_instance = None
@@ -0,0 +1,616 @@
+"""
+Multi-process LLM Worker Pool
+Runs several llama.cpp model workers in separate processes for concurrent chat throughput
+"""
+
+import os
+import re
+import time
+import logging
+import functools
+import threading
+import itertools
+import multiprocessing as mp
+from multiprocessing.connection import wait as wait_for_connections
+from collections import deque
+from concurrent.futures import Future
+from typing import Optional, List, Dict, Any, Callable
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Message kinds exchanged between the pool and its workers
+_MSG_READY = 'ready'
+_MSG_RESULT = 'result'
+_MSG_ERROR = 'error'
+_MSG_LOAD_FAILED = 'load_failed'
+_MSG_PONG = 'pong'
+
+# Minimum seconds between heartbeats a busy worker sends while generating
+HEARTBEAT_INTERVAL = 1.0
+
+
+def _cached_prefix_tokens(llm, prompt_tokens: List[int]) -> int:
+    """Prompt tokens already in the KV cache from the previous completion (llama.cpp reuses them)"""
+    n_cached = getattr(llm, 'n_tokens', 0)
+    input_ids = getattr(llm, 'input_ids', None)
+    if not n_cached or input_ids is None:
+        return 0
+
+    matched = 0
+    for cached, token in zip(input_ids[:n_cached], prompt_tokens):
+        if cached != token:
+            break
+        matched += 1
+    return matched
+
+
+# A markdown heading or a bold title on its own line, optionally after an emoji
+HEADER_PATTERN = re.compile(r'^\s*(?:#{1,6}\s+\S.*|[^\w\s*]*\s*\*\*[^*]+\*\*:?)\s*$')
+# Openings of the closing remarks models add after the last section
+CLOSING_PHRASES = ('overall', 'in summary', 'in conclusion', 'to summarize', 'to sum up', 'let me know',
+                   'i hope', 'hope this helps', 'feel free', 'please let me know', 'if you have any')
+
+
+def _ends_answer(line: str, sections: List[str]) -> bool:
+    """Whether a line starts something after the required sections: a closing remark or another header"""
+    lowered = line.strip().lower()
+    if lowered.startswith(CLOSING_PHRASES):
+        return True
+    return bool(HEADER_PATTERN.match(line)) and not any(section in lowered for section in sections)
+
+
+def sections_end(text: str, sections: List[str]) -> int:
+    """
+    Where an answer's required sections end, if they are complete
+
+    The answer is complete once every section title has appeared and the
+    last section has content followed by a finished line that opens a
+    closing remark (e.g. "Overall, ...", "Let me know ...") or a header
+    that is not a required section. Prose paragraphs in the last section
+    do not end it; otherwise the answer runs to the end of the stream.
+
+    Args:
+        text: Answer generated so far
+        sections: Required section titles, e.g. ['data analysis', 'recommendations']
+
+    Returns:
+        Offset where the closing remark or extra section starts, or -1 if not complete yet
+    """
+    lowered = text.lower()
+    positions = [lowered.find(section) for section in sections]
+    if not positions or min(positions) < 0:
+        return -1
+
+    header_end = text.find('\n', max(positions))
+    if header_end < 0:
+        return -1
+    offset = header_end + 1
+    seen_content = False
+    # Only finished lines are judged; the last (partial) line has no newline yet
+    for line in text[offset:].split('\n')[:-1]:
+        if seen_content and _ends_answer(line, sections):
+            return offset
+        seen_content = seen_content or bool(line.strip())
+        offset += len(line) + 1
+    return -1
+
+
+def stream_completion(llm, prompt: str, generation_kwargs: Dict[str, Any], deadline: float = None,
+                      cancel_check: Callable[[], bool] = None,
+                      on_text: Callable[[str], None] = None) -> Dict[str, Any]:
+    """
+    Run a streamed completion that stops early at a deadline or on cancellation
+
+    The deadline is checked between tokens, so prompt evaluation itself is
+    not interrupted. Closing the stream stops llama.cpp from generating
+    further tokens.
+
+    Args:
+        llm: Llama instance
+        prompt: Input prompt for the model
+        generation_kwargs: Keyword arguments for the Llama call; an
+            'early_stop_sections' entry ends generation once those sections
+            are complete (see sections_end)
+        deadline: Absolute time.time() at which to stop generating
+        cancel_check: Returns True when the request has been cancelled
+        on_text: Called with the text generated so far after each token
+
+    Returns:
+        Completion dict shaped like llama.cpp's; finish_reason is 'deadline'
+        or 'cancelled' when generation stopped early and 'sections_complete'
+        when the early-stop sections were finished. 'timings' holds the
+        start time, time to the first token (prompt evaluation), generation
+        time and the number of prompt tokens reused from the KV cache.
+    """
+    started_at = time.time()
+    generation_kwargs = dict(generation_kwargs)
+    early_stop_sections = generation_kwargs.pop('early_stop_sections', None)
+    prompt_token_ids = llm.tokenize(prompt.encode('utf-8'), special=True)
+    timings = {'started_at': started_at, 'cached_prompt_tokens': _cached_prefix_tokens(llm, prompt_token_ids)}
+    stopped = ('cancelled' if cancel_check is not None and cancel_check() else
+               'deadline' if deadline is not None and started_at >= deadline else None)
+    if stopped is not None:
+        return {'choices': [{'text': '', 'finish_reason': stopped}],
+                'usage': {'prompt_tokens': len(prompt_token_ids), 'completion_tokens': 0},
+                'timings': timings}
+
+    text = ''
+    completion_tokens = 0
+    finish_reason = None
+    first_token_at = None
+    stream = llm(prompt, **dict(generation_kwargs, stream=True))
+    try:
+        for chunk in stream:
+            if first_token_at is None:
+                first_token_at = time.time()
+            choice = chunk['choices'][0]
+            text += choice['text']
+            completion_tokens += 1
+            finish_reason = choice.get('finish_reason') or finish_reason
+            if on_text is not None and choice['text']:
+                on_text(text)
+            if finish_reason is None:
+                if early_stop_sections and '\n' in choice['text']:
+                    cut = sections_end(text, early_stop_sections)
+                    if cut >= 0:
+                        text = text[:cut].rstrip()
+                        finish_reason = 'sections_complete'
+                        break
+                if cancel_check is not None and cancel_check():
+                    finish_reason = 'cancelled'
+                    break
+                if deadline is not None and time.time() >= deadline:
+                    finish_reason = 'deadline'
+                    break
+    finally:
+        stream.close()
+
+    finished_at = time.time()
+    first_token_at = first_token_at or finished_at
+    timings.update(first_token_seconds=first_token_at - started_at, generation_seconds=finished_at - first_token_at)
+    return {'choices': [{'text': text, 'finish_reason': finish_reason or 'stop'}],
+            'usage': {'prompt_tokens': len(prompt_token_ids), 'completion_tokens': completion_tokens},
+            'timings': timings}
+
+
+def _worker_main(worker_id: int, model_path: str, llama_kwargs: Dict[str, Any],
+                 request_queue, response_conn, cancel_job):
+    """
+    Worker process entry point
+
+    Each worker loads its own Llama instance. With use_mmap=True the GGUF
+    weights are mapped read-only, so all workers share one copy of the model
+    through the OS page cache and only the KV cache is per-process.
+
+    Args:
+        worker_id: Index of this worker in the pool
+        model_path: Path to the GGUF model file
+        llama_kwargs: Keyword arguments for the Llama constructor
+        request_queue: Queue of (job_id, prompt, generation_kwargs) jobs; a
+            'deadline' entry in generation_kwargs bounds the job's generation time
+        response_conn: This worker's pipe for results back to the pool; while
+            generating, the worker sends a pong at most every HEARTBEAT_INTERVAL
+            so the pool can tell a busy worker from a hung one
+        cancel_job: Shared value the pool sets to a job ID to cancel it; the
+            worker checks it between tokens and answers with finish_reason 'cancelled'
+    """
+    try:
+        from llama_cpp import Llama
+        llm = Llama(model_path=model_path, **llama_kwargs)
+    except Exception as e:
+        response_conn.send((_MSG_LOAD_FAILED, worker_id, None, str(e)))
+        return
+
+    response_conn.send((_MSG_READY, worker_id, None, os.getpid()))
+    last_heartbeat = [time.time()]
+
+    def heartbeat(_text: str):
+        now = time.time()
+        if now - last_heartbeat[0] >= HEARTBEAT_INTERVAL:
+            last_heartbeat[0] = now
+            response_conn.send((_MSG_PONG, worker_id, None, None))
+
+    while True:
+        job = request_queue.get()
+        if job is None:
+            break
+
+        job_id, prompt, generation_kwargs = job
+        if prompt is None:
+            response_conn.send((_MSG_PONG, worker_id, job_id, None))
+            continue
+
+        try:
+            # Jobs that expired while queued are answered immediately with no text
+            deadline = generation_kwargs.pop('deadline', None)
+            response = stream_completion(llm, prompt, generation_kwargs, deadline=deadline,
+                                         cancel_check=lambda: cancel_job.value == job_id, on_text=heartbeat)
+            response_conn.send((_MSG_RESULT, worker_id, job_id, response))
+        except Exception as e:
+            response_conn.send((_MSG_ERROR, worker_id, job_id, str(e)))
+
+
+class _WorkerHandle:
+    """Parent-side bookkeeping for a single worker process"""
+
+    def __init__(self, worker_id: int):
+        self.worker_id = worker_id
+        self.process: Optional[mp.Process] = None
+        self.request_queue = None
+        self.responses = None
+        self.cancel_job = None
+        self.ready = False
+        self.load_failed = False
+        self.pid: Optional[int] = None
+        self.in_flight: Dict[int, tuple] = {}
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.restarts = 0
+        self.last_seen = 0.0
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+
+class LLMWorkerPool:
+    """
+    Pool of llama.cpp workers running in separate processes
+    Each worker runs one job at a time; jobs wait in the pool until a
+    ready worker is idle, so a crashed or hung worker only loses the job
+    it was running. Workers that die or stop answering pings are
+    restarted and their job is queued again until the new process is ready.
+    Cancelling a job's future removes it from the queue or, if it is
+    running, tells its worker to stop generating.
+    """
+
+    # Process entry point for workers (a module-level function so spawn can pickle it)
+    worker_target = staticmethod(_worker_main)
+
+    def __init__(self, model_path: str, llama_kwargs: Dict[str, Any], num_workers: int = 2,
+                 health_check_interval: float = 5.0, max_retries: int = 1, ping_timeout: float = 60.0):
+        """
+        Initialize the worker pool
+
+        Args:
+            model_path: Path to the GGUF model file
+            llama_kwargs: Keyword arguments for the Llama constructor (n_threads is per worker)
+            num_workers: Number of worker processes
+            health_check_interval: Seconds between worker health checks
+            max_retries: Times a job is re-dispatched after its worker crashes or hangs
+            ping_timeout: Seconds a ready worker may go without answering a ping
+                (or sending a heartbeat while generating) before it is killed and
+                restarted; must cover the longest prompt evaluation
+        """
+        self.model_path = model_path
+        self.llama_kwargs = dict(llama_kwargs)
+        self.num_workers = max(1, num_workers)
+        self.health_check_interval = health_check_interval
+        self.max_retries = max_retries
+        self.ping_timeout = ping_timeout
+
+        # Spawn avoids forking a parent that may already hold llama.cpp threads
+        self._ctx = mp.get_context('spawn')
+        self._workers: List[_WorkerHandle] = [_WorkerHandle(i) for i in range(self.num_workers)]
+        self._futures: Dict[int, Future] = {}
+        # Jobs waiting for an idle ready worker, as (job_id, (prompt, generation_kwargs, attempts))
+        self._pending: deque = deque()
+        self._job_ids = itertools.count()
+        self._lock = threading.Lock()
+        self._ready_event = threading.Condition(self._lock)
+        self._running = False
+        self._collector: Optional[threading.Thread] = None
+        self._monitor: Optional[threading.Thread] = None
+
+    def start(self, timeout: float = 600.0) -> bool:
+        """
+        Start all workers and wait until at least one has loaded the model
+
+        Args:
+            timeout: Seconds to wait for the first worker to become ready
+
+        Returns:
+            True if at least one worker is ready, False otherwise
+        """
+        if self._running:
+            return True
+
+        self._running = True
+        for handle in self._workers:
+            self._spawn(handle)
+
+        self._collector = threading.Thread(target=self._collect_responses, name='llm-pool-collector', daemon=True)
+        self._collector.start()
+        self._monitor = threading.Thread(target=self._monitor_workers, name='llm-pool-monitor', daemon=True)
+        self._monitor.start()
+
+        deadline = time.time() + timeout
+        with self._ready_event:
+            while not any(w.ready for w in self._workers):
+                remaining = deadline - time.time()
+                if remaining <= 0 or not any(w.alive for w in self._workers):
+                    break
+                self._ready_event.wait(min(remaining, 1.0))
+            ready = any(w.ready for w in self._workers)
+
+        if ready:
+            logger.info(f"✅ LLM pool ready ({self.num_workers} workers, "
+                        f"{self.llama_kwargs.get('n_threads')} threads each)")
+        else:
+            logger.error("❌ No LLM pool worker became ready")
+            self.shutdown()
+        return ready
+
+    def _spawn(self, handle: _WorkerHandle):
+        """Start (or restart) the process behind a worker handle"""
+        handle.request_queue = self._ctx.Queue()
+        # Each worker answers on its own pipe: a worker that dies mid-send can only break
+        # its own channel (a shared queue's write lock would stay held and block the others)
+        handle.responses, response_conn = self._ctx.Pipe(duplex=False)
+        handle.cancel_job = self._ctx.Value('q', -1)
+        handle.ready = False
+        handle.load_failed = False
+        handle.pid = None
+        handle.last_seen = time.time()
+        handle.process = self._ctx.Process(
+            target=self.worker_target,
+            args=(handle.worker_id, self.model_path, self.llama_kwargs,
+                  handle.request_queue, response_conn, handle.cancel_job),
+            name=f'llm-worker-{handle.worker_id}',
+            daemon=True
+        )
+        handle.process.start()
+        # Only the worker keeps the sending end, so its exit shows up as EOF on handle.responses
+        response_conn.close()
+        logger.info(f"Started LLM worker {handle.worker_id}")
+
+    def _pick_worker(self) -> Optional[_WorkerHandle]:
+        """Return an idle ready worker, preferring the one that has done the least work (caller holds the lock)"""
+        candidates = [w for w in self._workers if w.ready and w.alive and not w.in_flight]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda w: w.completed)
+
+    def submit(self, prompt: str, **generation_kwargs) -> Future:
+        """
+        Submit a completion request; it runs on the next idle worker
+
+        Args:
+            prompt: Input prompt for the model
+            **generation_kwargs: Keyword arguments for the Llama call
+
+        Returns:
+            Future resolving to the raw llama.cpp completion dict; cancel()
+            drops the job or stops its worker's generation
+        """
+        future: Future = Future()
+        job_id = next(self._job_ids)
+        with self._lock:
+            self._futures[job_id] = future
+            self._dispatch(job_id, (prompt, generation_kwargs, 0))
+        future.add_done_callback(functools.partial(self._on_future_done, job_id))
+        return future
+
+    def _on_future_done(self, job_id: int, future: Future):
+        """Stop the work behind a cancelled future (runs in the thread that cancelled it)"""
+        if not future.cancelled():
+            return
+        with self._lock:
+            self._futures.pop(job_id, None)
+            for worker in self._workers:
+                if job_id in worker.in_flight:
+                    # The worker stays busy until it reports the stopped job back
+                    worker.cancel_job.value = job_id
+                    worker.cancelled += 1
+                    return
+            self._pending = deque(entry for entry in self._pending if entry[0] != job_id)
+
+    def _dispatch(self, job_id: int, job: tuple, retry: bool = False):
+        """Queue a job and start it if a worker is idle (caller holds the lock)"""
+        if retry:
+            # Retried jobs have already waited; they go ahead of new work
+            self._pending.appendleft((job_id, job))
+        else:
+            self._pending.append((job_id, job))
+        self._drain_pending()
+
+    def _drain_pending(self):
+        """Hand queued jobs to idle ready workers, or fail them if no worker can ever load (caller holds the lock)"""
+        if not self._running or all(w.load_failed for w in self._workers):
+            while self._pending:
+                job_id, _ = self._pending.popleft()
+                future = self._futures.pop(job_id, None)
+                if future and not future.done():
+                    future.set_exception(RuntimeError("No healthy LLM workers available"))
+            return
+
+        while self._pending:
+            worker = self._pick_worker()
+            if worker is None:
+                # Restarting or loading workers pick the queue up when they report ready
+                return
+            job_id, job = self._pending.popleft()
+            future = self._futures.get(job_id)
+            if future is None or future.done():
+                continue
+            prompt, generation_kwargs, _ = job
+            worker.in_flight[job_id] = job
+            # The hang timeout counts from the start of the job (prompt evaluation sends no heartbeat)
+            worker.last_seen = time.time()
+            worker.request_queue.put((job_id, prompt, generation_kwargs))
+
+    def generate(self, prompt: str, timeout: float = None, **generation_kwargs) -> Dict[str, Any]:
+        """
+        Blocking completion through the pool
+
+        Args:
+            prompt: Input prompt for the model
+            timeout: Seconds to wait for the result
+            **generation_kwargs: Keyword arguments for the Llama call
+
+        Returns:
+            Raw llama.cpp completion dict
+        """
+        return self.submit(prompt, **generation_kwargs).result(timeout=timeout)
+
+    def _collect_responses(self):
+        """Route worker messages to their futures"""
+        while self._running:
+            with self._lock:
+                connections = {w.responses: w for w in self._workers if w.responses is not None}
+            if not connections:
+                time.sleep(0.1)
+                continue
+            for conn in wait_for_connections(list(connections), timeout=0.5):
+                self._handle_response(connections[conn], conn)
+
+    def _handle_response(self, worker: _WorkerHandle, conn):
+        """Route one message from a worker's pipe to its future"""
+        try:
+            kind, worker_id, job_id, payload = conn.recv()
+        except (EOFError, OSError):
+            # The worker exited; the monitor restarts it on a fresh pipe
+            with self._lock:
+                if worker.responses is conn:
+                    worker.responses = None
+            return
+
+        with self._lock:
+            if worker.responses is not conn:
+                # Sent by a process that has since been replaced
+                return
+            worker.last_seen = time.time()
+
+            if kind == _MSG_READY:
+                worker.ready = True
+                worker.pid = payload
+                self._ready_event.notify_all()
+                logger.info(f"LLM worker {worker_id} ready (pid {payload})")
+                self._drain_pending()
+                return
+
+            if kind == _MSG_LOAD_FAILED:
+                worker.load_failed = True
+                logger.error(f"❌ LLM worker {worker_id} failed to load model: {payload}")
+                self._ready_event.notify_all()
+                self._drain_pending()
+                return
+
+            if kind == _MSG_PONG:
+                return
+
+            worker.in_flight.pop(job_id, None)
+            future = self._futures.pop(job_id, None)
+            if kind == _MSG_RESULT:
+                worker.completed += 1
+                if future and not future.done():
+                    future.set_result(payload)
+            else:
+                worker.failed += 1
+                if future and not future.done():
+                    future.set_exception(RuntimeError(payload))
+            self._drain_pending()
+
+    def _monitor_workers(self):
+        """Restart crashed or hung workers and queue the jobs they were holding again"""
+        while self._running:
+            time.sleep(self.health_check_interval)
+            with self._lock:
+                if not self._running:
+                    break
+                for worker in self._workers:
+                    if worker.alive:
+                        if not worker.ready:
+                            # Still loading the model; load time is bounded by start()'s timeout
+                            continue
+                        silent_for = time.time() - worker.last_seen
+                        if silent_for <= self.ping_timeout:
+                            if not worker.in_flight:
+                                # Idle workers answer a ping so last_seen stays fresh
+                                worker.request_queue.put((-1, None, None))
+                            continue
+                        logger.warning(f"⚠️ LLM worker {worker.worker_id} unresponsive for "
+                                       f"{silent_for:.0f}s, killing it")
+                        worker.process.kill()
+                        worker.process.join(1.0)
+                        self._restart(worker, 'hung')
+                        continue
+                    if worker.load_failed:
+                        # Restarting cannot fix a model that does not load
+                        continue
+
+                    exitcode = worker.process.exitcode if worker.process else None
+                    logger.warning(f"⚠️ LLM worker {worker.worker_id} died (exit code {exitcode}), restarting")
+                    self._restart(worker, 'crashed')
+
+    def _restart(self, worker: _WorkerHandle, reason: str):
+        """Respawn a dead worker and queue its job again, or fail it after max_retries (caller holds the lock)"""
+        orphaned = worker.in_flight
+        worker.in_flight = {}
+        worker.restarts += 1
+        self._spawn(worker)
+
+        for job_id, (prompt, generation_kwargs, attempts) in orphaned.items():
+            if attempts < self.max_retries:
+                self._dispatch(job_id, (prompt, generation_kwargs, attempts + 1), retry=True)
+            else:
+                future = self._futures.pop(job_id, None)
+                if future and not future.done():
+                    future.set_exception(RuntimeError(
+                        f"LLM worker {worker.worker_id} {reason} while generating"))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get per-worker health and load statistics
+
+        Returns:
+            Dictionary with pool statistics
+        """
+        with self._lock:
+            return {
+                'num_workers': self.num_workers,
+                'ready_workers': sum(1 for w in self._workers if w.ready and w.alive),
+                'pending_jobs': len(self._futures),
+                'queued_jobs': len(self._pending),
+                'workers': [
+                    {
+                        'worker_id': w.worker_id,
+                        'pid': w.pid,
+                        'alive': w.alive,
+                        'ready': w.ready,
+                        'in_flight': len(w.in_flight),
+                        'completed': w.completed,
+                        'failed': w.failed,
+                        'cancelled': w.cancelled,
+                        'restarts': w.restarts,
+                        'seconds_since_seen': round(time.time() - w.last_seen, 1)
+                    }
+                    for w in self._workers
+                ]
+            }
+
+    def shutdown(self, timeout: float = 5.0):
+        """Stop all workers and fail any outstanding requests"""
+        with self._lock:
+            self._running = False
+            for worker in self._workers:
+                if worker.alive:
+                    worker.request_queue.put(None)
+            for future in self._futures.values():
+                if not future.done():
+                    future.set_exception(RuntimeError("LLM pool shut down"))
+            self._futures.clear()
+            self._pending.clear()
+
+        for worker in self._workers:
+            if worker.process is not None:
+                worker.process.join(timeout)
+                if worker.process.is_alive():
+                    worker.process.terminate()
+            worker.ready = False
+            worker.in_flight = {}
+
+        logger.info("LLM pool shut down")
@@ -0,0 +1,404 @@
+"""
+Out-of-Process LLM Server and Pooled Client
+Serves one warm model to many UI processes over an OpenAI-compatible HTTP API (TCP or Unix socket)
+
+Usage:
+    python llm_server.py [--model PATH] [--port 8080 | --socket /tmp/llm.sock] [--pool-size N]
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import socket
+import logging
+import argparse
+import threading
+import http.client
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+from typing import Dict, Any, Optional, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Request fields passed through to the completion call (OpenAI fields plus llama.cpp extras)
+COMPLETION_FIELDS = ('max_tokens', 'temperature', 'top_p', 'top_k', 'repeat_penalty', 'stop', 'echo', 'grammar',
+                     'early_stop_sections')
+
+# Errors meaning a pooled keep-alive connection was closed by the server
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                           ConnectionResetError, BrokenPipeError)
+
+
+class _CompletionHandler(BaseHTTPRequestHandler):
+    """HTTP handler for /health, /v1/models and /v1/completions"""
+
+    protocol_version = 'HTTP/1.1'  # Keep connections alive for pooled clients
+    server_version = 'AmazonAIChatbotLLM/1.0'
+
+    def address_string(self) -> str:
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+    def log_message(self, format: str, *args):
+        logger.debug(f"{self.address_string()} - {format % args}")
+
+    def _send_json(self, status: int, payload: Dict[str, Any]):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, message: str):
+        self._send_json(status, {'error': {'message': message, 'code': status}})
+
+    def do_GET(self):
+        loader = self.server.loader
+        if self.path == '/health':
+            status = loader.get_load_status()
+            if loader.is_loaded:
+                self._send_json(200, {'status': 'ok'})
+            else:
+                self._send_json(503, {'status': status['state'], 'load_status': status})
+        elif self.path == '/v1/models':
+            model_id = os.path.basename(loader.model_path)
+            self._send_json(200, {'object': 'list', 'data': [{'id': model_id, 'object': 'model', 'owned_by': 'local'}]})
+        else:
+            self._send_error(404, f"Unknown path: {self.path}")
+
+    def do_POST(self):
+        if self.path not in ('/v1/completions', '/completions'):
+            self._send_error(404, f"Unknown path: {self.path}")
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+            prompt = request['prompt']
+        except (ValueError, KeyError) as e:
+            self._send_error(400, f"Invalid completion request: {str(e)}")
+            return
+
+        loader = self.server.loader
+        if not loader.is_loaded:
+            self._send_error(503, loader.get_load_status()['message'])
+            return
+
+        generation_kwargs = loader._generation_kwargs(request.get('max_tokens'))
+        generation_kwargs.update({k: request[k] for k in COMPLETION_FIELDS if k in request and request[k] is not None})
+
+        try:
+            if 'grammar' in generation_kwargs:
+                from llama_cpp import LlamaGrammar
+                generation_kwargs['grammar'] = LlamaGrammar.from_string(generation_kwargs['grammar'], verbose=False)
+            response = loader._run_completion(prompt, generation_kwargs, deadline=request.get('deadline'))
+        except Exception as e:
+            logger.error(f"❌ Completion failed: {str(e)}")
+            self._send_error(500, str(e))
+            return
+
+        self._send_json(200, response)
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Threaded HTTP server on a Unix domain socket"""
+
+    daemon_threads = True
+
+
+class LLMServer:
+    """
+    Local inference server sharing one warm LLMLoader between processes
+
+    Exposes an OpenAI-compatible /v1/completions endpoint (plus the
+    llama.cpp 'grammar' extension), so clients can also point at a stock
+    llama.cpp server instead.
+    """
+
+    def __init__(self, loader, host: str = '127.0.0.1', port: int = 8080, socket_path: str = None):
+        """
+        Initialize the server
+
+        Args:
+            loader: LLMLoader that runs the completions (in-process model or worker pool)
+            host: TCP bind address
+            port: TCP port (0 picks a free port)
+            socket_path: Serve on this Unix socket instead of TCP
+        """
+        self.loader = loader
+        self.socket_path = socket_path
+
+        if socket_path:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            self.httpd = _UnixHTTPServer(socket_path, _CompletionHandler)
+        else:
+            self.httpd = ThreadingHTTPServer((host, port), _CompletionHandler)
+            self.httpd.daemon_threads = True
+        self.httpd.loader = loader
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """Client URL for this server"""
+        if self.socket_path:
+            return f"unix://{self.socket_path}"
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def serve_forever(self):
+        """Serve requests until shutdown() is called"""
+        logger.info(f"LLM server listening on {self.url}")
+        self.httpd.serve_forever()
+
+    def start(self) -> threading.Thread:
+        """Serve requests in a background thread"""
+        self._thread = threading.Thread(target=self.serve_forever, name='llm-server', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def shutdown(self):
+        """Stop serving and release the socket"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.socket_path and os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection over a Unix domain socket"""
+
+    def __init__(self, socket_path: str, timeout: float = None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class LLMServerClient:
+    """
+    Client for an OpenAI-compatible completion server with persistent pooled connections
+
+    Accepts 'http://host:port' (a bundled LLMServer or a llama.cpp server)
+    or 'unix:///path/to.sock' (a bundled LLMServer on a Unix socket).
+    """
+
+    def __init__(self, url: str, pool_size: int = 4, timeout: float = 300.0, model: str = None):
+        """
+        Initialize the client
+
+        Args:
+            url: Server URL
+            pool_size: Maximum idle connections kept open
+            timeout: Socket timeout in seconds for a request
+            model: Model name sent with requests (needed by some servers)
+        """
+        self.url = url
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.model = model
+
+        parsed = urlparse(url)
+        if parsed.scheme == 'unix':
+            self._socket_path = parsed.path
+            self._host, self._port, self._prefix = None, None, ''
+        elif parsed.scheme == 'http':
+            self._socket_path = None
+            self._host, self._port = parsed.hostname, parsed.port or 80
+            self._prefix = parsed.path.rstrip('/')
+        else:
+            raise ValueError(f"Unsupported server URL (use http:// or unix://): {url}")
+
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'errors': 0, 'connections_opened': 0, 'connections_reused': 0}
+
+    def _new_connection(self) -> http.client.HTTPConnection:
+        with self._lock:
+            self.stats['connections_opened'] += 1
+        if self._socket_path:
+            return UnixHTTPConnection(self._socket_path, timeout=self.timeout)
+        return http.client.HTTPConnection(self._host, self._port, timeout=self.timeout)
+
+    def _acquire(self) -> Tuple[http.client.HTTPConnection, bool]:
+        """Take an idle connection, or open one; returns (connection, reused)"""
+        try:
+            connection = self._idle.get_nowait()
+            with self._lock:
+                self.stats['connections_reused'] += 1
+            return connection, True
+        except queue.Empty:
+            return self._new_connection(), False
+
+    def _release(self, connection: http.client.HTTPConnection):
+        if self._idle.qsize() < self.pool_size:
+            self._idle.put(connection)
+        else:
+            connection.close()
+
+    def _request(self, method: str, path: str, payload: Dict[str, Any] = None,
+                 timeout: float = None) -> Tuple[int, Dict[str, Any]]:
+        """
+        Send one request on a pooled connection
+
+        A reused connection the server has since closed is retried once on a fresh one.
+        A connection that times out is closed rather than returned to the pool.
+
+        Args:
+            method: HTTP method
+            path: Request path
+            payload: JSON body
+            timeout: Socket timeout for this request (defaults to the client timeout)
+
+        Returns:
+            HTTP status and decoded JSON body
+        """
+        body = json.dumps(payload).encode('utf-8') if payload is not None else None
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+
+        connection, reused = self._acquire()
+        while True:
+            connection.timeout = timeout or self.timeout
+            if connection.sock is not None:
+                connection.sock.settimeout(connection.timeout)
+            try:
+                connection.request(method, self._prefix + path, body=body, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+                break
+            except STALE_CONNECTION_ERRORS:
+                connection.close()
+                if not reused:
+                    with self._lock:
+                        self.stats['errors'] += 1
+                    raise
+                connection, reused = self._new_connection(), False
+            except Exception:
+                connection.close()
+                with self._lock:
+                    self.stats['errors'] += 1
+                raise
+
+        if response.will_close:
+            connection.close()
+        else:
+            self._release(connection)
+
+        with self._lock:
+            self.stats['requests'] += 1
+        try:
+            return response.status, json.loads(data) if data else {}
+        except ValueError:
+            return response.status, {'error': {'message': data.decode('utf-8', 'replace')}}
+
+    def health(self) -> Dict[str, Any]:
+        """
+        Query server health
+
+        Returns:
+            Dictionary with 'status' ('ok' when ready) and any details the server reports
+        """
+        try:
+            status, data = self._request('GET', '/health')
+        except OSError as e:
+            return {'status': 'unreachable', 'error': str(e)}
+        data.setdefault('status', 'ok' if status == 200 else 'error')
+        return data
+
+    def wait_until_ready(self, timeout: float = 300.0, interval: float = 0.5) -> bool:
+        """
+        Poll /health until the server's model is loaded
+
+        Returns:
+            True if the server became ready within the timeout
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            health = self.health()
+            if health['status'] == 'ok':
+                return True
+            if health['status'] == 'failed' or time.monotonic() >= deadline:
+                logger.error(f"❌ Model server not ready: {health}")
+                return False
+            time.sleep(interval)
+
+    def completion(self, prompt: str, timeout: float = None, **kwargs) -> Dict[str, Any]:
+        """
+        Run a completion on the server
+
+        Args:
+            prompt: Input prompt
+            timeout: Seconds to wait for the answer (raises TimeoutError)
+            **kwargs: Sampling arguments (max_tokens, temperature, stop, grammar as GBNF text,
+                and 'deadline' as an absolute time.time() for the bundled server)
+
+        Returns:
+            OpenAI-style completion dict ('choices', 'usage')
+        """
+        payload = {'prompt': prompt, **kwargs}
+        if self.model:
+            payload['model'] = self.model
+
+        status, data = self._request('POST', '/v1/completions', payload, timeout=timeout)
+        if status != 200:
+            error = data.get('error')
+            message = error.get('message') if isinstance(error, dict) else error
+            raise RuntimeError(f"Model server error {status}: {message}")
+        return data
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Connection pool statistics"""
+        with self._lock:
+            return dict(self.stats, url=self.url, idle_connections=self._idle.qsize())
+
+    def close(self):
+        """Close all idle connections"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+def main():
+    """Command-line entry point: run the bundled server"""
+    from llm_loader import LLMLoader
+
+    parser = argparse.ArgumentParser(description="Local LLM server for the chatbot")
+    parser.add_argument('--model', default=None, help="GGUF model path (default: auto-selected variant)")
+    parser.add_argument('--host', default='127.0.0.1', help="TCP bind address")
+    parser.add_argument('--port', type=int, default=8080, help="TCP port")
+    parser.add_argument('--socket', default=None, help="Serve on a Unix socket instead of TCP")
+    parser.add_argument('--pool-size', type=int, default=0, help="Model worker processes (0 = one in-process model)")
+    args = parser.parse_args()
+
+    loader = LLMLoader(args.model)
+    loader.config['pool_size'] = args.pool_size
+    if not os.path.exists(loader.model_path):
+        print(f"❌ Model file not found: {loader.model_path}")
+        return False
+
+    # Serve /health while the model loads so clients can wait for it
+    loader.start_background_load()
+    server = LLMServer(loader, host=args.host, port=args.port, socket_path=args.socket)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        loader.unload_model()
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,168 @@
+"""
+GGUF Quantization Variant Discovery and Selection
+Finds local model variants (Q3/Q4/Q5...) and picks one for a latency target or memory cap
+"""
+
+import os
+import re
+import json
+import glob
+import socket
+import logging
+from typing import List, Dict, Any, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MODEL_SEARCH_DIRS = ["models", ".", os.path.expanduser("~/models")]
+BENCHMARK_RESULTS_PATH = os.path.expanduser("~/.cache/amazon-ai-chatbot/model_benchmarks.json")
+
+# Quantization tag at the end of the file name, e.g. mistral-7b-instruct-v0.1.Q4_K_M.gguf
+QUANT_PATTERN = re.compile(r'[._-]((?:I?Q\d(?:_[A-Z0-9]+)*)|F16|BF16|F32)\.gguf$', re.IGNORECASE)
+
+# Approximate bits per weight, used to rank variants by quality
+QUANT_BITS = {
+    'Q2_K': 2.6, 'IQ3_XS': 3.3, 'Q3_K_S': 3.5, 'Q3_K_M': 3.9, 'Q3_K_L': 4.3,
+    'IQ4_XS': 4.3, 'Q4_0': 4.5, 'Q4_K_S': 4.6, 'Q4_K_M': 4.8, 'Q5_0': 5.5,
+    'Q5_K_S': 5.5, 'Q5_K_M': 5.7, 'Q6_K': 6.6, 'Q8_0': 8.5, 'F16': 16.0, 'BF16': 16.0, 'F32': 32.0,
+}
+
+# KV cache per context token for Mistral-7B (32 layers x 8 KV heads x 128 dims x K+V x fp16)
+KV_CACHE_BYTES_PER_TOKEN = 32 * 8 * 128 * 2 * 2
+
+
+def discover_model_variants(search_dirs: List[str] = None, family: str = None) -> List[Dict[str, Any]]:
+    """
+    Find all local GGUF model variants
+
+    Args:
+        search_dirs: Directories to scan (defaults to MODEL_SEARCH_DIRS)
+        family: Optional file-name prefix to restrict results, e.g. 'mistral-7b-instruct'
+
+    Returns:
+        List of variants with path, quant, bits_per_weight and size_mb, largest first
+    """
+    variants = {}
+    for directory in search_dirs or MODEL_SEARCH_DIRS:
+        for path in glob.glob(os.path.join(directory, "*.gguf")):
+            name = os.path.basename(path)
+            if family and not name.lower().startswith(family.lower()):
+                continue
+
+            match = QUANT_PATTERN.search(name)
+            quant = match.group(1).upper() if match else 'UNKNOWN'
+            real_path = os.path.realpath(path)
+            if real_path in variants:
+                continue
+
+            variants[real_path] = {
+                'path': path,
+                'name': name,
+                'quant': quant,
+                'bits_per_weight': QUANT_BITS.get(quant, 0.0),
+                'size_mb': os.path.getsize(path) / 1024 ** 2,
+            }
+
+    return sorted(variants.values(), key=lambda v: v['size_mb'], reverse=True)
+
+
+def estimate_memory_mb(variant: Dict[str, Any], n_ctx: int = 2048) -> float:
+    """Resident memory estimate: mapped weights plus the KV cache for n_ctx tokens"""
+    return variant['size_mb'] + n_ctx * KV_CACHE_BYTES_PER_TOKEN / 1024 ** 2
+
+
+def load_benchmark_results(path: str = BENCHMARK_RESULTS_PATH) -> Dict[str, Dict[str, Any]]:
+    """
+    Load measured results for this host written by the benchmark command
+
+    Returns:
+        Mapping of model file name to its benchmark result
+    """
+    try:
+        with open(path) as f:
+            return json.load(f).get(socket.gethostname(), {})
+    except (OSError, ValueError):
+        return {}
+
+
+def save_benchmark_results(results: Dict[str, Dict[str, Any]], path: str = BENCHMARK_RESULTS_PATH):
+    """Persist benchmark results for this host, keyed by model file name"""
+    try:
+        with open(path) as f:
+            all_results = json.load(f)
+    except (OSError, ValueError):
+        all_results = {}
+
+    all_results.setdefault(socket.gethostname(), {}).update(results)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(all_results, f, indent=2)
+
+
+def estimate_latency_ms(variant: Dict[str, Any], measurements: Dict[str, Dict[str, Any]]) -> Optional[float]:
+    """
+    Latency of a typical answer for a variant
+
+    Uses the benchmark measurement when available. Otherwise scales the
+    closest measured variant by file size, since CPU generation is bound by
+    memory bandwidth and reads every weight once per token.
+
+    Args:
+        variant: Variant from discover_model_variants()
+        measurements: Benchmark results keyed by file name
+
+    Returns:
+        Estimated milliseconds per answer, or None if nothing has been measured
+    """
+    measured = measurements.get(variant['name'])
+    if measured and measured.get('avg_latency_ms'):
+        return measured['avg_latency_ms']
+
+    references = [m for m in measurements.values() if m.get('avg_latency_ms') and m.get('size_mb')]
+    if not references:
+        return None
+
+    reference = min(references, key=lambda m: abs(m['size_mb'] - variant['size_mb']))
+    return reference['avg_latency_ms'] * variant['size_mb'] / reference['size_mb']
+
+
+def select_model_variant(variants: List[Dict[str, Any]], latency_target_ms: float = None,
+                         memory_cap_mb: float = None, n_ctx: int = 2048,
+                         measurements: Dict[str, Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Pick the highest-quality variant that meets the latency target and memory cap
+
+    Args:
+        variants: Output of discover_model_variants()
+        latency_target_ms: Maximum acceptable latency for a typical answer
+        memory_cap_mb: Maximum resident memory for the model
+        n_ctx: Context window, for the KV cache estimate
+        measurements: Benchmark results keyed by file name (loaded if None)
+
+    Returns:
+        Chosen variant, or None if no variants exist
+    """
+    if not variants:
+        return None
+
+    measurements = load_benchmark_results() if measurements is None else measurements
+    candidates = list(variants)
+
+    if memory_cap_mb:
+        candidates = [v for v in candidates if estimate_memory_mb(v, n_ctx) <= memory_cap_mb]
+
+    if latency_target_ms:
+        estimates = {v['path']: estimate_latency_ms(v, measurements) for v in candidates}
+        if any(e is not None for e in estimates.values()):
+            candidates = [v for v in candidates
+                          if estimates[v['path']] is not None and estimates[v['path']] <= latency_target_ms]
+        else:
+            logger.warning("No benchmark results yet; run 'python benchmark.py models' to apply the latency target")
+
+    if not candidates:
+        smallest = min(variants, key=lambda v: v['size_mb'])
+        logger.warning(f"⚠️ No model variant meets the constraints, using the smallest: {smallest['name']}")
+        return smallest
+
+    return max(candidates, key=lambda v: (v['bits_per_weight'], v['size_mb']))
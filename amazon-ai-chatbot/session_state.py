@@ -0,0 +1,255 @@
+"""
+Per-Conversation llama.cpp State Cache
+Keeps each chat session's transcript and KV-cache snapshot, LRU-bounded in memory with disk spill
+"""
+
+import os
+import pickle
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SESSION_STATE_DIR = os.path.expanduser("~/.cache/amazon-ai-chatbot/sessions")
+
+
+def _state_nbytes(state) -> int:
+    """Memory held by a LlamaState snapshot"""
+    if state is None:
+        return 0
+    return int(state.llama_state_size) + int(state.scores.nbytes) + int(state.input_ids.nbytes)
+
+
+class SessionStateCache:
+    """
+    Session-affine llama.cpp state store
+
+    Each entry holds the session's prompt transcript (the exact text whose
+    tokens are in the KV cache), the base context it was built from, the
+    number of turns, and optionally a LlamaState snapshot. Snapshots are
+    kept in memory up to max_memory_mb; the least recently used are
+    written to spill_dir (or dropped without one) and restored from there
+    when the session returns, including after a restart.
+
+    On disk each session has a small metadata file (transcript, context,
+    turns) and a separate snapshot file, so looking a session up does not
+    load its KV state. Files are kept within max_disk_mb by deleting the
+    least recently used snapshots first, then metadata.
+    """
+
+    def __init__(self, max_memory_mb: float = 1024, spill_dir: Optional[str] = SESSION_STATE_DIR,
+                 max_sessions: int = 256, max_disk_mb: float = 4096):
+        """
+        Initialize the cache
+
+        Args:
+            max_memory_mb: Memory cap for in-memory state snapshots
+            spill_dir: Directory for evicted snapshots (None = drop them)
+            max_sessions: Sessions tracked in memory (transcripts are small)
+            max_disk_mb: Disk cap for spilled sessions
+        """
+        self.max_memory_bytes = int(max_memory_mb * 1024 ** 2)
+        self.spill_dir = spill_dir
+        self.max_sessions = max_sessions
+        self.max_disk_bytes = int(max_disk_mb * 1024 ** 2)
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'disk_restores': 0, 'spills': 0, 'evictions': 0,
+                      'disk_deletions': 0}
+
+    def _spill_path(self, session_id: str, kind: str) -> str:
+        """Path of a session's 'meta' or 'state' file"""
+        digest = hashlib.sha1(session_id.encode('utf-8')).hexdigest()
+        return os.path.join(self.spill_dir, f"{digest}.{kind}.pkl")
+
+    def _dump(self, path: str, data: Dict[str, Any]):
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+    def _write_spill(self, session_id: str, entry: Dict[str, Any]):
+        """Persist an entry's metadata and, if it has one, its snapshot (caller holds the lock)"""
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            meta = {k: v for k, v in entry.items() if k != 'state'}
+            if entry.get('state') is not None:
+                # The snapshot keeps the transcript it covers; the metadata may move on without it
+                self._dump(self._spill_path(session_id, 'state'),
+                           {'session_id': session_id, 'transcript': entry.get('transcript'), 'state': entry['state']})
+            self._dump(self._spill_path(session_id, 'meta'), {'session_id': session_id, **meta})
+            self.stats['spills'] += 1
+        except OSError as e:
+            logger.warning(f"⚠️ Could not spill session state to disk: {str(e)}")
+            return
+        self._enforce_disk_budget()
+
+    def _read_spill(self, session_id: str, kind: str) -> Optional[Dict[str, Any]]:
+        """Load a session's spilled 'meta' or 'state' file (caller holds the lock)"""
+        if not self.spill_dir:
+            return None
+        path = self._spill_path(session_id, kind)
+        try:
+            with open(path, 'rb') as f:
+                data = pickle.load(f)
+            # Reading counts as use for the disk LRU
+            os.utime(path)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        if data.pop('session_id', None) != session_id:
+            return None
+        if kind == 'state':
+            self.stats['disk_restores'] += 1
+        return data
+
+    def _enforce_disk_budget(self):
+        """Delete least recently used spill files until under max_disk_mb (caller holds the lock)"""
+        try:
+            files = [(entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                     for entry in os.scandir(self.spill_dir) if entry.name.endswith('.pkl')]
+        except OSError:
+            return
+        total = sum(size for _, size, _ in files)
+        if total <= self.max_disk_bytes:
+            return
+
+        # Snapshots are large and can be recomputed from the transcript; metadata goes last
+        files.sort(key=lambda f: (not f[2].endswith('.state.pkl'), f[0]))
+        for _, size, path in files:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.stats['disk_deletions'] += 1
+
+    def _evict(self):
+        """Spill least recently used snapshots until under the memory cap (caller holds the lock)"""
+        for session_id, entry in self._entries.items():
+            if self._memory_bytes <= self.max_memory_bytes:
+                break
+            if entry.get('state') is None:
+                continue
+            if self.spill_dir:
+                self._write_spill(session_id, entry)
+            self._memory_bytes -= _state_nbytes(entry['state'])
+            entry['state'] = None
+            self.stats['evictions'] += 1
+
+        while len(self._entries) > self.max_sessions:
+            _, entry = self._entries.popitem(last=False)
+            self._memory_bytes -= _state_nbytes(entry.get('state'))
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a session's transcript and context (restoring it from disk if needed)
+
+        Returns:
+            Copy of the entry without its snapshot, or None for an unknown session
+        """
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                # Only the metadata is loaded; take_state() reads the snapshot when the model needs it
+                entry = self._read_spill(session_id, 'meta')
+                if entry is None:
+                    self.stats['misses'] += 1
+                    return None
+                entry['state'] = None
+                self._entries[session_id] = entry
+                self._evict()
+            self.stats['hits'] += 1
+            self._entries.move_to_end(session_id)
+            return {k: v for k, v in entry.items() if k != 'state'}
+
+    def update(self, session_id: str, **fields: Any):
+        """Set transcript/context/turn fields of a session, creating it if needed"""
+        with self._lock:
+            entry = self._entries.setdefault(session_id, {'transcript': '', 'context': '', 'turns': 0, 'state': None})
+            entry.update(fields)
+            self._entries.move_to_end(session_id)
+            self._evict()
+
+    def store_state(self, session_id: str, state):
+        """Keep a snapshot of the session's KV state (e.g. when another session takes the model)"""
+        with self._lock:
+            entry = self._entries.setdefault(session_id, {'transcript': '', 'context': '', 'turns': 0, 'state': None})
+            self._memory_bytes += _state_nbytes(state) - _state_nbytes(entry.get('state'))
+            entry['state'] = state
+            self._entries.move_to_end(session_id)
+            self._evict()
+
+    def take_state(self, session_id: str):
+        """
+        Remove and return the session's snapshot (restoring it from disk if needed)
+
+        Returns:
+            LlamaState, or None if the session has no snapshot
+        """
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None and entry.get('state') is None:
+                spilled = self._read_spill(session_id, 'state')
+                # An older snapshot still covers a prefix of the current transcript
+                if spilled is not None and entry.get('transcript', '').startswith(spilled.get('transcript') or '\0'):
+                    entry['state'] = spilled.get('state')
+                    self._memory_bytes += _state_nbytes(entry['state'])
+            if entry is None or entry.get('state') is None:
+                return None
+            state = entry['state']
+            entry['state'] = None
+            self._memory_bytes -= _state_nbytes(state)
+            return state
+
+    def persist(self, session_id: str, state):
+        """Write the session's current state to disk so it survives a restart"""
+        if not self.spill_dir:
+            return
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                self._write_spill(session_id, dict(entry, state=state))
+
+    def flush(self):
+        """Write every in-memory snapshot to disk (e.g. before shutdown)"""
+        if not self.spill_dir:
+            return
+        with self._lock:
+            for session_id, entry in self._entries.items():
+                if entry.get('state') is not None:
+                    self._write_spill(session_id, entry)
+
+    def drop(self, session_id: str = None):
+        """Forget a session (None = every session) in memory and on disk"""
+        with self._lock:
+            if session_id is None:
+                self._entries.clear()
+                self._memory_bytes = 0
+                paths = [entry.path for entry in os.scandir(self.spill_dir)
+                         if entry.name.endswith('.pkl')] if self.spill_dir and os.path.isdir(self.spill_dir) else []
+            else:
+                entry = self._entries.pop(session_id, None)
+                if entry is not None:
+                    self._memory_bytes -= _state_nbytes(entry.get('state'))
+                paths = [self._spill_path(session_id, kind) for kind in ('meta', 'state')] if self.spill_dir else []
+            for path in paths:
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Cache statistics"""
+        with self._lock:
+            return dict(
+                self.stats,
+                sessions=len(self._entries),
+                snapshots_in_memory=sum(1 for e in self._entries.values() if e.get('state') is not None),
+                memory_mb=self._memory_bytes / 1024 ** 2,
+                max_memory_mb=self.max_memory_bytes / 1024 ** 2,
+            )
@@ -0,0 +1,132 @@
+"""
+Speculative Decoding with a Small Local Draft Model
+A small GGUF model proposes tokens that the main model verifies in one batched evaluation
+"""
+
+import logging
+import importlib.util
+from typing import Any, Dict
+
+import numpy as np
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+if importlib.util.find_spec("llama_cpp") is not None:
+    # Subclass the library's draft-model interface so an API change fails at import, not mid-generation
+    from llama_cpp.llama_speculative import LlamaDraftModel
+else:
+    # Without llama-cpp-python no draft model can be loaded, but the module stays importable
+    LlamaDraftModel = object
+
+
+class GGUFDraftModel(LlamaDraftModel):
+    """
+    Draft model for llama.cpp speculative decoding
+
+    llama-cpp-python calls the draft model with the token sequence accepted
+    so far and evaluates the returned proposal in a single batch on the main
+    model, keeping the longest prefix the main model agrees with. This class
+    runs a small GGUF model greedily to produce those proposals and counts
+    how many of them are accepted.
+
+    The draft model must share the main model's tokenizer vocabulary.
+    """
+
+    def __init__(self, model_path: str, lookahead: int = 4, n_ctx: int = 2048,
+                 n_threads: int = None, n_batch: int = 512):
+        """
+        Load the draft model
+
+        Args:
+            model_path: Path to the small GGUF draft model
+            lookahead: Number of tokens proposed per step
+            n_ctx: Context window (must cover the main model's prompts)
+            n_threads: CPU threads for the draft model
+            n_batch: Batch size for prompt processing
+        """
+        from llama_cpp import Llama
+
+        self.model_path = model_path
+        self.lookahead = lookahead
+        self.llm = Llama(
+            model_path=model_path,
+            n_ctx=n_ctx,
+            n_threads=n_threads,
+            n_batch=n_batch,
+            n_gpu_layers=0,
+            verbose=False
+        )
+
+        self.proposed_tokens = 0
+        self.accepted_tokens = 0
+        self.draft_calls = 0
+        self._last_input_len = 0
+        self._last_draft: np.ndarray = np.array([], dtype=np.intc)
+        self._last_prefix: np.ndarray = np.array([], dtype=np.intc)
+
+        logger.info(f"Draft model loaded from: {model_path} (lookahead {lookahead})")
+
+    @property
+    def n_vocab(self) -> int:
+        return self.llm.n_vocab()
+
+    def _record_acceptance(self, input_ids: np.ndarray):
+        """
+        Count how many tokens of the previous proposal the main model kept
+
+        Only proposals the main model went on to verify are counted, so the
+        last proposal of a finished completion does not skew the rate.
+        """
+        if not len(self._last_draft):
+            return
+
+        prev_len = self._last_input_len
+        if len(input_ids) <= prev_len or not np.array_equal(input_ids[:prev_len], self._last_prefix):
+            # A new completion started; the previous proposal was never verified
+            return
+
+        self.proposed_tokens += len(self._last_draft)
+        appended = input_ids[prev_len:prev_len + len(self._last_draft)]
+        matches = appended == self._last_draft[:len(appended)]
+        self.accepted_tokens += int(np.argmin(matches)) if not matches.all() else len(matches)
+
+    def __call__(self, input_ids: np.ndarray, /, **kwargs: Any) -> np.ndarray:
+        """
+        Propose the next tokens for the given sequence
+
+        Args:
+            input_ids: Tokens accepted so far (prompt plus generated)
+
+        Returns:
+            Array of proposed token ids
+        """
+        self._record_acceptance(input_ids)
+
+        # generate() reuses the longest cached prefix, so only the new tokens are evaluated
+        draft = []
+        for token in self.llm.generate(input_ids.tolist(), top_k=1, temp=0.0, reset=True):
+            draft.append(token)
+            if len(draft) >= self.lookahead or token == self.llm.token_eos():
+                break
+
+        self._last_input_len = len(input_ids)
+        self._last_prefix = np.array(input_ids, copy=True)
+        self._last_draft = np.array(draft, dtype=np.intc)
+        self.draft_calls += 1
+        return self._last_draft
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get cumulative draft statistics
+
+        Returns:
+            Dictionary with proposed/accepted token counts and acceptance rate
+        """
+        return {
+            'draft_calls': self.draft_calls,
+            'proposed_tokens': self.proposed_tokens,
+            'accepted_tokens': self.accepted_tokens,
+            'acceptance_rate': self.accepted_tokens / self.proposed_tokens if self.proposed_tokens else 0.0,
+        }
@@ -0,0 +1,91 @@
+"""
+Structured Output Mode for the LLM
+GBNF grammar that forces a compact JSON answer, plus parsing and markdown rendering
+"""
+
+import json
+import logging
+from typing import Dict, Any, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Compact answer schema: up to 5 numeric findings, 3 insights and 3 recommendations.
+# Bounded repetitions keep the generated token count small and predictable.
+BUSINESS_ANSWER_GBNF = r'''
+root            ::= "{" ws "\"findings\":" ws findings "," ws "\"insights\":" ws insights "," ws "\"recommendations\":" ws recommendations ws "}"
+findings        ::= "[" ws finding ("," ws finding){0,4} ws "]"
+finding         ::= "{" ws "\"metric\":" ws string "," ws "\"segment\":" ws segment "," ws "\"value\":" ws number ws "}"
+insights        ::= "[" ws string ("," ws string){0,2} ws "]"
+recommendations ::= "[" ws recommendation ("," ws recommendation){0,2} ws "]"
+recommendation  ::= "{" ws "\"segment\":" ws segment "," ws "\"action\":" ws string ws "}"
+segment         ::= "null" | [0-9]{1,3}
+number          ::= "-"? [0-9]{1,12} ("." [0-9]{1,2})?
+string          ::= "\"" [^"\\\n]{1,160} "\""
+ws              ::= [ \n]{0,2}
+'''
+
+STRUCTURED_PROMPT_INSTRUCTIONS = """INSTRUCTIONS:
+Answer as JSON with:
+- "findings": the key numbers from the data ("metric" name, "segment" id or null for overall, exact "value")
+- "insights": short explanations of why these patterns exist
+- "recommendations": actionable strategies ("segment" id or null, "action")
+Copy numbers exactly from the data. Do NOT make up data."""
+
+
+def parse_structured_response(text: str) -> Optional[Dict[str, Any]]:
+    """
+    Parse a grammar-constrained model answer
+
+    Args:
+        text: Raw JSON text generated under BUSINESS_ANSWER_GBNF
+
+    Returns:
+        Parsed answer, or None if the output was cut off or malformed
+    """
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        logger.warning("Structured response was not valid JSON (likely truncated by max_tokens)")
+        return None
+
+    if not all(isinstance(data.get(key), list) for key in ('findings', 'insights', 'recommendations')):
+        return None
+    return data
+
+
+def _format_value(value: Any) -> str:
+    """Format a numeric reference with thousands separators"""
+    if isinstance(value, float) and not value.is_integer():
+        return f"{value:,.2f}"
+    return f"{int(value):,}" if isinstance(value, (int, float)) else str(value)
+
+
+def render_structured_response(data: Dict[str, Any]) -> str:
+    """
+    Render a structured answer as the chat's three markdown sections
+
+    Args:
+        data: Parsed answer from parse_structured_response()
+
+    Returns:
+        Markdown response
+    """
+    lines = ["📊 **Data Analysis**"]
+    for finding in data['findings']:
+        scope = f"Segment {finding['segment']}" if finding.get('segment') is not None else "Overall"
+        lines.append(f"• {scope} — {finding['metric']}: {_format_value(finding['value'])}")
+
+    lines.append("")
+    lines.append("🧠 **Business Insights**")
+    for insight in data['insights']:
+        lines.append(f"• {insight}")
+
+    lines.append("")
+    lines.append("🎯 **Recommendations**")
+    for recommendation in data['recommendations']:
+        prefix = f"Segment {recommendation['segment']}: " if recommendation.get('segment') is not None else ""
+        lines.append(f"• {prefix}{recommendation['action']}")
+
+    return '\n'.join(lines)
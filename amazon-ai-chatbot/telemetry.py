@@ -0,0 +1,115 @@
+"""
+LLM Inference Telemetry
+Per-request latency breakdown with rolling p50/p95 summaries
+"""
+
+import time
+import logging
+import threading
+from collections import deque
+from typing import Dict, Any, List, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Per-request metrics summarized with rolling percentiles
+TIMED_METRICS = (
+    'prompt_tokens', 'cached_prompt_tokens', 'prompt_eval_seconds', 'ttft_seconds',
+    'generated_tokens', 'generation_tokens_per_sec', 'queue_wait_seconds', 'total_seconds',
+)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of a list of values (0 for an empty list)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class InferenceTelemetry:
+    """
+    Rolling window of per-request inference metrics
+
+    Each record covers one completion: prompt size, how much of it was
+    served from the KV cache, prompt evaluation time, time to first token,
+    generated tokens, generation throughput, queue wait and total time.
+    """
+
+    def __init__(self, window: int = 500):
+        """
+        Initialize telemetry
+
+        Args:
+            window: Number of recent requests kept for percentiles
+        """
+        self.window = window
+        self._records: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.total_requests = 0
+
+    def record(self, **metrics: Any) -> Dict[str, Any]:
+        """
+        Record one request
+
+        Args:
+            **metrics: Values for TIMED_METRICS plus descriptive fields
+                (backend, finish_reason, ...); missing metrics are left out
+
+        Returns:
+            The stored record
+        """
+        entry = {'timestamp': time.time()}
+        entry.update({k: v for k, v in metrics.items() if v is not None})
+        with self._lock:
+            self._records.append(entry)
+            self.total_requests += 1
+        return entry
+
+    def get_recent(self, n: int = 20) -> List[Dict[str, Any]]:
+        """Most recent records, newest last"""
+        with self._lock:
+            return list(self._records)[-n:]
+
+    def get_summary(self) -> Dict[str, Any]:
+        """
+        Rolling summary over the window
+
+        Returns:
+            Request counts, prompt cache hit rate and p50/p95/mean/last per metric
+        """
+        with self._lock:
+            records = list(self._records)
+            total_requests = self.total_requests
+
+        metrics = {}
+        for name in TIMED_METRICS:
+            values = [r[name] for r in records if name in r]
+            if values:
+                metrics[name] = {
+                    'p50': percentile(values, 0.5),
+                    'p95': percentile(values, 0.95),
+                    'mean': sum(values) / len(values),
+                    'last': values[-1],
+                }
+
+        prompt_tokens = sum(r.get('prompt_tokens', 0) for r in records)
+        cached_tokens = sum(r.get('cached_prompt_tokens', 0) for r in records)
+        return {
+            'requests': total_requests,
+            'window_requests': len(records),
+            'cache_hits': sum(1 for r in records if r.get('cached_prompt_tokens', 0) > 0),
+            'prompt_cache_hit_rate': cached_tokens / prompt_tokens if prompt_tokens else 0.0,
+            'metrics': metrics,
+        }
+
+    def metric(self, name: str, stat: str = 'p50') -> Optional[float]:
+        """Single summary value, e.g. metric('ttft_seconds', 'p95')"""
+        return self.get_summary()['metrics'].get(name, {}).get(stat)
+
+    def reset(self):
+        """Clear all records"""
+        with self._lock:
+            self._records.clear()
+            self.total_requests = 0
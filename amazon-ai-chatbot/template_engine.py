@@ -0,0 +1,325 @@
+"""
+Deterministic Template Answer Engine
+Answers data questions directly from BusinessLogic with exact numbers, bypassing the LLM
+"""
+
+import re
+import logging
+from typing import List, Dict, Any
+
+from business_logic import BusinessLogic
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Per intent, phrasings of lookups the intent's template answers in full. Generic
+# question words ("what is", "which") are not enough on their own: "What is
+# driving churn?" needs the LLM even though it starts like a lookup.
+INTENT_LOOKUP_PATTERNS = {
+    'segment_analysis': [
+        r'\b(which|what)\b[\w\s\']*\bsegments?\b[\w\s\']*\b(most|best|worst|highest|lowest|least|largest|'
+        r'biggest|smallest|fewest|top)\b',
+        r'\brank(ed|ing)?\b[\w\s]*\bsegments?\b|\bsegments?\b[\w\s]*\brank(ed|ing)?\b',
+        r'\b(show|list|tell me about|summari[sz]e|overview of|stats|metrics|numbers)\b[\w\s]*\bsegment\s+\d',
+        r'\bhow many customers\b',
+    ],
+    'comparison': [
+        r'\bcompare\b', r'\bvs\.?(?!\w)', r'\bversus\b', r'\bdifference between\b',
+    ],
+    'churn_analysis': [
+        r'\b(which|what)\b[\w\s\']*\b(segments?|customers?)\b[\w\s\']*\b(at risk|churn)',
+        r'\bhow many\b[\w\s]*\b(at risk|churn)',
+        r'\bchurn( risk)? (distribution|breakdown|rates?|percentages?|levels?|by segment)\b',
+        r'\bchurn risk (of|for|in)\b',
+        r'\b(show|list)\b[\w\s]*\bchurn',
+    ],
+    'customer_behavior': [
+        r'\bhow often\b', r'\bpurchase frequency\b', r'\baverage (order value|spend|purchases?)\b',
+        r'\b(what|show|list)\b[\w\s\']*\b(buying|purchas(e|ing)|spending) (patterns?|habits?|behaviou?r)\b',
+    ],
+    'business_metrics': [
+        r'\b(total|average|overall|avg)\b[\w\s]*\b(revenue|clv|lifetime value|customers|order value|sales)\b',
+        r'\b(revenue|clv|sales)\b[\w\s]*\b(by|per) segment\b',
+        r'\bhow (much|many)\b', r'\bbreakdown\b',
+    ],
+}
+
+# Phrasings that ask for reasoning or strategy, which the LLM should handle
+OPEN_QUESTION_MARKERS = [
+    r'\bwhy\b', r'\bhow can\b', r'\bhow do\b', r'\bhow to\b', r'\bhow should\b', r'\bexplain\b',
+    r'\bstrateg(y|ies)\b', r'\bideas?\b', r'\bimprove\b', r'\bincrease\b', r'\bgrow\b',
+    r'\bshould we\b', r'\bplan\b', r'\bcampaigns?\b'
+]
+
+# Ranking metric keywords: (pattern, summary key, label, higher_is_better)
+RANKING_METRICS = [
+    (r'\bclv\b|lifetime value|valuable', 'avg_clv', 'Average CLV', True),
+    (r'\bcustomers\b|\blargest\b|\bbiggest\b|\bsize\b', 'customer_count', 'Customer Count', True),
+    (r'\bfrequen', 'avg_frequency', 'Average Frequency', True),
+    (r'\brecen|\bactive\b|\bengaged\b', 'avg_recency', 'Average Recency', False),
+    (r'\brfm\b|\bscore\b', 'avg_rfm_score', 'RFM Score', True),
+    (r'\bspend|\border value\b|\bmonetary\b', 'avg_monetary', 'Average Monetary Value', True),
+]
+
+
+class TemplateAnswerEngine:
+    """
+    Renders exact answers from BusinessLogic for every chatbot intent
+    and scores how completely a template answers a given question
+    """
+
+    def __init__(self, business_logic: BusinessLogic):
+        """
+        Initialize the template engine
+
+        Args:
+            business_logic: Business logic instance providing the data
+        """
+        self.business_logic = business_logic
+        self._lookup_patterns = {intent: re.compile('|'.join(f'(?:{p})' for p in patterns))
+                                 for intent, patterns in INTENT_LOOKUP_PATTERNS.items()}
+        self._open_markers = re.compile('|'.join(OPEN_QUESTION_MARKERS))
+        self._renderers = {
+            'segment_analysis': self._render_segment_analysis,
+            'comparison': self._render_comparison,
+            'churn_analysis': self._render_churn_analysis,
+            'marketing_strategy': self._render_marketing_strategy,
+            'customer_behavior': self._render_customer_behavior,
+            'business_metrics': self._render_business_metrics,
+            'general': self._render_overview,
+        }
+
+    def score_confidence(self, user_query: str, intent: str, segments: List[int]) -> float:
+        """
+        Estimate how completely a template answers the question
+
+        Questions matching a lookup the intent's template answers ("which
+        segment has the highest CLV", "compare segment 1 vs 2") score high;
+        reasoning and strategy questions ("why", "how can we", "what is
+        driving churn") score low so they go to the LLM.
+
+        Args:
+            user_query: User's question
+            intent: Detected intent
+            segments: Extracted segment numbers
+
+        Returns:
+            Confidence between 0 and 1
+        """
+        query_lower = user_query.lower()
+        score = 0.5
+
+        lookup = self._lookup_patterns.get(intent)
+        if lookup is not None and lookup.search(query_lower):
+            score += 0.3
+        if self._open_markers.search(query_lower):
+            score -= 0.4
+
+        if intent == 'comparison':
+            score += 0.2 if len(segments) >= 2 else 0.0
+        elif intent == 'marketing_strategy':
+            # Rule-based recommendations are a starting point, not a strategy
+            score -= 0.2
+        elif segments:
+            score += 0.1
+        elif intent == 'general':
+            score -= 0.3
+
+        return max(0.0, min(1.0, score))
+
+    def render(self, user_query: str, intent: str, segments: List[int]) -> str:
+        """
+        Render the template answer for an intent
+
+        Args:
+            user_query: User's question
+            intent: Detected intent
+            segments: Extracted segment numbers
+
+        Returns:
+            Markdown answer with exact figures
+        """
+        renderer = self._renderers.get(intent, self._render_overview)
+        return renderer(user_query.lower(), segments)
+
+    def _summary(self) -> Dict[int, Dict[str, Any]]:
+        return self.business_logic.get_segment_summary()
+
+    @staticmethod
+    def _segment_metrics(segment_id: int, data: Dict[str, Any]) -> str:
+        return (f"**Segment {segment_id}**\n"
+                f"• Customer Count: {data['customer_count']:,} ({data['percentage']:.1f}% of customers)\n"
+                f"• Total Revenue: ${data['total_revenue']:,.2f}\n"
+                f"• Average Monetary Value: ${data['avg_monetary']:.2f}\n"
+                f"• Average Frequency: {data['avg_frequency']:.1f}\n"
+                f"• Average Recency: {data['avg_recency']:.0f} days\n"
+                f"• Average CLV: ${data['avg_clv']:,.2f}\n"
+                f"• RFM Score: {data['avg_rfm_score']:.1f}/100")
+
+    def _render_segment_analysis(self, query_lower: str, segments: List[int]) -> str:
+        summary = self._summary()
+        known = [s for s in segments if s in summary]
+
+        if known:
+            sections = [self._segment_metrics(s, summary[s]) for s in known]
+            return "📊 **Segment Analysis**\n\n" + "\n\n".join(sections)
+
+        # No segment named: rank segments by the metric the question asks about
+        key, label, higher_is_better = 'total_revenue', 'Total Revenue', True
+        for pattern, metric_key, metric_label, metric_higher in RANKING_METRICS:
+            if re.search(pattern, query_lower):
+                key, label, higher_is_better = metric_key, metric_label, metric_higher
+                break
+
+        if re.search(r'\b(lowest|least|smallest|fewest)\b', query_lower):
+            descending = False
+        elif re.search(r'\b(highest|largest|biggest)\b', query_lower):
+            descending = True
+        else:
+            # "best", "most active" etc. rank better values first; "worst" reverses that
+            descending = higher_is_better != bool(re.search(r'\bworst\b', query_lower))
+        ranked = sorted(summary.items(), key=lambda item: item[1][key], reverse=descending)
+        top_id, top = ranked[0]
+
+        lines = [f"📊 **Segment Ranking by {label}**", ""]
+        lines.append(f"**Top answer: Segment {top_id}** — {label}: {self._format_metric(key, top[key])}")
+        lines.append("")
+        for rank, (segment_id, data) in enumerate(ranked, 1):
+            context = f"{data['customer_count']:,} customers"
+            if key != 'total_revenue':
+                context += f", ${data['total_revenue']:,.2f} revenue"
+            lines.append(f"{rank}. Segment {segment_id}: {self._format_metric(key, data[key])} ({context})")
+        return '\n'.join(lines)
+
+    @staticmethod
+    def _format_metric(key: str, value: float) -> str:
+        if key in ('total_revenue', 'avg_monetary', 'avg_clv'):
+            return f"${value:,.2f}"
+        if key == 'customer_count':
+            return f"{value:,}"
+        if key == 'avg_recency':
+            return f"{value:.0f} days"
+        return f"{value:.1f}"
+
+    def _render_comparison(self, query_lower: str, segments: List[int]) -> str:
+        summary = self._summary()
+        known = [s for s in segments if s in summary]
+
+        if len(known) < 2:
+            known = list(summary.keys())
+
+        if len(known) == 2:
+            comparison = self.business_logic.compare_segments(known[0], known[1])
+            seg1, seg2 = comparison['segment1_data'], comparison['segment2_data']
+            return f"""⚖️ **Segment Comparison: {known[0]} vs {known[1]}**
+
+| Metric | Segment {known[0]} | Segment {known[1]} | Difference |
+|---|---|---|---|
+| Customers | {seg1['customer_count']:,} | {seg2['customer_count']:,} | {comparison['customer_count_diff']:+,} |
+| Total Revenue | ${seg1['total_revenue']:,.2f} | ${seg2['total_revenue']:,.2f} | ${comparison['revenue_diff']:+,.2f} |
+| Avg Monetary | ${seg1['avg_monetary']:.2f} | ${seg2['avg_monetary']:.2f} | ${comparison['monetary_diff']:+,.2f} |
+| Avg Frequency | {seg1['avg_frequency']:.1f} | {seg2['avg_frequency']:.1f} | {comparison['frequency_diff']:+.1f} |
+| Avg Recency (days) | {seg1['avg_recency']:.0f} | {seg2['avg_recency']:.0f} | {comparison['recency_diff']:+.0f} |
+| Avg CLV | ${seg1['avg_clv']:,.2f} | ${seg2['avg_clv']:,.2f} | ${comparison['clv_diff']:+,.2f} |
+| RFM Score | {seg1['avg_rfm_score']:.1f} | {seg2['avg_rfm_score']:.1f} | {comparison['rfm_score_diff']:+.1f} |
+
+**Better Performing:** Segment {comparison['better_segment']} (higher total revenue)"""
+
+        lines = ["⚖️ **Segment Comparison**", "",
+                 "| Segment | Customers | Total Revenue | Avg CLV | Avg Recency (days) | RFM Score |",
+                 "|---|---|---|---|---|---|"]
+        for segment_id in known:
+            data = summary[segment_id]
+            lines.append(f"| {segment_id} | {data['customer_count']:,} | ${data['total_revenue']:,.2f} | "
+                         f"${data['avg_clv']:,.2f} | {data['avg_recency']:.0f} | {data['avg_rfm_score']:.1f} |")
+        return '\n'.join(lines)
+
+    def _render_churn_analysis(self, query_lower: str, segments: List[int]) -> str:
+        churn = self.business_logic.get_churn_risk_analysis()
+        percentages = churn['churn_percentages']
+        summary = self._summary()
+        known = [s for s in segments if s in summary] or list(summary.keys())
+
+        lines = ["⚠️ **Churn Risk Analysis**", ""]
+        for segment_id in known:
+            cells = [f"{risk}: {percentages[risk].get(segment_id, 0.0):.1f}%" for risk in percentages]
+            lines.append(f"• Segment {segment_id} — " + ", ".join(cells))
+
+        lines.append("")
+        lines.append(f"**Low Churn Risk Segments:** {churn['low_churn_segments'] or 'None'}")
+        lines.append(f"**High Churn Risk Segments:** {churn['high_churn_segments'] or 'None'}")
+        distribution = ", ".join(f"{risk}: {count:,}" for risk, count in churn['overall_churn_distribution'].items())
+        lines.append(f"**Overall Distribution (customers):** {distribution}")
+        return '\n'.join(lines)
+
+    def _render_marketing_strategy(self, query_lower: str, segments: List[int]) -> str:
+        summary = self._summary()
+        known = [s for s in segments if s in summary] or list(summary.keys())
+
+        lines = ["🎯 **Marketing Recommendations**"]
+        for segment_id in known:
+            data = summary[segment_id]
+            lines.append("")
+            lines.append(f"**Segment {segment_id}** (RFM {data['avg_rfm_score']:.1f}/100, "
+                         f"{data['avg_recency']:.0f} days recency, {data['avg_frequency']:.1f} purchases)")
+            for recommendation in self.business_logic.get_marketing_recommendations(segment_id):
+                lines.append(f"• {recommendation}")
+        return '\n'.join(lines)
+
+    def _render_customer_behavior(self, query_lower: str, segments: List[int]) -> str:
+        summary = self._summary()
+        known = [s for s in segments if s in summary] or list(summary.keys())
+
+        lines = ["👥 **Customer Behavior by Segment**"]
+        for segment_id in known:
+            characteristics = self.business_logic.get_segment_characteristics(segment_id)
+            patterns = characteristics['behavioral_patterns']
+            value = characteristics['business_value']
+            lines.append("")
+            lines.append(f"**Segment {segment_id}**")
+            lines.append(f"• Purchase Frequency: {patterns['purchase_frequency_pattern']} "
+                         f"({summary[segment_id]['avg_frequency']:.1f} purchases)")
+            lines.append(f"• Spending: {patterns['spending_pattern']} "
+                         f"(${summary[segment_id]['avg_monetary']:.2f} average)")
+            lines.append(f"• Engagement: {patterns['engagement_level']} "
+                         f"({summary[segment_id]['avg_recency']:.0f} days since last purchase)")
+            lines.append(f"• Revenue Contribution: {value['revenue_contribution']:.1f}% from "
+                         f"{value['customer_share']:.1f}% of customers")
+            lines.append(f"• Average Order Value: ${value['avg_order_value']:.2f}")
+        return '\n'.join(lines)
+
+    def _render_business_metrics(self, query_lower: str, segments: List[int]) -> str:
+        df = self.business_logic.df
+        summary = self._summary()
+        total_revenue = df['Monetary'].sum()
+        known = [s for s in segments if s in summary] or list(summary.keys())
+
+        lines = ["💰 **Business Metrics**", "",
+                 f"• Total Customers: {len(df):,}",
+                 f"• Total Revenue: ${total_revenue:,.2f}",
+                 f"• Average Customer Lifetime Value: ${df['CLV'].mean():,.2f}",
+                 "", "**By Segment:**"]
+        for segment_id in known:
+            data = summary[segment_id]
+            share = data['total_revenue'] / total_revenue * 100 if total_revenue else 0.0
+            lines.append(f"• Segment {segment_id}: ${data['total_revenue']:,.2f} revenue ({share:.1f}%), "
+                         f"${data['avg_clv']:,.2f} average CLV")
+        return '\n'.join(lines)
+
+    def _render_overview(self, query_lower: str, segments: List[int]) -> str:
+        summary = self._summary()
+        known = [s for s in segments if s in summary]
+        if known:
+            return "📊 **Segment Overview**\n\n" + "\n\n".join(self._segment_metrics(s, summary[s]) for s in known)
+
+        most_profitable = self.business_logic.get_most_profitable_segment()
+        return f"""📊 **Customer Segmentation Overview**
+
+I can help you analyze your customer segments! Here's a quick overview:
+
+**Most Profitable Segment:** Segment {most_profitable[0]}
+• Revenue: ${most_profitable[1]['total_revenue']:,.2f}
+• Customers: {most_profitable[1]['customer_count']:,}
+
+Ask me about specific segments, comparisons, or marketing strategies!"""
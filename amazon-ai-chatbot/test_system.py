@@ -4,13 +4,68 @@ Tests all components without requiring the LLM model
 """
 
 import pandas as pd
+import numpy as np
 import sys
 import os
-from datetime import datetime
+import time
+import uuid
+import asyncio
+import tempfile
+import importlib.util
+import threading
+import multiprocessing as mp
+from collections import deque
+from datetime import datetime, timedelta
+from types import SimpleNamespace
 
 # Add current directory to path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+class SlowModel:
+    """Llama stand-in that streams `chunks` tokens, one every 10 ms (tokens are prompt bytes)"""
+    
+    def __init__(self, chunks=100):
+        self.chunks = chunks
+    
+    def tokenize(self, data, add_bos=True, special=False):
+        return list(data)
+    
+    def detokenize(self, tokens):
+        return bytes(tokens)
+    
+    def __call__(self, prompt, stream=False, **kwargs):
+        def chunks():
+            for i in range(self.chunks):
+                time.sleep(0.01)
+                yield {'choices': [{'text': f"t{i} ", 'finish_reason': None}]}
+        return chunks()
+
+def fake_pool_worker(worker_id, model_path, llama_kwargs, request_queue, response_conn, cancel_job):
+    """LLM pool worker stand-in: echoes prompts; 'crash:<file>' exits, 'hang:<file>' stops responding
+    until <file> exists and 'slow' generates for 30s unless cancelled"""
+    time.sleep(llama_kwargs.get('load_seconds', 0))
+    response_conn.send(('ready', worker_id, None, os.getpid()))
+    while True:
+        job = request_queue.get()
+        if job is None:
+            break
+        job_id, prompt, generation_kwargs = job
+        if prompt is None:
+            response_conn.send(('pong', worker_id, job_id, None))
+            continue
+        action, _, marker = prompt.partition(':')
+        if action == 'slow':
+            stop_at = time.time() + 30
+            while cancel_job.value != job_id and time.time() < stop_at:
+                time.sleep(0.01)
+            action = 'cancelled' if cancel_job.value == job_id else 'slow'
+        if action in ('crash', 'hang') and not os.path.exists(marker):
+            open(marker, 'w').close()
+            if action == 'crash':
+                os._exit(1)
+            time.sleep(3600)
+        response_conn.send(('result', worker_id, job_id, {'choices': [{'text': f"echo {action}"}]}))
+
 def test_data_loading():
     """Test customer data loading and validation"""
     print("🧪 Testing Data Loading...")
@@ -83,6 +138,20 @@ def test_business_logic():
         recommendations = business_logic.get_marketing_recommendations(segments[0])
         print(f"✅ Marketing recommendations generated: {len(recommendations)} items")
         
+        # Test box-plot statistics and chart payload (independent of row count)
+        distribution = business_logic.get_metric_distribution('Monetary')
+        segment_monetary = business_logic.df[business_logic.df['Cluster'] == segments[0]]['Monetary']
+        if abs(distribution[segments[0]]['median'] - segment_monetary.median()) > 1e-9:
+            print(f"❌ Metric distribution wrong: {distribution[segments[0]]}")
+            return False
+        from dashboard_charts import build_dashboard_figures
+        payload = len(build_dashboard_figures(business_logic)['monetary_box'].to_json())
+        larger = BusinessLogic(pd.concat([df] * 50, ignore_index=True))
+        if len(build_dashboard_figures(larger)['monetary_box'].to_json()) > payload * 1.1:
+            print("❌ Chart payload grows with row count")
+            return False
+        print(f"✅ Dashboard charts from quartiles: {payload:,} byte box plot")
+        
         return True
         
     except Exception as e:
@@ -118,15 +187,290 @@ def test_chatbot_controller():
             intent = chatbot.detect_intent(query)
             segments = chatbot.extract_segment_numbers(query)
             print(f"✅ Query: '{query[:30]}...' → Intent: {intent}, Segments: {segments}")
+            if chatbot.analyze_query(query) != (intent, segments):
+                print(f"❌ Single-scan query analysis disagrees for: {query}")
+                return False
+        
+        # Test the committed intent classifier (batch API agrees with per-query detection)
+        if chatbot.intent_classifier is not None:
+            batch_intents = chatbot.classify_intents(test_queries)
+            if batch_intents != [chatbot.detect_intent(query) for query in test_queries]:
+                print(f"❌ Batch intent classification disagrees: {batch_intents}")
+                return False
+            # Featureless rows sit between real ones so the batched row offsets are exercised
+            mixed_batch = ["", test_queries[0], "", "", test_queries[-1]]
+            if chatbot.intent_classifier.classify_batch(mixed_batch) != [
+                    chatbot.intent_classifier.classify(query) for query in mixed_batch]:
+                print("❌ Batched classifier scores drift from per-query scores around empty queries")
+                return False
+            evaluation = chatbot.intent_classifier.evaluation
+            if evaluation['combined_accuracy'] <= evaluation['regex_accuracy'] or 'sklearn' in sys.modules:
+                print(f"❌ Intent classifier served without beating regex or imported scikit-learn: {evaluation}")
+                return False
+            print(f"✅ Intent classifier: {len(chatbot.intent_classifier.classes)} intents, batch matches per-query")
+        if chatbot.intent_matcher.scan("Do customers who buy TVs churn?")[0] == 'comparison':
+            print("❌ Regex 'vs' still matches inside words")
+            return False
+        
+        # Test the batch answering API (order kept, duplicates answered once)
+        report_queries = ["Compare segment 0 and 1", "What should we do next quarter?", "compare  segment 0 and 1"]
+        report = chatbot.get_responses(report_queries)
+        if ([r['query'] for r in report] != report_queries or report[2]['duplicate_of'] != 0
+                or report[2]['response'] != report[0]['response'] or report[0]['outcome'] != 'template'):
+            print(f"❌ Batch answers wrong: {[(r['outcome'], r['duplicate_of']) for r in report]}")
+            return False
+        print(f"✅ Batch answers: {[r['outcome'] for r in report]}")
+        
+        # Model-bound batch answers build each report context once and prompt with the query's intent
+        class PromptRecordingModel(SlowModel):
+            def __call__(self, prompt, stream=False, **kwargs):
+                generated_prompts.append(prompt)
+                return SlowModel.__call__(self, prompt, **kwargs)
+        
+        built_contexts, prompt_intents, generated_prompts = [], [], []
+        build_context, build_prompt = chatbot.generate_focused_context, chatbot.llm_loader.create_business_prompt
+        chatbot.generate_focused_context = lambda intent, query: (built_contexts.append(intent),
+                                                                  build_context(intent, query))[1]
+        chatbot.llm_loader.create_business_prompt = lambda **kwargs: (prompt_intents.append(kwargs.get('intent')),
+                                                                      build_prompt(**kwargs))[1]
+        chatbot.llm_loader.llm, chatbot.llm_loader.is_loaded = PromptRecordingModel(chunks=2), True
+        chatbot.context_mode = 'report'
+        try:
+            generated = chatbot.get_responses(["Why do customers churn?", "What drives churn in our base?",
+                                               "why do customers CHURN?", "How should we market to new customers?"])
+        finally:
+            del chatbot.generate_focused_context, chatbot.llm_loader.create_business_prompt
+            chatbot.llm_loader.llm, chatbot.llm_loader.is_loaded = None, False
+            chatbot.context_mode = 'retrieval'
+        if (built_contexts != ['churn_analysis', 'marketing_strategy'] or len(generated_prompts) != 3
+                or prompt_intents != ['churn_analysis', 'churn_analysis', 'marketing_strategy']
+                or generated[2]['duplicate_of'] != 0):
+            print(f"❌ Batch prompts rebuilt per query: contexts {built_contexts}, intents {prompt_intents}")
+            return False
+        print(f"✅ Batch prompts: {len(built_contexts)} contexts for {len(generated_prompts)} generations")
+        
+        # Test the session-scoped conversation store (per-session and total caps, SQLite archive)
+        from conversation_store import ConversationStore
+        
+        store = ConversationStore(max_turns_per_session=2, max_total_messages=6,
+                                  db_path=os.path.join(tempfile.mkdtemp(), 'conversations.db'))
+        for session in ('bob', 'carol'):
+            store.add_exchange(session, "hi", "hello")
+        for i in range(3):
+            store.add_exchange('alice', f"question {i}", f"answer {i}")
+        store_stats = store.get_stats()
+        if (len(store.get_history('alice')) != 4 or store.get_history('alice')[0]['content'] != "question 1"
+                or store_stats['messages'] > 6 or store.get_history('bob') or store.get_archived('alice', limit=10)[0]['content'] != "question 0"):
+            print(f"❌ Conversation store limits wrong: {store_stats}")
+            return False
+        store.idle_timeout = 0
+        store.evict_idle()
+        store.close()
+        print(f"✅ Conversation store bounded: {store_stats['messages']} messages, "
+              f"{store_stats['archived_messages']} archived to SQLite")
+        
+        # Persistent log: survives a restart and pages by message ID
+        log_path = os.path.join(tempfile.mkdtemp(), 'conversations.db')
+        store = ConversationStore(max_turns_per_session=2, db_path=log_path, persist=True)
+        for i in range(5):
+            store.add_exchange('dave', f"question {i}", f"answer {i}", intent='general', outcome='template')
+        store.close()
+        store = ConversationStore(max_turns_per_session=2, db_path=log_path, persist=True)
+        latest = store.get_messages('dave', limit=4)
+        older = store.get_messages('dave', limit=4, before_id=latest[0]['id'])
+        if (store.get_history('dave')[-1]['content'] != "answer 4" or len(store.get_history('dave')) != 4
+                or [m['content'] for m in older] != ["question 1", "answer 1", "question 2", "answer 2"]
+                or latest[-1].get('outcome') != 'template' or store.get_sessions()[0]['messages'] != 10):
+            print(f"❌ Conversation log wrong: {[m['content'] for m in latest + older]}")
+            return False
+        
+        # Clearing hides the session's messages, even after a restart, but keeps them in the log
+        store.clear('dave')
+        store.add_exchange('dave', "fresh question", "fresh answer")
+        store.close()
+        store = ConversationStore(max_turns_per_session=2, db_path=log_path, persist=True)
+        visible = [m['content'] for m in store.get_history('dave')]
+        if (visible != ["fresh question", "fresh answer"] or len(store.get_messages('dave')) != 2
+                or len(store.get_messages('dave', include_cleared=True)) != 12):
+            print(f"❌ Clearing the conversation deleted or kept the wrong messages: {visible}")
+            return False
+        store.close()
+        print("✅ Conversation log restored after restart with paged history; clearing hides without deleting")
+        
+        # A returning session ID (as kept in the app's URL) pages its conversation back in a new controller
+        from conversation_store import is_valid_session_id
+        session_id = uuid.uuid4().hex
+        first = ChatbotController(conversation_db_path=log_path)
+        for i in range(3):
+            first.update_conversation_memory(f"question {i}", f"answer {i}", session_id, 'general', 'template')
+        first.conversation_store.close()
+        restarted = ChatbotController(conversation_db_path=log_path)
+        page = restarted.conversation_store.get_messages(session_id, limit=4)
+        older = restarted.conversation_store.get_messages(session_id, limit=4, before_id=page[0]['id'])
+        memory = restarted.conversation_store.get_history(session_id)
+        restarted.conversation_store.close()
+        if ([m['content'] for m in older + page] != ["question 0", "answer 0", "question 1", "answer 1",
+                                                    "question 2", "answer 2"]
+                or memory[-1]['content'] != "answer 2" or not is_valid_session_id(session_id)
+                or any(is_valid_session_id(bad) for bad in ("dave", session_id.upper(), session_id + "0", None))):
+            print(f"❌ Returning session not restored: {[m['content'] for m in older + page]}")
+            return False
+        print("✅ Returning session ID restores its conversation in a new controller")
+        
+        # Test async serving: concurrent requests and cancellation of in-flight generation
+        async def serve():
+            answers = await asyncio.gather(*(chatbot.aget_response(query, session_id=f"async-{i}")
+                                             for i, query in enumerate(test_queries)))
+            loader = chatbot.llm_loader
+            loader.llm, loader.is_loaded = SlowModel(chunks=200), True
+            try:
+                task = asyncio.create_task(chatbot.aget_response("Why do customers churn?", session_id="async-cancel"))
+                await asyncio.sleep(0.2)
+                task.cancel()
+                started = time.monotonic()
+                await asyncio.gather(task, return_exceptions=True)
+                while (loader.last_generation_stats.get('finish_reason') != 'cancelled'
+                       and time.monotonic() - started < 2):
+                    await asyncio.sleep(0.01)
+            finally:
+                loader.llm, loader.is_loaded = None, False
+            
+            # Structured answers are generated on the inference pool, not the analytics executor
+            class StructuredModel(SlowModel):
+                def __call__(self, prompt, stream=False, **kwargs):
+                    generation_threads.append(threading.current_thread().name)
+                    def chunks():
+                        yield {'choices': [{'text': '{"findings": [], "insights": ["Frequent buyers drive revenue"], '
+                                                    '"recommendations": []}', 'finish_reason': 'stop'}]}
+                    return chunks()
+            generation_threads = []
+            loader.llm, loader.is_loaded = StructuredModel(), True
+            loader.config['structured_output'] = True
+            try:
+                # Same session as above, so the stand-in model needs no KV state swap
+                structured_answer = await chatbot.aget_response("Why do customers churn?", session_id="async-cancel")
+            finally:
+                loader.llm, loader.is_loaded = None, False
+                loader.config['structured_output'] = False
+            return answers, structured_answer, generation_threads
+        
+        cancelled_before = chatbot.get_response_metrics()['outcomes'].get('cancelled', 0)
+        async_answers, structured_answer, generation_threads = asyncio.run(serve())
+        if (len(async_answers) != len(test_queries) or not all(async_answers)
+                or "Frequent buyers drive revenue" not in structured_answer
+                or not all(name.startswith("llm-inference") for name in generation_threads)
+                or chatbot.get_response_metrics()['outcomes'].get('cancelled', 0) != cancelled_before + 1
+                or chatbot.llm_loader.last_generation_stats.get('completion_tokens', 200) >= 200):
+            print(f"❌ Async responses failed: {chatbot.get_response_metrics()}")
+            return False
+        print(f"✅ Async responses: {len(async_answers)} concurrent answers, cancellation stops generation, "
+              f"structured answers generated on the inference pool")
         
         # Test context generation
         context = chatbot.generate_focused_context('segment_analysis', 'analyze segment 0')
         print(f"✅ Business context generated: {len(context)} characters")
+        report = chatbot.context_fragments.focused_context('segment_analysis', [0])
+        hits_before = chatbot.context_fragments.get_stats()['hits']
+        if (chatbot.context_fragments.focused_context('segment_analysis', [0]) != report
+                or chatbot.context_fragments.get_stats()['hits'] != hits_before + 2):
+            print(f"❌ Context fragments not reused: {chatbot.context_fragments.get_stats()}")
+            return False
+        
+        # Test retrieval: only facts about the asked segment, within the budget
+        if chatbot.context_retriever is not None:
+            facts = chatbot.context_retriever.retrieve("How many customers in segment 0 are at risk of churning?",
+                                                       'churn_analysis', [0])
+            if (not any(f['kind'] == 'churn' and f['segments'] == {0} for f in facts)
+                    or any(f['segments'] - {0} for f in facts)
+                    or sum(f['tokens'] for f in facts) > chatbot.context_retriever.token_budget
+                    or len(context) >= len(report)):
+                print(f"❌ Context retrieval wrong: {[f['text'] for f in facts]}")
+                return False
+            print(f"✅ Context retrieval: {len(facts)} facts, {len(context)} vs {len(report)} characters")
+            
+            # Retrieval quality: each example question gets the facts that answer it
+            # (a fresh index, since the one above counted tokens with the async test's stand-in model)
+            from context_retriever import create_context_retriever
+            retriever = create_context_retriever(business_logic, chatbot.llm_loader.count_tokens)
+            expected_facts = {
+                "Which customer segment is the most profitable?": ["Most profitable segment", "ranked by total revenue"],
+                "Suggest marketing strategy for low-frequency customers": ["lowest-frequency segment"],
+                "Which segments should we prioritize for retention campaigns?": ["churn risk segments"],
+                "Which customers are at risk of churning?": ["churn risk segments", "churn risk distribution"],
+                "What's our total CLV?": ["Highest CLV segment"],
+                "Compare segment 1 vs segment 2": ["Segment 1:", "Segment 2:", "ranked by average CLV"],
+            }
+            for question, snippets in expected_facts.items():
+                intent, segments = chatbot.analyze_query(question)
+                texts = ' | '.join(f['text'] for f in retriever.retrieve(question, intent, segments))
+                missing = [snippet for snippet in snippets if snippet not in texts]
+                if missing:
+                    print(f"❌ Retrieval for '{question}' ({intent}) missed {missing}: {texts}")
+                    return False
+            print(f"✅ Retrieval covers the facts for {len(expected_facts)} example questions")
         
         # Test fallback responses
         fallback = chatbot._generate_fallback_response("Which segment is best?", "segment_analysis", [0])
         print(f"✅ Fallback response generated: {len(fallback)} characters")
         
+        # Test template engine coverage and routing
+        for intent in list(chatbot.intent_patterns.keys()) + ['general']:
+            answer = chatbot.template_engine.render("Compare segment 0 and 1", intent, [0, 1])
+            if not answer:
+                print(f"❌ No template answer for intent: {intent}")
+                return False
+        confidence = chatbot.template_engine.score_confidence("Compare segment 0 and 1", 'comparison', [0, 1])
+        open_confidence = chatbot.template_engine.score_confidence("Why do customers churn?", 'churn_analysis', [])
+        if confidence < chatbot.template_confidence_threshold or open_confidence >= chatbot.template_confidence_threshold:
+            print(f"❌ Template routing confidence wrong: {confidence:.2f} / {open_confidence:.2f}")
+            return False
+        # Generic question words alone must not route to a template; only intent-specific lookups do
+        routing = {
+            "What is driving churn in segment 2?": False,
+            "What is the best way to grow segment 1?": False,
+            "What do you think about segment 0?": False,
+            "What is segment 1 like?": False,
+            "Which segment has the highest CLV?": True,
+            "What's our total CLV?": True,
+            "Which customers are at risk of churning?": True,
+        }
+        for question, expect_template in routing.items():
+            intent, segments = chatbot.analyze_query(question)
+            score = chatbot.template_engine.score_confidence(question, intent, segments)
+            if (score >= chatbot.template_confidence_threshold) != expect_template:
+                print(f"❌ '{question}' ({intent}) routed to {'template' if not expect_template else 'LLM'}: {score:.2f}")
+                return False
+        print(f"✅ Template engine covers all intents (data question confidence {confidence:.2f})")
+        
+        # Test template answers while the model is loading in the background (held until released)
+        from llm_loader import LLMLoader
+        loader = chatbot.llm_loader
+        release_load = threading.Event()
+        
+        def held_load():
+            release_load.wait(30)
+            return LLMLoader.load_model(loader)
+        
+        loader.load_model = held_load
+        loader.load_status = dict(loader.load_status, state='not_started')
+        try:
+            fallbacks_before = chatbot.get_response_metrics()['outcomes'].get('fallback', 0)
+            response = chatbot.get_response("Why do customers churn?")
+            state_while_answering = loader.get_load_status()['state']
+            fallbacks_after = chatbot.get_response_metrics()['outcomes'].get('fallback', 0)
+            release_load.set()
+            loader._load_thread.join(30)
+            final_state = loader.get_load_status()['state']
+        finally:
+            release_load.set()
+            del loader.load_model
+        if (not response or state_while_answering != 'loading' or fallbacks_after != fallbacks_before + 1
+                or final_state not in ('ready', 'failed')):
+            print(f"❌ Background load wrong: answered during '{state_while_answering}', ended '{final_state}'")
+            return False
+        print(f"✅ Template response while the model is loading ({len(response)} characters); "
+              f"load then ended '{final_state}'")
+        
         # Test system status
         status = chatbot.get_system_status()
         print(f"✅ System status: LLM loaded: {status['llm_loaded']}, Business logic: {status['business_logic_connected']}")
@@ -162,11 +506,410 @@ def test_llm_loader():
         prompt = llm_loader.create_business_prompt(test_query, test_context)
         print(f"✅ Business prompt created: {len(prompt)} characters")
         
+        # Test prompt token budget with oversized context and history
+        long_history = [{'role': 'assistant', 'content': "Detailed answer. " * 500}] * 4
+        prompt = llm_loader.create_business_prompt(test_query, test_context * 500, long_history)
+        usage = llm_loader.last_prompt_usage
+        if llm_loader.count_tokens(prompt) > usage['budget_tokens']:
+            print(f"❌ Prompt exceeds token budget: {usage}")
+            return False
+        print(f"✅ Prompt fits token budget: {usage['total_tokens']}/{usage['budget_tokens']} tokens")
+        
+        # An oversized question is clipped to its share instead of overflowing n_ctx
+        prompt = llm_loader.create_business_prompt("Why do customers churn? " * 2000, test_context, long_history)
+        usage = llm_loader.last_prompt_usage
+        if llm_loader.count_tokens(prompt) > usage['budget_tokens'] or not usage['question_clipped']:
+            print(f"❌ Oversized question overflows the prompt budget: {usage}")
+            return False
+        print(f"✅ Oversized question clipped: {usage['total_tokens']}/{usage['budget_tokens']} tokens")
+        
+        # Test rolling history summary keeps prompt memory bounded as the conversation grows
+        history_sizes = []
+        conversation = []
+        for turn in range(12):
+            conversation.append({'role': 'user', 'content': f"How is segment {turn % 3} doing?"})
+            conversation.append({'role': 'assistant', 'content': f"📊 **Data Analysis**\n• Segment {turn % 3} has "
+                                 f"revenue of ${1000 * (turn + 1):,} and churn risk is low.\n" + "Details. " * 200})
+            llm_loader.create_business_prompt(test_query, test_context, conversation, session_id='test')
+            history_sizes.append(llm_loader.last_prompt_usage['history_tokens'])
+        summary, recent = llm_loader.summarizer.summarize('test', conversation, llm_loader.config['max_history_turns'])
+        if "$12,000" in summary or "$10,000" not in summary or max(history_sizes[4:]) > 2 * history_sizes[3]:
+            print(f"❌ Rolling history summary failed: {history_sizes}")
+            return False
+        print(f"✅ Rolling history summary bounded: {history_sizes[-1]} history tokens after {len(conversation)} messages")
+        
+        # Test the cached summary survives a bounded history window rolling past its oldest messages
+        from conversation_summary import ConversationSummarizer
+        summarizer = ConversationSummarizer(max_summary_chars=2000)
+        window = deque(maxlen=8)
+        started = datetime(2024, 1, 1)
+        for turn in range(10):
+            window.append({'role': 'user', 'content': f"Question {turn}?", 'timestamp': started + timedelta(minutes=2 * turn)})
+            window.append({'role': 'assistant', 'content': "Answer.", 'timestamp': started + timedelta(minutes=2 * turn + 1)})
+            summary, recent = summarizer.summarize('rolling', list(window), 4)
+        questions = [line for line in summary.splitlines() if line.startswith('Q:')]
+        if questions != [f"Q: Question {turn}?" for turn in range(8)] or len(recent) != 4:
+            print(f"❌ Summary cache broke when the history window rolled: {questions}")
+            return False
+        summary, _ = summarizer.summarize('rolling', [{'role': 'user', 'content': "New chat?", 'timestamp': started}] * 6, 4)
+        if summary != "Q: New chat?\nQ: New chat?":
+            print(f"❌ Summary cache not rebuilt for a replaced history: {summary!r}")
+            return False
+        print(f"✅ Rolling summary kept {len(questions)} questions across a rolling history window")
+        
         # Test response cleaning
         test_response = "  [INST] This is a test response </s>  \n\n  "
         cleaned = llm_loader._clean_response(test_response)
         print(f"✅ Response cleaning works: '{cleaned}'")
         
+        # Test structured output parsing and rendering
+        from structured_output import parse_structured_response, render_structured_response
+        structured = parse_structured_response(
+            '{"findings": [{"metric": "Total Revenue", "segment": 0, "value": 47857.25}], '
+            '"insights": ["Frequent buyers drive revenue"], '
+            '"recommendations": [{"segment": 0, "action": "Launch a VIP program"}]}'
+        )
+        rendered = render_structured_response(structured)
+        if "47,857.25" not in rendered or parse_structured_response('{"findings": [') is not None:
+            print("❌ Structured output parsing failed")
+            return False
+        print(f"✅ Structured output rendered: {len(rendered)} characters")
+        
+        # Test quantization variant selection and benchmark scoring
+        from model_variants import select_model_variant
+        from benchmark import score_answer
+        variants = [
+            {'path': 'q5.gguf', 'name': 'q5.gguf', 'quant': 'Q5_K_M', 'bits_per_weight': 5.7, 'size_mb': 4893},
+            {'path': 'q4.gguf', 'name': 'q4.gguf', 'quant': 'Q4_K_M', 'bits_per_weight': 4.8, 'size_mb': 4168},
+            {'path': 'q3.gguf', 'name': 'q3.gguf', 'quant': 'Q3_K_M', 'bits_per_weight': 3.9, 'size_mb': 3355},
+        ]
+        measurements = {'q4.gguf': {'avg_latency_ms': 20000, 'size_mb': 4168}}
+        by_memory = select_model_variant(variants, memory_cap_mb=4500, measurements=measurements)
+        by_latency = select_model_variant(variants, latency_target_ms=18000, measurements=measurements)
+        if by_memory['quant'] != 'Q4_K_M' or by_latency['quant'] != 'Q3_K_M':
+            print(f"❌ Variant selection failed: {by_memory['quant']}, {by_latency['quant']}")
+            return False
+        if not score_answer("Revenue was $47,857.25", [47857.25]) or score_answer("About $40,000", [47857.25]):
+            print("❌ Benchmark answer scoring failed")
+            return False
+        print("✅ Model variant selection and benchmark scoring work")
+        
+        # Test that a crashed or stuck benchmark variant is reported instead of blocking the run
+        from benchmark import _await_result
+        
+        ctx = mp.get_context('spawn')
+        crashed = ctx.Process(target=os._exit, args=(3,))
+        crashed.start()
+        stuck = ctx.Process(target=time.sleep, args=(60,))
+        stuck.start()
+        crash_result = _await_result(crashed, ctx.Queue(), timeout=30)
+        stuck_result = _await_result(stuck, ctx.Queue(), timeout=1)
+        if 'code 3' not in crash_result.get('error', '') or 'timed out' not in stuck_result.get('error', ''):
+            print(f"❌ Failed benchmark variant not reported: {crash_result}, {stuck_result}")
+            return False
+        print(f"✅ Failed benchmark variants reported: {crash_result['error']}; {stuck_result['error']}")
+        
+        # Test the auto-tune candidate grid, calibration prompt and tuning cache round trip
+        from autotune import candidate_grid, calibration_prompt, load_tuned_config, save_tuned_config
+        
+        big_cache = candidate_grid({'physical_cores': 8, 'logical_cores': 16, 'l2_cache': 0, 'l3_cache': 32 * 1024 ** 2})
+        small_cache = candidate_grid({'physical_cores': 1, 'logical_cores': 1, 'l2_cache': 512 * 1024, 'l3_cache': 0})
+        count_words = lambda text: len(text.split())
+        tuning_cache = os.path.join(tempfile.mkdtemp(), 'autotune.json')
+        save_tuned_config('model-a.gguf', {'n_threads': 6, 'n_batch': 256}, tuning_cache)
+        save_tuned_config('model-b.gguf', {'n_threads': 4, 'n_batch': 512}, tuning_cache)
+        if (sorted({c['n_threads'] for c in big_cache}) != [4, 7, 8, 16]
+                or sorted({c['n_batch'] for c in big_cache}) != [128, 256, 512, 1024]
+                or small_cache != [{'n_threads': 1, 'n_batch': b} for b in (128, 256, 512)]
+                or count_words(calibration_prompt(count_words, 1100)) < 1100
+                or calibration_prompt(count_words, 1100) != calibration_prompt(count_words, 1100)):
+            print(f"❌ Auto-tune candidate grid failed: {big_cache}, {small_cache}")
+            return False
+        if (load_tuned_config('model-a.gguf', tuning_cache) != {'n_threads': 6, 'n_batch': 256}
+                or load_tuned_config('model-b.gguf', tuning_cache)['n_threads'] != 4
+                or load_tuned_config('model-c.gguf', tuning_cache) is not None
+                or load_tuned_config('model-a.gguf', tuning_cache + '.missing') is not None):
+            print("❌ Tuning cache round trip failed")
+            return False
+        print(f"✅ Auto-tune grid has {len(big_cache)} candidates on 8 cores and the tuning cache round-trips")
+        
+        # Test deadline and cancellation of streamed generation (with a slow model stand-in)
+        from llm_pool import stream_completion
+        
+        timed_out = stream_completion(SlowModel(), "hi", {}, deadline=time.time() + 0.1)
+        cancel_event = threading.Event()
+        cancel_event.set()
+        cancelled = stream_completion(SlowModel(), "hi", {}, cancel_check=cancel_event.is_set)
+        if (timed_out['choices'][0]['finish_reason'] != 'deadline' or timed_out['usage']['completion_tokens'] >= 100
+                or cancelled['choices'][0]['finish_reason'] != 'cancelled'):
+            print(f"❌ Deadline/cancellation failed: {timed_out}, {cancelled}")
+            return False
+        print(f"✅ Generation stops at deadline after {timed_out['usage']['completion_tokens']} tokens and on cancellation")
+        
+        # Test intent generation profiles and the early stop once the answer sections are complete
+        from llm_pool import sections_end
+        
+        answer = "📊 **Data Analysis**\nRevenue is $1M.\n\n🎯 **Recommendations**\n1. Upsell\n\n2. Retain\n\nOverall this is fine.\n"
+        metrics_kwargs = llm_loader._generation_kwargs(intent='business_metrics')
+        prose_answer = ("📊 **Data Analysis**\nRevenue is $1M.\n\nRecommendations:\nFocus retention on segment 0 "
+                        "with loyalty perks.\n\nAlso, segment 1 should be upsold with bundles.\nThis lifts revenue.\n\n")
+        next_header = prose_answer + "📈 **Next Steps**\nReview monthly.\n"
+        if (sections_end(answer, ['data analysis', 'recommendations']) != answer.index("Overall")
+                or sections_end(answer[:-1], ['data analysis', 'recommendations']) != -1
+                or sections_end(prose_answer, ['data analysis', 'recommendations']) != -1
+                or sections_end(next_header, ['data analysis', 'recommendations']) != next_header.index("📈")
+                or sections_end(prose_answer + "Let me know if you need more.\n",
+                                ['data analysis', 'recommendations']) != len(prose_answer)
+                or metrics_kwargs['max_tokens'] >= llm_loader._generation_kwargs()['max_tokens']
+                or 'early_stop_sections' not in metrics_kwargs):
+            print(f"❌ Intent generation profiles failed: {metrics_kwargs}")
+            return False
+        print(f"✅ Intent profiles limit business_metrics to {metrics_kwargs['max_tokens']} tokens with early stop")
+        
+        # Per-intent stop sequences reach the completion call
+        class RecordingModel(SlowModel):
+            def __call__(self, prompt, stream=False, **kwargs):
+                calls.append(kwargs)
+                return SlowModel.__call__(self, prompt, **kwargs)
+        
+        calls = []
+        llm_loader.llm, llm_loader.is_loaded = RecordingModel(chunks=2), True
+        try:
+            llm_loader.generate_with_deadline("hi", intent='comparison')
+            llm_loader.generate_with_deadline("hi", intent='marketing_strategy')
+        finally:
+            llm_loader.llm, llm_loader.is_loaded = None, False
+        comparison_stops, strategy_stops = calls[0]['stop'], calls[1]['stop']
+        if ("\n\nOverall" not in comparison_stops or "\n\nLet me know" not in comparison_stops
+                or "[INST]" not in comparison_stops or "\n\nOverall" in strategy_stops
+                or "\n\nLet me know" not in strategy_stops):
+            print(f"❌ Intent stop sequences not passed to the model: {comparison_stops}, {strategy_stops}")
+            return False
+        print(f"✅ Intent stop sequences reach the model: {len(comparison_stops)} for comparison answers")
+        
+        # Test the worker pool: dispatch, restart of a crashed or hung worker and retry of its job
+        from llm_pool import LLMWorkerPool
+        
+        class FakeWorkerPool(LLMWorkerPool):
+            worker_target = staticmethod(fake_pool_worker)
+        
+        marker_dir = tempfile.mkdtemp()
+        # One slow-loading worker: a retried job must wait for the respawned worker to report ready
+        pool = FakeWorkerPool('fake.gguf', {'load_seconds': 0.5}, num_workers=1,
+                              health_check_interval=0.1, ping_timeout=1.0)
+        try:
+            if not pool.start(timeout=30):
+                print("❌ Worker pool did not start")
+                return False
+            answers = [f.result(timeout=30)['choices'][0]['text'] for f in
+                       [pool.submit("echo"), pool.submit(f"crash:{marker_dir}/crash"), pool.submit("echo")]]
+            hung_answer = pool.generate(f"hang:{marker_dir}/hang", timeout=30)['choices'][0]['text']
+            # Cancelling drops a queued job and stops the running one, freeing the worker
+            running, queued = pool.submit("slow"), pool.submit("slow")
+            time.sleep(0.3)
+            queued.cancel()
+            running.cancel()
+            cancel_started = time.monotonic()
+            after_cancel = pool.generate("echo", timeout=30)['choices'][0]['text']
+            cancel_seconds = time.monotonic() - cancel_started
+            pool_stats = pool.get_stats()
+        finally:
+            pool.shutdown()
+        if (answers != ["echo echo", "echo crash", "echo echo"] or hung_answer != "echo hang"
+                or after_cancel != "echo echo" or cancel_seconds > 5 or pool_stats['workers'][0]['cancelled'] != 1
+                or pool_stats['workers'][0]['restarts'] != 2 or pool_stats['workers'][0]['completed'] != 6):
+            print(f"❌ Worker pool restart/retry failed: {answers}, {hung_answer}, {pool_stats}")
+            return False
+        failing_pool = FakeWorkerPool('fake.gguf', {}, num_workers=1, health_check_interval=0.1, max_retries=0)
+        try:
+            failing_pool.start(timeout=30)
+            crash_error = failing_pool.submit(f"crash:{marker_dir}/no-retry").exception(timeout=30)
+        finally:
+            failing_pool.shutdown()
+        if not isinstance(crash_error, RuntimeError):
+            print(f"❌ Worker pool did not fail a job past max_retries: {crash_error}")
+            return False
+        print(f"✅ Worker pool restarts crashed and hung workers and retries their jobs "
+              f"({pool_stats['workers'][0]['restarts']} restarts); a cancelled job frees its worker "
+              f"in {cancel_seconds:.2f}s")
+        
+        # Test inference telemetry (TTFT, throughput, queue wait percentiles)
+        requests_before = llm_loader.get_telemetry()['requests']
+        llm_loader.llm, llm_loader.is_loaded = SlowModel(), True
+        for _ in range(3):
+            llm_loader.generate_response("hi", deadline=time.time() + 0.05)
+        telemetry = llm_loader.get_telemetry()
+        llm_loader.llm, llm_loader.is_loaded = None, False
+        if telemetry['requests'] != requests_before + 3 or telemetry['metrics']['ttft_seconds']['p95'] <= 0:
+            print(f"❌ Inference telemetry missing: {telemetry}")
+            return False
+        print(f"✅ Telemetry recorded: TTFT p50 {telemetry['metrics']['ttft_seconds']['p50'] * 1000:.0f} ms, "
+              f"{telemetry['metrics']['generation_tokens_per_sec']['p50']:.0f} tok/s")
+        
+        # Test draft acceptance counting and per-request acceptance stats under concurrency
+        from speculative import GGUFDraftModel
+        
+        if importlib.util.find_spec("llama_cpp") is not None:
+            from llama_cpp.llama_speculative import LlamaDraftModel
+            if not issubclass(GGUFDraftModel, LlamaDraftModel):
+                print("❌ Draft model does not implement llama-cpp-python's LlamaDraftModel interface")
+                return False
+        draft = object.__new__(GGUFDraftModel)
+        draft.proposed_tokens = draft.accepted_tokens = draft.draft_calls = 0
+        draft._last_input_len, draft._last_prefix = 3, np.array([1, 2, 3], dtype=np.intc)
+        draft._last_draft = np.array([4, 5, 6], dtype=np.intc)
+        draft._record_acceptance(np.array([1, 2, 3, 4, 5, 9], dtype=np.intc))
+        draft._last_input_len, draft._last_prefix = 6, np.array([1, 2, 3, 4, 5, 9], dtype=np.intc)
+        draft._last_draft = np.array([7, 8], dtype=np.intc)
+        draft._record_acceptance(np.array([10, 11, 12, 13, 14, 15, 16], dtype=np.intc))  # new completion: not counted
+        if draft.get_stats() != {'draft_calls': 0, 'proposed_tokens': 3, 'accepted_tokens': 2,
+                                 'acceptance_rate': 2 / 3}:
+            print(f"❌ Draft acceptance counting wrong: {draft.get_stats()}")
+            return False
+        
+        class DraftingModel(SlowModel):
+            # Each generated token stands for 2 proposed draft tokens, 1 accepted
+            def __call__(self, prompt, stream=False, **kwargs):
+                for chunk in list(SlowModel.__call__(self, prompt, **kwargs))[:5]:
+                    draft.proposed_tokens += 2
+                    draft.accepted_tokens += 1
+                    yield chunk
+        
+        llm_loader.llm, llm_loader.is_loaded, llm_loader.draft_model = DraftingModel(), True, draft
+        try:
+            # Another request's proposals land while this one waits for the model
+            llm_loader._generate_lock.acquire()
+            waiting = threading.Thread(target=llm_loader.generate_response, args=("hi",))
+            waiting.start()
+            time.sleep(0.1)
+            draft.proposed_tokens += 100
+            llm_loader._generate_lock.release()
+            waiting.join()
+            draft_stats = dict(llm_loader.last_generation_stats)
+        finally:
+            llm_loader.llm, llm_loader.is_loaded, llm_loader.draft_model = None, False, None
+        if (draft_stats.get('draft_proposed_tokens') != 10 or draft_stats.get('draft_accepted_tokens') != 5
+                or draft_stats.get('draft_acceptance_rate') != 0.5):
+            print(f"❌ Per-request draft acceptance wrong: {draft_stats}")
+            return False
+        print(f"✅ Draft acceptance counted per request: {draft_stats['draft_acceptance_rate']:.0%}")
+        
+        # Test session KV state cache: LRU spill under the memory cap and restore from disk
+        from session_state import SessionStateCache
+        
+        def fake_state(n_tokens):
+            return SimpleNamespace(n_tokens=n_tokens, llama_state_size=600 * 1024,
+                                   input_ids=np.zeros(n_tokens, dtype=np.intc), scores=np.zeros(1, dtype=np.single))
+        
+        states = SessionStateCache(max_memory_mb=1, spill_dir=tempfile.mkdtemp())
+        for session, n_tokens in (('a', 10), ('b', 20)):
+            states.update(session, transcript=f"transcript {session}", context="ctx", turns=1)
+            states.store_state(session, fake_state(n_tokens))
+        restored = SessionStateCache(max_memory_mb=1, spill_dir=states.spill_dir)
+        cache_stats = states.get_stats()
+        if (cache_stats['snapshots_in_memory'] != 1 or states.take_state('a').n_tokens != 10
+                or restored.get('a')['transcript'] != "transcript a"
+                or restored.get_stats()['disk_restores'] != 0 or restored.take_state('a').n_tokens != 10):
+            print(f"❌ Session state cache failed: {cache_stats}")
+            return False
+        restored.drop('a')
+        if restored.get('a') is not None or len(os.listdir(states.spill_dir)) != 0:
+            print(f"❌ Dropped session left spill files: {os.listdir(states.spill_dir)}")
+            return False
+        print(f"✅ Session state cache spills LRU states to disk and restores them: {cache_stats['spills']} spilled")
+        
+        # Test the disk budget: least recently used snapshots are deleted, transcripts kept
+        budgeted = SessionStateCache(max_memory_mb=1, spill_dir=tempfile.mkdtemp(), max_disk_mb=1)
+        for session in ('a', 'b', 'c'):
+            state = fake_state(10)
+            state.payload = os.urandom(400 * 1024)
+            budgeted.update(session, transcript=f"transcript {session}")
+            budgeted.persist(session, state)
+        spill_files = sorted(os.listdir(budgeted.spill_dir))
+        spilled_bytes = sum(os.path.getsize(os.path.join(budgeted.spill_dir, f)) for f in spill_files)
+        if (spilled_bytes > 1024 ** 2 or sum(f.endswith('.state.pkl') for f in spill_files) != 2
+                or sum(f.endswith('.meta.pkl') for f in spill_files) != 3):
+            print(f"❌ Session state disk budget failed: {spill_files}")
+            return False
+        print(f"✅ Session state disk budget kept {spilled_bytes / 1024:.0f} KB on disk")
+        
+        # Test a returning session: a new loader restores its transcript and KV state from disk
+        class StatefulModel(SlowModel):
+            def __init__(self):
+                super().__init__(chunks=5)
+                self.loaded_states = []
+            def save_state(self):
+                return fake_state(7)
+            def load_state(self, state):
+                self.loaded_states.append(state.n_tokens)
+        
+        session_dir = tempfile.mkdtemp()
+        session_id = uuid.uuid4().hex
+        first_question, follow_up = "Why do customers churn?", "And how do we retain them?"
+        first_loader = LLMLoader()
+        first_loader.session_states = SessionStateCache(max_memory_mb=1, spill_dir=session_dir)
+        first_loader.llm, first_loader.is_loaded = StatefulModel(), True
+        first_prompt = first_loader.create_business_prompt(first_question, test_context, session_id=session_id,
+                                                           intent='churn_analysis')
+        first_usage = first_loader.last_prompt_usage
+        first_loader.generate_with_deadline(first_prompt, session_id=session_id, intent='churn_analysis')
+        first_loader.unload_model()
+        
+        returning = LLMLoader()
+        returning.session_states = SessionStateCache(max_memory_mb=1, spill_dir=session_dir)
+        returning.llm, returning.is_loaded = StatefulModel(), True
+        history = [{'role': 'user', 'content': first_question}, {'role': 'assistant', 'content': "t0 t1"},
+                   {'role': 'user', 'content': follow_up}]
+        follow_prompt = returning.create_business_prompt(follow_up, test_context, history, session_id=session_id,
+                                                         intent='churn_analysis')
+        follow_usage = returning.last_prompt_usage
+        transcript = returning.session_states.get(session_id)['transcript']
+        returning.generate_with_deadline(follow_prompt, session_id=session_id, intent='churn_analysis')
+        restored_states = returning.llm.loaded_states
+        clipped_prompt = returning.create_business_prompt("Why? " * 3000, test_context, history,
+                                                          session_id=session_id, intent='churn_analysis')
+        clipped_usage = returning.last_prompt_usage
+        churn_profile = returning.config['generation_profiles']['churn_analysis']
+        profile_budget = returning.config['n_ctx'] - churn_profile['max_tokens']
+        returning.llm, returning.is_loaded = None, False
+        if (not follow_usage.get('session_reuse') or not follow_prompt.startswith(transcript)
+                or restored_states != [7] or follow_usage['budget_tokens'] != profile_budget
+                or follow_usage['compact_instructions'] != first_usage['compact_instructions']
+                or not clipped_usage['question_clipped'] or returning.count_tokens(clipped_prompt) > profile_budget):
+            print(f"❌ Returning session not restored from disk: {follow_usage}, {clipped_usage}, {restored_states}")
+            return False
+        print(f"✅ Returning session restored from disk: {follow_usage['new_tokens']} new tokens on turn "
+              f"{follow_usage['session_turn']}, follow-ups budgeted like the first prompt")
+        
+        # Test the model server backend over a Unix socket (served by a loader stand-in)
+        from llm_server import LLMServer
+        
+        class EchoLoader:
+            is_loaded = True
+            model_path = 'echo.gguf'
+            def get_load_status(self):
+                return {'state': 'ready', 'message': 'Model ready'}
+            def _generation_kwargs(self, max_tokens=None, intent=None):
+                return {'max_tokens': max_tokens or 16}
+            def _run_completion(self, prompt, generation_kwargs, deadline=None):
+                return {'choices': [{'text': f"echo: {prompt}"}],
+                        'usage': {'prompt_tokens': 2, 'completion_tokens': 3}}
+        
+        server = LLMServer(EchoLoader(), socket_path=os.path.join(tempfile.mkdtemp(), 'llm.sock'))
+        server.start()
+        try:
+            client_loader = LLMLoader()
+            client_loader.config.update(backend='server', server_url=server.url)
+            answers = [client_loader.generate_response("hello") for _ in range(3)]
+            server_stats = client_loader.get_model_info()['server']
+        finally:
+            client_loader.unload_model()
+            server.shutdown()
+        if answers != ["echo: hello"] * 3 or server_stats['connections_opened'] != 1:
+            print(f"❌ Model server backend failed: {answers}, {server_stats}")
+            return False
+        print(f"✅ Model server backend works: {server_stats['requests']} requests on 1 pooled connection")
+        
         return True
         
     except Exception as e:
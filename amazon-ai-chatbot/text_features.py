@@ -0,0 +1,97 @@
+"""
+Hashed Character N-gram Features
+Dependency-free text features shared by the intent classifier and the context retriever
+"""
+
+import zlib
+import logging
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def hashed_ngrams(text: str, ngram_range: Tuple[int, int], n_features: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Hash the character n-grams of each word into a fixed feature space
+
+    Words are lowercased and padded with a space on both sides, so n-grams
+    never span two words and 'vs' inside a word differs from ' vs '.
+    Feature ids are CRC32 hashes modulo n_features; counts are
+    L2-normalized.
+
+    Args:
+        text: Text to featurize
+        ngram_range: Smallest and largest n-gram length
+        n_features: Size of the hashing space
+
+    Returns:
+        Tuple of (feature ids, weights), ids unique
+    """
+    min_n, max_n = ngram_range
+    counts: Dict[int, int] = {}
+    for word in text.lower().split():
+        padded = f" {word} ".encode('utf-8')
+        for n in range(min_n, min(max_n, len(padded)) + 1):
+            for start in range(len(padded) - n + 1):
+                feature = zlib.crc32(padded[start:start + n]) % n_features
+                counts[feature] = counts.get(feature, 0) + 1
+
+    indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    values = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+    norm = np.sqrt(np.dot(values, values))
+    if norm > 0:
+        values /= norm
+    return indices, values
+
+
+class HashedNgramIndex:
+    """
+    Inverted index of hashed n-gram vectors for cosine similarity search
+
+    Each feature id maps to the documents containing it and their weights,
+    so scoring a query touches only the postings of the query's own
+    n-grams instead of every document.
+    """
+
+    def __init__(self, documents: List[str], ngram_range: Tuple[int, int] = (3, 5), n_features: int = 2 ** 16):
+        """
+        Index documents
+
+        Args:
+            documents: Texts to index
+            ngram_range: Smallest and largest n-gram length
+            n_features: Size of the hashing space
+        """
+        self.ngram_range = ngram_range
+        self.n_features = n_features
+        self.size = len(documents)
+        postings: Dict[int, Tuple[List[int], List[float]]] = {}
+        for doc_id, document in enumerate(documents):
+            for feature, weight in zip(*hashed_ngrams(document, ngram_range, n_features)):
+                doc_ids, weights = postings.setdefault(int(feature), ([], []))
+                doc_ids.append(doc_id)
+                weights.append(float(weight))
+        self._postings = {feature: (np.array(doc_ids, dtype=np.int64), np.array(weights, dtype=np.float32))
+                          for feature, (doc_ids, weights) in postings.items()}
+
+    def scores(self, query: str) -> np.ndarray:
+        """
+        Cosine similarity of the query to every document
+
+        Args:
+            query: Query text
+
+        Returns:
+            Similarity per document, in index order
+        """
+        scores = np.zeros(self.size, dtype=np.float64)
+        for feature, weight in zip(*hashed_ngrams(query, self.ngram_range, self.n_features)):
+            posting = self._postings.get(int(feature))
+            if posting is not None:
+                # A document appears at most once per posting, so plain fancy-index addition is safe
+                scores[posting[0]] += weight * posting[1]
+        return scores